@@ -0,0 +1,162 @@
+import os
+import time
+import struct
+import argparse
+
+import numpy as np
+
+from cache_simulator import (CacheSimulator, iter_row_major_addresses, iter_col_major_addresses,
+                             SIMULATION_CHUNK_SIZE)
+
+## one run of consecutive accesses to the same block: the block number, how many accesses, how many of them
+## were writes, and how many writes came before the first read (what a no-write-allocate cache needs).
+## Counts are 64-bit, a tight loop on one block can run past 2**32 accesses
+BLOCK_RUN_DTYPE = np.dtype([('block', '<u8'), ('count', '<u8'), ('writes', '<u8'), ('leading_writes', '<u8')])
+
+## file header: magic, format version, block size the runs were collapsed at
+RUN_FILE_MAGIC = b'BRUN'
+RUN_FILE_VERSION = 2
+RUN_FILE_HEADER = struct.Struct('<4sII')
+
+## runs per chunk when reading a run file back
+DEFAULT_RUN_CHUNK_SIZE = 1 << 18
+
+def collapse_block_runs(addresses, block_size_bytes, is_write=None):
+    """
+    Collapses consecutive accesses to the same block into runs, fully vectorized.
+
+    Args:
+        addresses: Address array (or anything access_many accepts).
+        block_size_bytes (int): Block size to collapse at, a power of two. The runs replay exactly on any cache
+                                whose block size is at least this.
+        is_write: Optional per-address write flags.
+
+    Returns:
+        numpy.ndarray: BLOCK_RUN_DTYPE records, one per run, in trace order.
+    """
+    if(block_size_bytes <= 0 or block_size_bytes & (block_size_bytes - 1)):
+        raise ValueError("Block size must be a power of two.")
+    if(isinstance(addresses, (bytes, bytearray, memoryview))):
+        addresses = np.frombuffer(addresses, dtype='<u8')
+    addresses = np.asarray(addresses).ravel()
+    if(addresses.dtype.kind == 'i' and addresses.size and addresses.min() < 0):
+        raise ValueError("Address cannot be negative.")
+    blocks = addresses.astype(np.uint64, copy=False) >> np.uint64(block_size_bytes.bit_length() - 1)
+    if(blocks.size == 0):
+        return np.zeros(0, dtype=BLOCK_RUN_DTYPE)
+
+    starts = np.flatnonzero(np.concatenate(([True], blocks[1:] != blocks[:-1])))
+    runs = np.empty(starts.size, dtype=BLOCK_RUN_DTYPE)
+    runs['block'] = blocks[starts]
+    runs['count'] = np.diff(np.append(starts, blocks.size))
+    if(is_write is None):
+        runs['writes'] = 0
+        runs['leading_writes'] = 0
+    else:
+        is_write = np.asarray(is_write, dtype=bool).ravel()
+        if(is_write.size != blocks.size):
+            raise ValueError("is_write must have one entry per address.")
+        runs['writes'] = np.add.reduceat(is_write.astype(np.uint64), starts)
+        ## position of the first read in each run (the run's end if it has none), minus where the run starts
+        positions = np.arange(blocks.size)
+        first_read = np.minimum.reduceat(np.where(is_write, blocks.size, positions), starts)
+        runs['leading_writes'] = np.minimum(first_read, np.append(starts[1:], blocks.size)) - starts
+    return runs
+
+def iter_block_runs(chunks, block_size_bytes):
+    """
+    collapse_block_runs over a stream. chunks yields address arrays or (addresses, is_write) pairs
+    (e.g. trace_reader.iter_trace_records). A run cut by a chunk boundary becomes two runs, which still replays exactly.
+    """
+    for chunk in chunks:
+        addresses, is_write = chunk if isinstance(chunk, tuple) else (chunk, None)
+        yield collapse_block_runs(addresses, block_size_bytes, is_write)
+
+def write_block_runs(path, run_chunks, block_size_bytes):
+    """Writes runs to a compact binary file: a 12-byte header then packed 32-byte records. Returns the number of runs."""
+    written = 0
+    with open(path, 'wb') as f:
+        f.write(RUN_FILE_HEADER.pack(RUN_FILE_MAGIC, RUN_FILE_VERSION, block_size_bytes))
+        for runs in run_chunks:
+            runs = np.asarray(runs, dtype=BLOCK_RUN_DTYPE)
+            f.write(runs.tobytes())
+            written += runs.size
+    return written
+
+def read_block_runs_header(path):
+    """Returns the block size a run file was collapsed at."""
+    with open(path, 'rb') as f:
+        header = f.read(RUN_FILE_HEADER.size)
+    if(len(header) < RUN_FILE_HEADER.size):
+        raise ValueError(f"{path} is too short to be a block run file.")
+    magic, version, block_size = RUN_FILE_HEADER.unpack(header)
+    if(magic != RUN_FILE_MAGIC or version != RUN_FILE_VERSION):
+        raise ValueError(f"{path} is not a version {RUN_FILE_VERSION} block run file.")
+    return block_size
+
+def iter_block_run_file(path, chunk_size=DEFAULT_RUN_CHUNK_SIZE):
+    """Streams the runs of a run file back in chunks of BLOCK_RUN_DTYPE records, memory-mapped."""
+    read_block_runs_header(path)
+    size = os.path.getsize(path) - RUN_FILE_HEADER.size
+    if(size % BLOCK_RUN_DTYPE.itemsize != 0):
+        raise ValueError(f"Block run file {path} ends with a partial record.")
+    if(size == 0):
+        return
+    runs = np.memmap(path, dtype=BLOCK_RUN_DTYPE, mode='r', offset=RUN_FILE_HEADER.size)
+    for start in range(0, runs.size, chunk_size):
+        yield np.array(runs[start:start + chunk_size])
+
+def simulate_block_runs(cache, run_chunks, block_size_bytes):
+    """
+    Replays runs collapsed at block_size_bytes through cache.access_runs. Returns the cache.
+    The cache's blocks must be at least as large, otherwise a run could span several of its blocks.
+    """
+    if(cache.block_size < block_size_bytes):
+        raise ValueError(f"Runs collapsed at {block_size_bytes}-byte blocks can't replay on a {cache.block_size}-byte block cache.")
+    block_shift = np.uint64(block_size_bytes.bit_length() - 1)
+    for runs in run_chunks:
+        cache.access_runs(runs['block'] << block_shift, runs['count'], runs['writes'], runs['leading_writes'])
+    return cache
+
+def main():
+    parser = argparse.ArgumentParser(description="Row/col major traces replayed per access against collapsed block runs.")
+    parser.add_argument('--rows', type=int, default=2048)
+    parser.add_argument('--cols', type=int, default=2048)
+    parser.add_argument('--output', default=None, help="Also save the collapsed row major trace to this run file")
+    args = parser.parse_args()
+
+    start_address = 0x10000000
+    cache_config = (4096, 64, 8)
+    print(f"{args.rows} x {args.cols} arrays, {cache_config[0]}B/{cache_config[1]}B/{cache_config[2]}w")
+    print("{:<10} | {:<5} | {:>11} | {:>9} | {:>9} | {:>9} | {:>8}".format(
+        "Pattern", "Type", "Runs", "Access s", "Runs s", "Speedup", "Miss rate"))
+    print("-" * 80)
+    for name, make_chunks in (('row_major', iter_row_major_addresses), ('col_major', iter_col_major_addresses)):
+        for type_name, data_size in (('char', 1), ('long', 8)):
+            chunks = list(make_chunks(start_address, args.rows, args.cols, data_size, SIMULATION_CHUNK_SIZE))
+
+            start = time.perf_counter()
+            expanded = CacheSimulator(*cache_config)
+            for chunk in chunks:
+                expanded.access_many(chunk)
+            expanded_time = time.perf_counter() - start
+
+            ## collapsing is part of the cost, it is what a fresh trace pays before it can be replayed from runs
+            start = time.perf_counter()
+            run_chunks = list(iter_block_runs(chunks, cache_config[1]))
+            collapsed = simulate_block_runs(CacheSimulator(*cache_config), run_chunks, cache_config[1])
+            runs_time = time.perf_counter() - start
+
+            if((expanded.hits, expanded.misses) != (collapsed.hits, collapsed.misses)):
+                raise AssertionError(f"Run replay mismatch for {name} {type_name}")
+            print("{:<10} | {:<5} | {:>11,} | {:>9.3f} | {:>9.3f} | {:>8.1f}x | {:>8.4f}".format(
+                name, type_name, sum(runs.size for runs in run_chunks), expanded_time, runs_time,
+                expanded_time / runs_time, collapsed.get_miss_rate()))
+
+            if(args.output and name == 'row_major' and type_name == 'char'):
+                written = write_block_runs(args.output, run_chunks, cache_config[1])
+                print(f"  saved {written:,} runs ({os.path.getsize(args.output):,} bytes) to {args.output}, "
+                      f"{args.rows * args.cols * 8:,} bytes as a raw uint64 trace")
+
+if(__name__ == "__main__"):
+    main()
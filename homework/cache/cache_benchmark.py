@@ -0,0 +1,474 @@
+import os
+import time
+import random
+import sys
+import math
+import json
+import platform
+import argparse
+import itertools
+import importlib.util
+import tracemalloc
+import multiprocessing
+
+import numpy as np
+
+from replacement_policies import REPLACEMENT_POLICIES
+from cache_simulator import (CacheSimulator, generate_row_major_addresses,
+                             generate_col_major_addresses, generate_random_addresses,
+                             run_single_simulation, iter_row_major_addresses, iter_col_major_addresses,
+                             generate_random_address_array, SIMULATION_CHUNK_SIZE)
+
+class DictCacheSimulator(CacheSimulator):
+    """
+    The original list-of-lists-of-dicts cache layout with per-line LRU counters.
+    Kept here only as a reference to benchmark and cross-check CacheSimulator against.
+    """
+
+    def _init_storage(self):
+        self.cache = [[{'valid': False, 'tag': 0, 'lru_counter': 0} for _ in range(self.associativity)]
+                      for _ in range(self.num_sets)]
+
+    def access(self, address):
+        tag, set_index = self._get_address_parts(address)
+        target_set = self.cache[set_index]
+
+        hit = False
+
+        for line in target_set:
+            if(line['valid']):
+                line['lru_counter'] += 1
+
+        for line in target_set:
+            if(line['valid'] and line['tag'] == tag):
+                hit = True
+                self.hits += 1
+                line['lru_counter'] = 0
+                break
+
+        if(not hit):
+            self.misses += 1
+            victim_index = -1
+            for i, line in enumerate(target_set):
+                if(not line['valid']):
+                    victim_index = i
+                    break
+
+            if(victim_index == -1):
+                max_lru = -1
+                for i, line in enumerate(target_set):
+                    if(line['lru_counter'] > max_lru):
+                        max_lru = line['lru_counter']
+                        victim_index = i
+
+            victim_line = target_set[victim_index]
+            victim_line['valid'] = True
+            victim_line['tag'] = tag
+            victim_line['lru_counter'] = 0
+
+        return hit
+
+## (cache size, block size, associativity), the L1 the assignment uses plus a large highly associative one
+STORAGE_CONFIGS = [
+    (4096, 64, 8),
+    (256 * 1024, 64, 16),
+    (256 * 1024, 64, 32),
+]
+
+def build_workloads(start_address=0x10000000, num_random=200_000, seed=4200):
+    """Row/col major over a 512x512 long array and a uniform random trace over 16 MB."""
+    random.seed(seed)
+    return {
+        'row_major': generate_row_major_addresses(start_address, 512, 512, 8),
+        'col_major': generate_col_major_addresses(start_address, 512, 512, 8),
+        'random': generate_random_addresses(start_address, 16 * 1024 * 1024, num_random, 8),
+    }
+
+def time_simulator(cache_class, config, addresses):
+    """Replays addresses through a fresh cache, returns (seconds, hit/miss list, miss rate)."""
+    cache = cache_class(*config)
+    access = cache.access
+    start = time.perf_counter()
+    outcomes = [access(addr) for addr in addresses]
+    elapsed = time.perf_counter() - start
+    return elapsed, outcomes, cache.get_miss_rate()
+
+def storage_bytes(cache):
+    """Deep size in bytes of a cache's line storage, measure it after a workload so every set is populated."""
+    if(isinstance(cache, DictCacheSimulator)):
+        total = sys.getsizeof(cache.cache)
+        for cache_set in cache.cache:
+            total += sys.getsizeof(cache_set)
+            total += sum(sys.getsizeof(line) for line in cache_set)
+        return total
+    total = sys.getsizeof(cache.tags) + sys.getsizeof(cache.valid) + sys.getsizeof(cache.set_lines)
+    total += sum(sys.getsizeof(lines) for lines in cache.set_lines)
+    ## LRU recency order lives in the policy
+    return total + sum(sys.getsizeof(order) for order in cache.policy.order)
+
+def benchmark_storage():
+    workloads = build_workloads()
+
+    print("{:<18} | {:<10} | {:>12} | {:>12} | {:>8} | {:>8}".format(
+        "Config", "Pattern", "dict acc/s", "array acc/s", "Speedup", "Miss rate"))
+    print("-" * 82)
+
+    for config in STORAGE_CONFIGS:
+        label = f"{config[0] // 1024}K/{config[1]}B/{config[2]}w"
+        for pattern, addresses in workloads.items():
+            dict_time, dict_outcomes, _ = time_simulator(DictCacheSimulator, config, addresses)
+            array_time, array_outcomes, miss_rate = time_simulator(CacheSimulator, config, addresses)
+            if(dict_outcomes != array_outcomes):
+                raise AssertionError(f"Hit/miss mismatch between layouts for {label} {pattern}")
+            print("{:<18} | {:<10} | {:>12,.0f} | {:>12,.0f} | {:>7.2f}x | {:>8.4f}".format(
+                label, pattern, len(addresses) / dict_time, len(addresses) / array_time,
+                dict_time / array_time, miss_rate))
+
+    ## the flat arrays replace the per-line dicts, but per-set lookup dicts and LRU order remain, so this
+    ## is a speed change first, expect only a modest storage saving
+    print()
+    print("{:<18} | {:>14} | {:>14} | {:>7}".format("Config", "dict bytes", "array bytes", "Saving"))
+    print("-" * 62)
+    for config in STORAGE_CONFIGS:
+        label = f"{config[0] // 1024}K/{config[1]}B/{config[2]}w"
+        sizes = []
+        for cache_class in (DictCacheSimulator, CacheSimulator):
+            cache = cache_class(*config)
+            for addr in workloads['random']:
+                cache.access(addr)
+            sizes.append(storage_bytes(cache))
+        print("{:<18} | {:>14,} | {:>14,} | {:>6.1%}".format(label, sizes[0], sizes[1], 1 - sizes[1] / sizes[0]))
+
+def benchmark_batch():
+    """Per-address access() against one access_many() call over the same trace."""
+    workloads = build_workloads()
+
+    print("{:<18} | {:<10} | {:>14} | {:>14} | {:>8}".format(
+        "Config", "Pattern", "access acc/s", "batch acc/s", "Speedup"))
+    print("-" * 76)
+
+    for config in STORAGE_CONFIGS:
+        label = f"{config[0] // 1024}K/{config[1]}B/{config[2]}w"
+        for pattern, addresses in workloads.items():
+            scalar_time, scalar_outcomes, _ = time_simulator(CacheSimulator, config, addresses)
+
+            address_array = np.array(addresses, dtype=np.uint64)
+            cache = CacheSimulator(*config)
+            start = time.perf_counter()
+            hit_mask, _, _ = cache.access_many(address_array)
+            batch_time = time.perf_counter() - start
+            if(hit_mask.tolist() != scalar_outcomes):
+                raise AssertionError(f"Hit/miss mismatch between access and access_many for {label} {pattern}")
+
+            print("{:<18} | {:<10} | {:>14,.0f} | {:>14,.0f} | {:>7.2f}x".format(
+                label, pattern, len(addresses) / scalar_time, len(addresses) / batch_time,
+                scalar_time / batch_time))
+
+def benchmark_policies(config=(32 * 1024, 64, 8)):
+    """Accesses/second and miss rate of every replacement policy through access_many on the row/col/random workloads."""
+    workloads = {pattern: np.array(addresses, dtype=np.uint64) for pattern, addresses in build_workloads().items()}
+    label = f"{config[0] // 1024}K/{config[1]}B/{config[2]}w"
+
+    print(f"Replacement policies, {label}")
+    print("{:<8} | {:<10} | {:>12} | {:>9}".format("Policy", "Pattern", "acc/s", "Miss rate"))
+    print("-" * 48)
+    for policy in REPLACEMENT_POLICIES:
+        for pattern, addresses in workloads.items():
+            cache = CacheSimulator(*config, replacement_policy=policy, policy_seed=4200)
+            start = time.perf_counter()
+            cache.access_many(addresses)
+            elapsed = time.perf_counter() - start
+            print("{:<8} | {:<10} | {:>12,.0f} | {:>9.4f}".format(
+                policy, pattern, addresses.size / elapsed, cache.get_miss_rate()))
+
+def legacy_address_parts(cache, address):
+    """_get_address_parts as it was before the decode constants were precomputed, kept to benchmark against."""
+    if address < 0:
+         raise ValueError("Address cannot be negative.")
+    address_no_offset = address >> cache.num_offset_bits
+    index_mask = (1 << cache.num_index_bits) - 1 if cache.num_index_bits > 0 else 0
+    set_index = address_no_offset & index_mask
+    tag = address_no_offset >> cache.num_index_bits
+    max_tag = (1 << cache.num_tag_bits) -1
+    if(tag > max_tag):
+         tag = tag & max_tag
+    return tag, set_index
+
+def benchmark_decode(num_addresses=1 << 20, config=(32 * 1024, 64, 8), address_size_bits=48):
+    """Address decode cost in ms per million addresses: per-call legacy vs precomputed masks vs decompose_addresses."""
+    cache = CacheSimulator(*config, address_size_bits)
+    ## full 64-bit addresses so the tag mask actually has work to do
+    address_array = np.random.default_rng(4200).integers(0, 1 << 63, size=num_addresses, dtype=np.uint64)
+    addresses = address_array.tolist()
+    scale = 1e9 / num_addresses
+
+    start = time.perf_counter()
+    legacy = [legacy_address_parts(cache, address) for address in addresses]
+    legacy_ms = (time.perf_counter() - start) * scale
+
+    get_parts = cache._get_address_parts
+    start = time.perf_counter()
+    scalar = [get_parts(address) for address in addresses]
+    scalar_ms = (time.perf_counter() - start) * scale
+
+    start = time.perf_counter()
+    tags, set_indices = cache.decompose_addresses(address_array)
+    vector_ms = (time.perf_counter() - start) * scale
+    start = time.perf_counter()
+    tag_list, set_list = tags.tolist(), set_indices.tolist()
+    tolist_ms = (time.perf_counter() - start) * scale
+
+    if(legacy != scalar or scalar != list(zip(tag_list, set_list))):
+        raise AssertionError("Address decode paths disagree")
+
+    label = f"{config[0] // 1024}K/{config[1]}B/{config[2]}w, {address_size_bits}-bit addresses"
+    print(f"Address decode, {label} (ms per million addresses)")
+    print("{:<36} | {:>10}".format("Path", "ms/M"))
+    print("-" * 49)
+    for name, cost in (("_get_address_parts, legacy", legacy_ms), ("_get_address_parts, precomputed", scalar_ms),
+                       ("decompose_addresses", vector_ms), ("decompose_addresses + tolist", vector_ms + tolist_ms)):
+        print("{:<36} | {:>10.1f}".format(name, cost))
+
+def run_list_simulation(run_args, cache_config):
+    """run_single_simulation as it was before the lazy generators: build the full address list, then replay it."""
+    access_type, start_addr, rows, cols, data_size, rand_range, num_rand_acc = run_args
+    cache = CacheSimulator(**cache_config)
+    if(access_type == 'row_major'):
+        addresses = generate_row_major_addresses(start_addr, rows, cols, data_size)
+    elif(access_type == 'col_major'):
+        addresses = generate_col_major_addresses(start_addr, rows, cols, data_size)
+    else:
+        addresses = generate_random_addresses(start_addr, rand_range, num_rand_acc, data_size)
+    for addr in addresses:
+        cache.access(addr)
+    return cache.get_miss_rate()
+
+def _own_peak_rss():
+    ## VmHWM is this process's own high-water mark. ru_maxrss is no good on Linux, it carries over from the
+    ## parent through fork+exec, so a child of a grown benchmark process would report the parent's peak
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if(line.startswith('VmHWM:')):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    ## imported here, resource is POSIX only and the rest of the benchmark runs without it.
+    ## ru_maxrss is bytes on macOS
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+def _peak_rss_worker(simulate, run_args, cache_config, queue):
+    simulate(run_args, cache_config)
+    queue.put(_own_peak_rss())
+
+def peak_rss_bytes(simulate, run_args, cache_config):
+    """Runs one simulation in a fresh spawned process and returns that process's peak RSS."""
+    ctx = multiprocessing.get_context('spawn')
+    queue = ctx.Queue()
+    process = ctx.Process(target=_peak_rss_worker, args=(simulate, run_args, cache_config, queue))
+    process.start()
+    peak = queue.get()
+    process.join()
+    return peak
+
+def benchmark_memory(l2_l3_size_bytes=16 * 1024 * 1024, start_address=0x10000000):
+    """Peak RSS of one run of the `long` data type case, list-built traces against the lazy generators."""
+    data_size = 8
+    total_elements = l2_l3_size_bytes // data_size
+    rows = int(math.sqrt(total_elements))
+    while(total_elements % rows != 0):
+        rows -= 1
+    cols = total_elements // rows
+    cache_config = {'cache_size_bytes': 4096, 'block_size_bytes': 64, 'associativity': 8, 'address_size_bits': 64}
+    if(not os.path.exists('/proc/self/status') and importlib.util.find_spec('resource') is None):
+        print("Peak RSS needs /proc or the resource module (POSIX only), skipping the memory benchmark.")
+        return
+
+    print(f"long: {rows} x {cols} ({total_elements:,} accesses per run)")
+    print("{:<10} | {:>14} | {:>14}".format("Pattern", "list peak MB", "lazy peak MB"))
+    print("-" * 44)
+    for access_type in ('row_major', 'col_major', 'random'):
+        if(access_type == 'random'):
+            run_args = (access_type, start_address + l2_l3_size_bytes // 2, rows, cols, data_size,
+                        l2_l3_size_bytes, total_elements)
+        else:
+            run_args = (access_type, start_address, rows, cols, data_size, 0, 0)
+        before = peak_rss_bytes(run_list_simulation, run_args, cache_config)
+        after = peak_rss_bytes(run_single_simulation, run_args, cache_config)
+        print("{:<10} | {:>14.1f} | {:>14.1f}".format(access_type, before / 2**20, after / 2**20))
+        ## the lists hold every address as a Python int, the lazy path never does, equal peaks mean the
+        ## measurement picked up something other than the simulation
+        if(after >= before):
+            raise AssertionError(f"Peak RSS of the lazy {access_type} run ({after:,} B) isn't below the list run ({before:,} B)")
+
+## default matrix for --matrix, every combination that forms a valid cache is run
+MATRIX_CACHE_SIZES = [4096, 256 * 1024]
+MATRIX_BLOCK_SIZES = [64]
+MATRIX_ASSOCIATIVITIES = [1, 8]
+MATRIX_POLICIES = ['LRU', 'SRRIP']
+MATRIX_PATTERNS = ['row_major', 'col_major', 'random']
+MATRIX_TRACE_LENGTHS = [1 << 18]
+
+## a run counts as a regression when its accesses/second falls more than this fraction below the baseline
+DEFAULT_REGRESSION_THRESHOLD = 0.10
+
+def matrix_trace_chunks(pattern, length, start_address=0x10000000, data_size=8, seed=4200):
+    """The benchmark trace as a list of chunks, generated up front so only the simulator is timed."""
+    rows = 1 << (length.bit_length() // 2)
+    cols = max(1, length // rows)
+    if(pattern == 'row_major'):
+        return list(iter_row_major_addresses(start_address, rows, cols, data_size, SIMULATION_CHUNK_SIZE))
+    if(pattern == 'col_major'):
+        return list(iter_col_major_addresses(start_address, rows, cols, data_size, SIMULATION_CHUNK_SIZE))
+    addresses = generate_random_address_array(start_address, 16 * 1024 * 1024, length, data_size, rng=seed)
+    return [addresses[first:first + SIMULATION_CHUNK_SIZE] for first in range(0, addresses.size, SIMULATION_CHUNK_SIZE)]
+
+def measure_run(cache_config, chunks, repeat=3):
+    """
+    Best-of-repeat accesses/second and time to the first chunk's result (cache construction included),
+    then one extra run under tracemalloc for the peak Python heap, kept separate so tracing doesn't skew the timings.
+    """
+    accesses = sum(chunk.size for chunk in chunks)
+    best_time = float('inf')
+    best_first = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        cache = CacheSimulator(**cache_config)
+        first_result = None
+        for chunk in chunks:
+            cache.access_many(chunk)
+            if(first_result is None):
+                first_result = time.perf_counter() - start
+        best_time = min(best_time, time.perf_counter() - start)
+        best_first = min(best_first, first_result or 0.0)
+
+    tracemalloc.start()
+    cache = CacheSimulator(**cache_config)
+    for chunk in chunks:
+        cache.access_many(chunk)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        'accesses': accesses,
+        'accesses_per_second': accesses / best_time,
+        'time_to_first_result_s': best_first,
+        'peak_memory_bytes': peak,
+        'miss_rate': cache.get_miss_rate(),
+    }
+
+def matrix_key(entry):
+    return (entry['cache_size'], entry['block_size'], entry['associativity'], entry['policy'],
+            entry['pattern'], entry['trace_length'])
+
+def benchmark_matrix(cache_sizes=MATRIX_CACHE_SIZES, block_sizes=MATRIX_BLOCK_SIZES,
+                     associativities=MATRIX_ASSOCIATIVITIES, policies=MATRIX_POLICIES,
+                     patterns=MATRIX_PATTERNS, trace_lengths=MATRIX_TRACE_LENGTHS, repeat=3):
+    """
+    Runs every (cache size, block size, associativity, policy, pattern, trace length) combination
+    through access_many and returns a JSON-ready report: machine info plus one entry per run.
+    """
+    traces = {(pattern, length): matrix_trace_chunks(pattern, length) for pattern in patterns for length in trace_lengths}
+    results = []
+    print("{:<22} | {:<6} | {:<10} | {:>9} | {:>12} | {:>9} | {:>9} | {:>9}".format(
+        "Config", "Policy", "Pattern", "Length", "acc/s", "First ms", "Peak KB", "Miss rate"))
+    print("-" * 104)
+    for cache_size, block_size, associativity, policy, pattern, length in itertools.product(
+            cache_sizes, block_sizes, associativities, policies, patterns, trace_lengths):
+        num_blocks = cache_size // block_size
+        if(num_blocks < associativity or num_blocks % associativity != 0):
+            continue
+        ## CacheSimulator can only index a power of two of sets
+        num_sets = num_blocks // associativity
+        if(num_sets & (num_sets - 1)):
+            continue
+        if(policy == 'PLRU' and associativity & (associativity - 1)):
+            continue
+        cache_config = {'cache_size_bytes': cache_size, 'block_size_bytes': block_size, 'associativity': associativity,
+                        'replacement_policy': policy, 'policy_seed': 4200}
+        entry = {'cache_size': cache_size, 'block_size': block_size, 'associativity': associativity,
+                 'policy': policy, 'pattern': pattern, 'trace_length': length}
+        entry.update(measure_run(cache_config, traces[(pattern, length)], repeat))
+        results.append(entry)
+        print("{:<22} | {:<6} | {:<10} | {:>9,} | {:>12,.0f} | {:>9.2f} | {:>9,.0f} | {:>9.4f}".format(
+            f"{cache_size // 1024}K/{block_size}B/{associativity}w", policy, pattern, length,
+            entry['accesses_per_second'], entry['time_to_first_result_s'] * 1000,
+            entry['peak_memory_bytes'] / 1024, entry['miss_rate']))
+
+    return {
+        'machine': {'python': platform.python_version(), 'numpy': np.__version__, 'platform': platform.platform(),
+                    'processor': platform.processor() or platform.machine()},
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'chunk_size': SIMULATION_CHUNK_SIZE,
+        'results': results,
+    }
+
+def compare_to_baseline(report, baseline, threshold=DEFAULT_REGRESSION_THRESHOLD):
+    """
+    Matches runs by configuration and returns the regressions, (entry, baseline entry, relative change) tuples
+    for every run whose accesses/second dropped by more than threshold. Runs missing from either side are ignored.
+    """
+    baseline_runs = {matrix_key(entry): entry for entry in baseline['results']}
+    regressions = []
+    for entry in report['results']:
+        previous = baseline_runs.get(matrix_key(entry))
+        if(previous is None):
+            continue
+        change = entry['accesses_per_second'] / previous['accesses_per_second'] - 1
+        if(change < -threshold):
+            regressions.append((entry, previous, change))
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="CacheSimulator benchmarks.")
+    parser.add_argument('--matrix', action='store_true',
+                        help="Run the configuration matrix instead of the layout/batch/policy/memory comparisons")
+    parser.add_argument('--cache-sizes', type=int, nargs='+', default=MATRIX_CACHE_SIZES)
+    parser.add_argument('--block-sizes', type=int, nargs='+', default=MATRIX_BLOCK_SIZES)
+    parser.add_argument('--associativities', type=int, nargs='+', default=MATRIX_ASSOCIATIVITIES)
+    parser.add_argument('--policies', nargs='+', default=MATRIX_POLICIES, choices=list(REPLACEMENT_POLICIES))
+    parser.add_argument('--patterns', nargs='+', default=MATRIX_PATTERNS, choices=MATRIX_PATTERNS)
+    parser.add_argument('--trace-lengths', type=int, nargs='+', default=MATRIX_TRACE_LENGTHS)
+    parser.add_argument('--repeat', type=int, default=3, help="Timed runs per configuration, the best one is kept")
+    parser.add_argument('--output', default=None, help="Write the matrix results to this JSON file")
+    parser.add_argument('--baseline', default=None, help="JSON results of an earlier --matrix run to compare against")
+    parser.add_argument('--threshold', type=float, default=DEFAULT_REGRESSION_THRESHOLD,
+                        help="Allowed accesses/second drop versus the baseline, as a fraction")
+    args = parser.parse_args()
+
+    if(not args.matrix):
+        benchmark_storage()
+        print()
+        benchmark_batch()
+        print()
+        benchmark_policies()
+        print()
+        benchmark_decode()
+        print()
+        benchmark_memory()
+        return
+
+    report = benchmark_matrix(args.cache_sizes, args.block_sizes, args.associativities, args.policies,
+                              args.patterns, args.trace_lengths, args.repeat)
+    if(args.output):
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"\nWrote {len(report['results'])} results to {args.output}")
+
+    if(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare_to_baseline(report, baseline, args.threshold)
+        print(f"\n{len(regressions)} of {len(report['results'])} runs regressed by more than {args.threshold:.0%} "
+              f"versus {args.baseline}")
+        for entry, previous, change in regressions:
+            print("  {}K/{}B/{}w {} {} {:,}: {:,.0f} -> {:,.0f} acc/s ({:+.1%})".format(
+                entry['cache_size'] // 1024, entry['block_size'], entry['associativity'], entry['policy'],
+                entry['pattern'], entry['trace_length'], previous['accesses_per_second'],
+                entry['accesses_per_second'], change))
+        if(regressions):
+            sys.exit(1)
+
+if(__name__ == "__main__"):
+    main()
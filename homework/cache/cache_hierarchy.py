@@ -0,0 +1,228 @@
+import time
+
+import numpy as np
+
+from cache_simulator import (CacheSimulator, get_system_cache_info, system_cache_configs, iter_row_major_addresses,
+                             iter_col_major_addresses, iter_random_addresses, SIMULATION_CHUNK_SIZE)
+
+INCLUSION_POLICIES = ['inclusive', 'exclusive', 'NINE']
+
+class CacheHierarchy:
+    """
+    Chains CacheSimulator levels (L1 first) and forwards misses downward.
+
+    Inclusion policies:
+        'NINE'      - non-inclusive non-exclusive, every level fills on a miss and evicts independently.
+        'inclusive' - like NINE, but a block evicted from a level is back-invalidated from every level above it.
+        'exclusive' - a block lives in at most one level, lower levels are only filled with victims from above
+                      and a hit below moves the block up to L1.
+
+    Every level must use the same block size.
+    """
+
+    def __init__(self, levels, inclusion_policy='NINE', hit_latencies=None, memory_latency=200):
+        if(not levels):
+            raise ValueError("A cache hierarchy needs at least one level.")
+        if(inclusion_policy not in INCLUSION_POLICIES):
+            raise ValueError(f"Unsupported inclusion policy: {inclusion_policy}")
+        if(len({level.block_size for level in levels}) != 1):
+            raise ValueError("All cache levels must use the same block size.")
+        if(hit_latencies is None):
+            hit_latencies = [4, 12, 40][:len(levels)] + [40] * max(0, len(levels) - 3)
+        if(len(hit_latencies) != len(levels)):
+            raise ValueError("Need one hit latency per cache level.")
+
+        self.levels = levels
+        self.inclusion_policy = inclusion_policy
+        self.hit_latencies = list(hit_latencies)
+        self.memory_latency = memory_latency
+        ## served_counts[i] is how many accesses were satisfied by level i, the last slot is memory
+        self.served_counts = [0] * (len(levels) + 1)
+
+        if(inclusion_policy == 'inclusive'):
+            self._access = self._access_inclusive
+        elif(inclusion_policy == 'exclusive'):
+            self._access = self._access_exclusive
+        else:
+            self._access = self._access_nine
+
+    @classmethod
+    def from_configs(cls, configs, inclusion_policy='NINE', hit_latencies=None, memory_latency=200, address_size_bits=64):
+        """Builds a hierarchy from (cache_size_bytes, block_size_bytes, associativity) tuples, L1 first."""
+        levels = [CacheSimulator(size, block, assoc, address_size_bits) for size, block, assoc in configs]
+        return cls(levels, inclusion_policy, hit_latencies, memory_latency)
+
+    @classmethod
+    def from_system(cls, inclusion_policy='NINE', hit_latencies=None, memory_latency=200, max_levels=None, **cache_kwargs):
+        """
+        A hierarchy shaped like this machine's data/unified caches (see system_cache_configs), L1 first.
+        Extra keyword arguments (replacement_policy, write_policy, ...) go to every level.
+        """
+        configs = system_cache_configs()[:max_levels]
+        if(not configs):
+            raise ValueError("No data cache levels were detected on this machine.")
+        levels = [CacheSimulator(config['cache_size_bytes'], config['block_size_bytes'], config['associativity'],
+                                 **cache_kwargs) for config in configs]
+        return cls(levels, inclusion_policy, hit_latencies, memory_latency)
+
+    def _access_nine(self, address):
+        for i, level in enumerate(self.levels):
+            if(level.access(address)):
+                return i
+        return len(self.levels)
+
+    def _access_inclusive(self, address):
+        served = len(self.levels)
+        for i, level in enumerate(self.levels):
+            hit, evicted = level.access_with_eviction(address)
+            if(evicted is not None):
+                ## keep inclusion: nothing above may hold a block this level no longer has
+                for upper in self.levels[:i]:
+                    upper.invalidate(evicted)
+            if(hit):
+                served = i
+                break
+        return served
+
+    def _access_exclusive(self, address):
+        levels = self.levels
+        hit, victim = levels[0].access_with_eviction(address)
+        if(hit):
+            return 0
+
+        served = len(levels)
+        for i in range(1, len(levels)):
+            if(levels[i].lookup(address)):
+                ## the block moved up into L1, so it leaves this level
+                levels[i].invalidate(address)
+                served = i
+                break
+
+        ## victims cascade down one level at a time, whatever falls out of the last level goes to memory
+        for lower in levels[1:]:
+            if(victim is None):
+                break
+            victim = lower.insert(victim)
+        return served
+
+    def access(self, address):
+        """Runs one read through the hierarchy. Returns the index of the level that served it, len(levels) for memory."""
+        served = self._access(address)
+        self.served_counts[served] += 1
+        return served
+
+    def access_many(self, addresses):
+        """
+        Runs a batch of reads through every level in one pass.
+        Returns an int8 array with the serving level of each address (len(levels) for memory).
+        """
+        addresses = np.asarray(addresses)
+        served = np.full(addresses.size, len(self.levels), dtype=np.int8)
+        if(addresses.size == 0):
+            return served
+
+        if(self.inclusion_policy == 'NINE'):
+            ## with no back-invalidation each level only ever sees the ordered miss stream of the level above,
+            ## so whole batches can be handed down level by level
+            remaining = np.arange(addresses.size)
+            pending = addresses.ravel()
+            for i, level in enumerate(self.levels):
+                hit_mask, _, _ = level.access_many(pending)
+                served[remaining[hit_mask]] = i
+                remaining = remaining[~hit_mask]
+                pending = pending[~hit_mask]
+                if(pending.size == 0):
+                    break
+        else:
+            access = self._access
+            for i, address in enumerate(addresses.ravel().tolist()):
+                served[i] = access(address)
+
+        counts = np.bincount(served, minlength=len(self.levels) + 1)
+        for i, count in enumerate(counts.tolist()):
+            self.served_counts[i] += count
+        return served
+
+    def run(self, address_chunks):
+        """Streams an iterable of address chunks through the hierarchy. Returns self for chaining."""
+        for chunk in address_chunks:
+            self.access_many(chunk)
+        return self
+
+    def level_stats(self):
+        """Per-level accesses, hits, misses, local hit rate (hits / accesses reaching the level) and global hit rate."""
+        total = sum(self.served_counts)
+        stats = []
+        for i, level in enumerate(self.levels):
+            accesses = level.hits + level.misses
+            stats.append({
+                'level': f"L{i + 1}",
+                'accesses': accesses,
+                'hits': level.hits,
+                'misses': level.misses,
+                'local_hit_rate': level.hits / accesses if accesses else 0.0,
+                'global_hit_rate': self.served_counts[i] / total if total else 0.0,
+            })
+        return stats
+
+    def amat(self):
+        """Average memory access time in cycles, each access pays the hit latency of every level it reached."""
+        total = sum(self.served_counts)
+        if(total == 0):
+            return 0.0
+        latencies = self.hit_latencies + [self.memory_latency]
+        cycles = 0
+        for served, count in enumerate(self.served_counts):
+            cycles += count * sum(latencies[:served + 1])
+        return cycles / total
+
+    def reset(self):
+        for level in self.levels:
+            level.reset()
+        self.served_counts = [0] * (len(self.levels) + 1)
+
+def main():
+    system_info = get_system_cache_info()
+    l2_l3_size = system_info["l2_l3_size_bytes"]
+    detected = system_cache_configs()
+    if(detected and len({config['block_size_bytes'] for config in detected}) == 1):
+        ## this machine's own L1/L2/L3 shapes
+        configs = [(config['cache_size_bytes'], config['block_size_bytes'], config['associativity']) for config in detected]
+        for config in detected:
+            if(config['approximate']):
+                print(f"Warning: L{config['level']} is {config['detected_size_bytes']:,}B with a set count that isn't a power "
+                      f"of two, simulated as {config['cache_size_bytes']:,}B")
+        l2_l3_size = configs[-1][0]
+    else:
+        configs = [(4096, 64, 8), (256 * 1024, 64, 8), (l2_l3_size, 64, 16)]
+    start_address = 0x10000000
+    data_size = 8
+    total_elements = l2_l3_size // data_size
+    rows = 1 << (total_elements.bit_length() // 2)
+    cols = total_elements // rows
+
+    workloads = {
+        'row_major': lambda: iter_row_major_addresses(start_address, rows, cols, data_size, SIMULATION_CHUNK_SIZE),
+        'col_major': lambda: iter_col_major_addresses(start_address, rows, cols, data_size, SIMULATION_CHUNK_SIZE),
+        'random': lambda: iter_random_addresses(start_address + l2_l3_size // 2, l2_l3_size, rows * cols, data_size,
+                                                SIMULATION_CHUNK_SIZE, rng=np.random.default_rng(4200)),
+    }
+
+    print(f"Levels: " + ", ".join(f"L{i + 1} {size:,}B/{block}B/{assoc}w" for i, (size, block, assoc) in enumerate(configs)))
+    ## one hit rate column per level, however many were detected
+    level_columns = " | {:>8}" * len(configs)
+    header_format = "{:<10} | {:<9}" + level_columns + " | {:>8} | {:>7}"
+    row_format = "{:<10} | {:<9}" + level_columns.replace("}", ".4f}") + " | {:>8.2f} | {:>7.2f}"
+    print(header_format.format("Pattern", "Policy", *(f"L{i + 1} hit" for i in range(len(configs))), "AMAT", "Time s"))
+    print("-" * (43 + 11 * len(configs)))
+    for name, make_chunks in workloads.items():
+        for policy in INCLUSION_POLICIES:
+            hierarchy = CacheHierarchy.from_configs(configs, policy)
+            start = time.perf_counter()
+            hierarchy.run(make_chunks())
+            elapsed = time.perf_counter() - start
+            rates = [stat['local_hit_rate'] for stat in hierarchy.level_stats()]
+            print(row_format.format(name, policy, *rates, hierarchy.amat(), elapsed))
+
+if(__name__ == "__main__"):
+    main()
@@ -0,0 +1,222 @@
+from collections import OrderedDict, namedtuple
+from itertools import repeat
+
+import numpy as np
+
+from cache_simulator import CacheSimulator, generate_random_address_array, iter_run_accesses, SIMULATION_CHUNK_SIZE
+
+MISS_CLASSES = ['compulsory', 'capacity', 'conflict']
+
+## one sampled access as handed to the event callback, miss_class is None for hits (and when 3C tracking is off)
+AccessEvent = namedtuple('AccessEvent', ['index', 'address', 'set_index', 'hit', 'is_write', 'miss_class'])
+
+## miss class codes used in the per-batch arrays, 0 means hit
+_HIT, _COMPULSORY, _CAPACITY, _CONFLICT = range(4)
+
+class InstrumentedCacheSimulator(CacheSimulator):
+    """
+    CacheSimulator with per-set statistics, the 3C miss breakdown and sampled access events.
+
+    The instrumentation lives entirely in this subclass, a plain CacheSimulator runs exactly the code it always did,
+    so sweeps that don't ask for it pay nothing. access() and access_many() are instrumented, access_runs() expands
+    its runs back into accesses and goes through access_many(), the hierarchy helpers (access_with_eviction, lookup,
+    insert) are not instrumented, though evictions they cause still reach set_evictions. Evictions are counted where
+    the policy picks a victim, so prefetch fills count too.
+
+    Per-set arrays (NumPy int64, one slot per set): set_hits, set_misses, set_evictions and set_conflict_misses.
+    3C (Hill): a miss is compulsory on the first demand touch of a block, conflict if a fully-associative LRU cache
+    with the same number of blocks (the shadow) would have hit, capacity otherwise. A first touch that hits
+    (the block was prefetched) is a hit, not a compulsory miss.
+
+    Args:
+        *args, **kwargs: CacheSimulator arguments.
+        track_3c (bool): Keep the shadow cache and classify misses, the costly part of the instrumentation.
+        event_callback (callable): Optional event_callback(AccessEvent), called for every sample_every-th access.
+        sample_every (int): Sampling interval for event_callback, 1 reports every access.
+    """
+
+    def __init__(self, *args, track_3c=True, event_callback=None, sample_every=1000, **kwargs):
+        if(sample_every <= 0):
+            raise ValueError("Sampling interval must be positive.")
+        self.track_3c = track_3c
+        self.event_callback = event_callback
+        self.sample_every = sample_every
+        super().__init__(*args, **kwargs)
+
+    def _init_storage(self):
+        super()._init_storage()
+        ## every path that evicts (demand fills, prefetch fills, run replay) asks the policy for a victim, so
+        ## counting there catches evictions whichever path caused them
+        replace = self._replace
+
+        def counting_replace(set_index):
+            self.set_evictions[set_index] += 1
+            return replace(set_index)
+        self._replace = counting_replace
+        ## fully-associative LRU of block numbers with as many blocks as the real cache, plus every block ever seen
+        self.shadow = OrderedDict()
+        self.seen_blocks = set()
+
+    def reset_stats(self):
+        super().reset_stats()
+        self.set_hits = np.zeros(self.num_sets, dtype=np.int64)
+        self.set_misses = np.zeros(self.num_sets, dtype=np.int64)
+        self.set_evictions = np.zeros(self.num_sets, dtype=np.int64)
+        self.set_conflict_misses = np.zeros(self.num_sets, dtype=np.int64)
+        self.miss_counts = dict.fromkeys(MISS_CLASSES, 0)
+        self.access_count = 0
+
+    def _classify(self, block, hit, fills):
+        ## runs the shadow cache for one access and returns its miss class code
+        shadow = self.shadow
+        if(block in shadow):
+            shadow.move_to_end(block)
+            shadow_hit = True
+        else:
+            shadow_hit = False
+            if(fills):
+                shadow[block] = None
+                if(len(shadow) > self.num_blocks):
+                    shadow.popitem(last=False)
+        ## seen_blocks holds demand-touched blocks, not resident ones: a prefetched block's first demand access
+        ## is a hit, and only a first touch that misses is compulsory
+        first_touch = block not in self.seen_blocks
+        if(first_touch):
+            self.seen_blocks.add(block)
+        if(hit):
+            return _HIT
+        if(first_touch):
+            return _COMPULSORY
+        return _CONFLICT if shadow_hit else _CAPACITY
+
+    def access(self, address, is_write=False):
+        tag, set_index = self._get_address_parts(address)
+        hit = super().access(address, is_write)
+        fills = not hit and (self.write_allocate or not is_write)
+
+        if(hit):
+            self.set_hits[set_index] += 1
+        else:
+            self.set_misses[set_index] += 1
+
+        miss_class = None
+        if(self.track_3c):
+            code = self._classify((tag << self.num_index_bits) | set_index, hit, fills)
+            if(code != _HIT):
+                miss_class = MISS_CLASSES[code - 1]
+                self.miss_counts[miss_class] += 1
+                if(code == _CONFLICT):
+                    self.set_conflict_misses[set_index] += 1
+
+        if(self.event_callback is not None and self.access_count % self.sample_every == 0):
+            self.event_callback(AccessEvent(self.access_count, address, set_index, hit, is_write, miss_class))
+        self.access_count += 1
+        return hit
+
+    def access_many(self, addresses, is_write=None):
+        hit_mask, batch_hits, batch_misses = super().access_many(addresses, is_write)
+        if(hit_mask.size == 0):
+            return hit_mask, batch_hits, batch_misses
+
+        if(isinstance(addresses, (bytes, bytearray, memoryview))):
+            addresses = np.frombuffer(addresses, dtype='<u8')
+        addresses = np.asarray(addresses).ravel()
+        tags, set_array = self.decompose_addresses(addresses)
+        set_indices = set_array.astype(np.int64)
+        ## block numbers as the cache sees them, bits above the tag width dropped
+        block_numbers = (tags << self._np_index_bits) | set_array
+
+        write_mask = np.zeros(hit_mask.size, dtype=bool) if is_write is None else np.asarray(is_write, dtype=bool).ravel()
+        fill_mask = ~hit_mask if self.write_allocate else ~hit_mask & ~write_mask
+
+        self.set_hits += np.bincount(set_indices[hit_mask], minlength=self.num_sets)
+        self.set_misses += np.bincount(set_indices[~hit_mask], minlength=self.num_sets)
+
+        codes = None
+        if(self.track_3c):
+            classify = self._classify
+            codes = np.fromiter(map(classify, block_numbers.tolist(), hit_mask.tolist(), fill_mask.tolist()),
+                                dtype=np.int8, count=hit_mask.size)
+            counts = np.bincount(codes, minlength=4).tolist()
+            for miss_class, count in zip(MISS_CLASSES, counts[1:]):
+                self.miss_counts[miss_class] += count
+            self.set_conflict_misses += np.bincount(set_indices[codes == _CONFLICT], minlength=self.num_sets)
+
+        if(self.event_callback is not None):
+            first = -self.access_count % self.sample_every
+            for i in range(first, hit_mask.size, self.sample_every):
+                miss_class = MISS_CLASSES[codes[i] - 1] if codes is not None and codes[i] else None
+                self.event_callback(AccessEvent(self.access_count + i, int(addresses[i]), int(set_indices[i]),
+                                                bool(hit_mask[i]), bool(write_mask[i]), miss_class))
+        self.access_count += hit_mask.size
+        return hit_mask, batch_hits, batch_misses
+
+    def access_runs(self, addresses, counts, writes=None, leading_writes=None):
+        """
+        CacheSimulator.access_runs, but every access of a run is replayed (leading writes, reads, then the other
+        writes) so the per-set counters, the shadow cache and the sampled events see each one.
+        Runs are expanded one at a time into bounded batches, see iter_run_accesses.
+        """
+        if(isinstance(addresses, (bytes, bytearray, memoryview))):
+            addresses = np.frombuffer(addresses, dtype='<u8')
+        addresses = np.asarray(addresses).ravel()
+        counts = np.asarray(counts, dtype=np.int64).ravel()
+        if(counts.size != addresses.size or (counts.size and counts.min() <= 0)):
+            raise ValueError("counts must hold one positive repeat count per run.")
+        if(writes is None):
+            writes = leading_writes = repeat(0)
+        else:
+            writes = np.asarray(writes, dtype=np.int64).ravel()
+            if(writes.size != counts.size or np.any(writes > counts)):
+                raise ValueError("writes must hold one count per run, no larger than the run.")
+            if(leading_writes is None):
+                if(not self.write_allocate and writes.any()):
+                    raise ValueError("A no-write-allocate cache needs leading_writes to replay runs with writes.")
+                leading_writes = repeat(0)
+            else:
+                leading_writes = np.asarray(leading_writes, dtype=np.int64).ravel().tolist()
+            writes = writes.tolist()
+
+        hits = 0
+        misses = 0
+        for batch_addresses, write_flags in iter_run_accesses((addresses.tolist(),), counts.tolist(), writes, leading_writes):
+            _, batch_hits, batch_misses = self.access_many(np.asarray(batch_addresses, dtype=np.uint64), write_flags)
+            hits += batch_hits
+            misses += batch_misses
+        return hits, misses
+
+    def miss_breakdown(self):
+        """3C miss counts and their share of all misses, {'compulsory': (count, fraction), ...}."""
+        total = sum(self.miss_counts.values())
+        return {miss_class: (count, count / total if total else 0.0) for miss_class, count in self.miss_counts.items()}
+
+    def hot_sets(self, n=10, key='conflict'):
+        """
+        The n sets with the most conflict misses (key='conflict'), misses or evictions.
+        Returns (set_index, count) pairs, largest first.
+        """
+        counts = {'conflict': self.set_conflict_misses, 'misses': self.set_misses, 'evictions': self.set_evictions}[key]
+        order = np.argsort(counts, kind='stable')[::-1][:n]
+        return [(int(set_index), int(counts[set_index])) for set_index in order if counts[set_index]]
+
+def main():
+    ## a strided hotspot lands in a handful of sets and shows up as conflict misses, uniform random as capacity misses
+    cache_config = (32 * 1024, 64, 8)
+    workloads = {
+        'uniform': generate_random_address_array(0x10000000, 4 * 1024 * 1024, 1 << 18, 8, rng=4200),
+        'hotspot': generate_random_address_array(0x10000000, 4 * 1024 * 1024, 1 << 18, 8, rng=4200,
+                                                 distribution='hotspot', hotspot_stride_bytes=8192, hotspot_elements=24),
+    }
+
+    for name, addresses in workloads.items():
+        cache = InstrumentedCacheSimulator(*cache_config)
+        for first in range(0, addresses.size, SIMULATION_CHUNK_SIZE):
+            cache.access_many(addresses[first:first + SIMULATION_CHUNK_SIZE])
+        breakdown = cache.miss_breakdown()
+        print(f"{name}: miss rate {cache.get_miss_rate():.4f}  " + "  ".join(
+            f"{miss_class} {count:,} ({share:.1%})" for miss_class, (count, share) in breakdown.items()))
+        print("  hottest sets (conflict misses): " + ", ".join(
+            f"{set_index}: {count:,}" for set_index, count in cache.hot_sets(5)))
+
+if(__name__ == "__main__"):
+    main()
@@ -1,30 +1,58 @@
+import copy
 import math
 import random
 import multiprocessing
-from functools import partial
+from multiprocessing import shared_memory
 import logging
 import platform
 import subprocess
 import re
+import os
+import sys
+from array import array
+from itertools import repeat
+
+import numpy as np
+
+from replacement_policies import ReplacementPolicy, REPLACEMENT_POLICIES, make_replacement_policy
+from prefetchers import make_prefetcher
+
+WRITE_POLICIES = ['write-back', 'write-through']
 
 class CacheSimulator:
-    def __init__(self, cache_size_bytes, block_size_bytes, associativity, address_size_bits=64, replacement_policy='LRU'):
+    def __init__(self, cache_size_bytes, block_size_bytes, associativity, address_size_bits=64, replacement_policy='LRU',
+                 policy_seed=None, write_policy='write-back', write_allocate=True, word_size_bytes=8, prefetcher=None):
         if(cache_size_bytes <= 0 or block_size_bytes <= 0 or associativity <= 0):
             raise ValueError("Cache size, block size, and associativity must be positive.")
-        if(not self._is_power_of_two(cache_size_bytes)):
-            raise ValueError("Cache size must be a power of two.")
         if(not self._is_power_of_two(block_size_bytes)):
             raise ValueError("Block size must be a power of two.")
-        if((cache_size_bytes // block_size_bytes) % associativity != 0):
+        if(cache_size_bytes % (block_size_bytes * associativity) != 0):
             raise ValueError("Cache size must be divisible by (block size * associativity).")
-        if(replacement_policy not in ['LRU']):
+        ## the set index is a bit field, so the set count has to be a power of two, the size itself need not be
+        ## (a 48 KB 12-way L1 is 64 sets)
+        if(not self._is_power_of_two(cache_size_bytes // (block_size_bytes * associativity))):
+            raise ValueError("Cache size must be a power of two sets of (block size * associativity).")
+        if(not (isinstance(replacement_policy, type) and issubclass(replacement_policy, ReplacementPolicy))
+           and replacement_policy not in REPLACEMENT_POLICIES):
              raise ValueError(f"Unsupported replacement policy: {replacement_policy}")
+        if(write_policy not in WRITE_POLICIES):
+             raise ValueError(f"Unsupported write policy: {write_policy}")
+        if(word_size_bytes <= 0):
+             raise ValueError("Word size must be positive.")
 
         self.cache_size = cache_size_bytes
         self.block_size = block_size_bytes
         self.associativity = associativity
         self.address_size = address_size_bits
-        self.replacement_policy = replacement_policy
+        self.replacement_policy = replacement_policy if isinstance(replacement_policy, str) else replacement_policy.name
+        self._policy_factory = replacement_policy
+        self.policy_seed = policy_seed
+        self.write_policy = write_policy
+        self.write_allocate = write_allocate
+        ## None, a name in prefetchers.PREFETCHERS, a Prefetcher subclass or a configured instance
+        self._prefetcher_factory = prefetcher
+        ## bytes a write-through (or non-allocating write miss) sends to the next level per store
+        self.word_size = word_size_bytes
 
         self.num_blocks = cache_size_bytes // block_size_bytes
         self.num_sets = self.num_blocks // associativity
@@ -36,11 +64,48 @@ class CacheSimulator:
         if self.num_tag_bits < 0:
              raise ValueError("Address size too small for cache configuration.")
 
-        self.cache = [[{'valid': False, 'tag': 0, 'lru_counter': 0} for _ in range(associativity)]
-                      for _ in range(self.num_sets)]
+        ## decode constants, computed once so the access paths are just shifts and ands
+        self._index_mask = (1 << self.num_index_bits) - 1
+        self._tag_mask = (1 << self.num_tag_bits) - 1
+        self._np_offset_bits = np.uint64(self.num_offset_bits)
+        self._np_index_bits = np.uint64(self.num_index_bits)
+        self._np_index_mask = np.uint64(self._index_mask)
+        self._np_tag_mask = np.uint64(self._tag_mask)
 
-        self.hits = 0
-        self.misses = 0
+        self._init_storage()
+        self.reset_stats()
+
+    def _init_storage(self):
+        ## flat per-line arrays, line i of set s lives at s * associativity + i
+        self.tags = array('Q', [0]) * self.num_blocks
+        self.valid = bytearray(self.num_blocks)
+        self.dirty = bytearray(self.num_blocks)
+        ## per set: tag -> line index, so a lookup is one dict probe whatever the associativity.
+        ## This (and LRU's per-set OrderedDicts) trades memory for speed: the flat arrays drop the per-line dicts,
+        ## but a populated cache only ends up 5-15% smaller than the old layout (cache_benchmark.benchmark_storage),
+        ## the gain is in lookups and hits, not footprint
+        self.set_lines = [{} for _ in range(self.num_sets)]
+
+        ## the policy is resolved once here, the access paths only call these bound methods
+        self.policy = make_replacement_policy(self._policy_factory, self.num_sets, self.associativity, self.policy_seed)
+        self._on_hit = self.policy.on_hit if self.policy.updates_on_hit else None
+        self._on_fill = self.policy.on_fill
+        self._replace = self.policy.replace
+
+        ## with a prefetcher access()/access_many() take the prefetching loop, lines it filled are flagged until first use
+        self.prefetcher = make_prefetcher(self._prefetcher_factory)
+        self.prefetched = bytearray(self.num_blocks)
+
+    @classmethod
+    def from_system_cache(cls, level=1, **kwargs):
+        """
+        A cache shaped like this machine's level `level` data (or unified) cache, see system_cache_configs.
+        Extra keyword arguments (replacement_policy, write_policy, ...) are passed through.
+        """
+        for config in system_cache_configs():
+            if(config['level'] == level):
+                return cls(config['cache_size_bytes'], config['block_size_bytes'], config['associativity'], **kwargs)
+        raise ValueError(f"No level {level} data cache was detected on this machine.")
 
     def _is_power_of_two(self, n):
         return (n > 0) and (n & (n - 1) == 0)
@@ -48,74 +113,503 @@ class CacheSimulator:
     def _get_address_parts(self, address):
         if address < 0:
              raise ValueError("Address cannot be negative.")
-        ## Ignore offset bits for cache access logic
+        ## Ignore offset bits for cache access logic, tags above num_tag_bits are masked off like the hardware would
         address_no_offset = address >> self.num_offset_bits
+        return (address_no_offset >> self.num_index_bits) & self._tag_mask, address_no_offset & self._index_mask
 
-        index_mask = (1 << self.num_index_bits) - 1 if self.num_index_bits > 0 else 0
-        set_index = address_no_offset & index_mask
-
-        tag = address_no_offset >> self.num_index_bits
-
-        ## python intergers are bullshit, so we need to handle this manually
-        max_tag = (1 << self.num_tag_bits) -1
-        if(tag > max_tag):
-             tag = tag & max_tag 
+    def decompose_addresses(self, addresses):
+        """
+        Vectorized _get_address_parts for a whole array of addresses.
 
-        return tag, set_index
+        Args:
+            addresses: NumPy integer array, any buffer of little-endian uint64 addresses, or a sequence of ints.
 
-    def access(self, address):
+        Returns:
+            tuple: (tags, set_indices), two flat uint64 arrays with one entry per address.
+        """
+        if(isinstance(addresses, (bytes, bytearray, memoryview))):
+            addresses = np.frombuffer(addresses, dtype='<u8')
+        addresses = np.asarray(addresses)
+        if(addresses.size and addresses.dtype.kind not in 'iu'):
+            raise ValueError("Addresses must be integers.")
+        if(addresses.dtype.kind == 'i' and addresses.size and addresses.min() < 0):
+            raise ValueError("Address cannot be negative.")
+        block_numbers = addresses.ravel().astype(np.uint64, copy=False) >> self._np_offset_bits
+        return (block_numbers >> self._np_index_bits) & self._np_tag_mask, block_numbers & self._np_index_mask
+
+    def access(self, address, is_write=False):
         """
-        Simulates a memory read access to the cache.
+        Simulates a memory read (or write, if is_write) access to the cache.
         Returns True for a hit, False for a miss.
         Updates cache state and statistics.
         """
-        tag, set_index = self._get_address_parts(address)
-        target_set = self.cache[set_index]
-        
-        hit = False
+        ## _get_address_parts inlined, this is the hottest scalar path
+        if(address < 0):
+            raise ValueError("Address cannot be negative.")
+        address_no_offset = address >> self.num_offset_bits
+        set_index = address_no_offset & self._index_mask
+        tag = (address_no_offset >> self.num_index_bits) & self._tag_mask
+        if(self.prefetcher is not None):
+            return bool(self._access_many_prefetching([tag], [set_index], [is_write], 1 if is_write else 0)[1])
+        lines = self.set_lines[set_index]
+        if(is_write):
+            self.writes += 1
+        else:
+            self.reads += 1
 
-        current_max_lru = 0
-        for line in target_set:
-            if(line['valid']):
-                line['lru_counter'] += 1
-                current_max_lru = max(current_max_lru, line['lru_counter'])
+        #1 hit check
+        line = lines.get(tag)
+        if(line is not None):
+            self.hits += 1
+            if(self._on_hit is not None):
+                self._on_hit(set_index, line)
+            if(is_write):
+                self._write_line(line)
+            return True
+
+        ## two. miss, fill the first invalid way or let the policy pick a victim
+        self.misses += 1
+        if(is_write and not self.write_allocate):
+            ## no-write-allocate: the store goes around the cache
+            self.bytes_to_next_level += self.word_size
+            return False
+
+        self.bytes_from_next_level += self.block_size
+        if(len(lines) < self.associativity):
+            base = set_index * self.associativity
+            line = self.valid.find(0, base, base + self.associativity)
+            self._on_fill(set_index, line)
+        else:
+            line = self._replace(set_index)
+            self._evict_line(line)
+            del lines[self.tags[line]]
+        self.tags[line] = tag
+        self.valid[line] = 1
+        lines[tag] = line
+        if(is_write):
+            self._write_line(line)
+
+        return False
+
+    def _write_line(self, line):
+        if(self.write_policy == 'write-back'):
+            self.dirty[line] = 1
+        else:
+            self.bytes_to_next_level += self.word_size
 
+    def _evict_line(self, line):
+        ## a dirty victim is written back to the next level in full
+        if(self.dirty[line]):
+            self.dirty[line] = 0
+            self.writebacks += 1
+            self.bytes_to_next_level += self.block_size
 
-        #1 hit check
-        for i, line in enumerate(target_set):
-            if line['valid'] and line['tag'] == tag:
-                hit = True
-                self.hits += 1
-                line['lru_counter'] = 0 
-                break
-        
-        ## two. miss
-        if(not hit):
-            self.misses += 1
-            victim_index = -1
-            for i, line in enumerate(target_set):
-                if(not line['valid']):
-                    victim_index = i
-                    break
-            
-            if(victim_index == -1):
-                if(self.replacement_policy == 'LRU'):
-                    max_lru = -1
-                    lru_victim_index = -1
-                    for i, line in enumerate(target_set):
-                        if(line['lru_counter'] > max_lru):
-                             max_lru = line['lru_counter']
-                             lru_victim_index = i
-                    victim_index = lru_victim_index
-                else:
-                    raise NotImplementedError(f"Replacement policy {self.replacement_policy} not implemented.")
+    def access_many(self, addresses, is_write=None):
+        """
+        Simulates a batch of memory accesses, in order, with the same state updates as access().
+        Tags and set indices for the whole batch are split with vectorized shifts and masks.
+
+        Args:
+            addresses: NumPy integer array, any buffer of little-endian uint64 addresses, or a sequence of ints.
+            is_write: Optional per-address bool array/sequence marking writes, None means every access is a read.
 
-            victim_line = target_set[victim_index]
-            victim_line['valid'] = True
-            victim_line['tag'] = tag
-            victim_line['lru_counter'] = 0
+        Returns:
+            tuple: (hit_mask, hits, misses) where hit_mask is a bool array with one entry per address
+                   and hits/misses are the counts for this batch only.
+        """
+        tag_array, set_array = self.decompose_addresses(addresses)
+        num_addresses = tag_array.size
+        if(num_addresses == 0):
+            return np.zeros(0, dtype=bool), 0, 0
+        set_indices = set_array.tolist()
+        batch_tags = tag_array.tolist()
+
+        if(is_write is None):
+            write_flags = repeat(False)
+            num_writes = 0
+        else:
+            is_write = np.asarray(is_write, dtype=bool).ravel()
+            if(is_write.size != num_addresses):
+                raise ValueError("is_write must have one entry per address.")
+            write_flags = is_write.tolist()
+            num_writes = int(np.count_nonzero(is_write))
+        if(self.prefetcher is not None):
+            return self._access_many_prefetching(batch_tags, set_indices, write_flags, num_writes)
+
+        ## same logic as access(), with everything hoisted into locals for the tight loop
+        set_lines = self.set_lines
+        tags = self.tags
+        valid = self.valid
+        dirty = self.dirty
+        associativity = self.associativity
+        on_hit = self._on_hit
+        on_fill = self._on_fill
+        replace = self._replace
+        write_back = self.write_policy == 'write-back'
+        write_allocate = self.write_allocate
+        hit_flags = bytearray(num_addresses)
+        batch_hits = 0
+        fills = 0
+        writebacks = 0
+        words_written = 0
+
+        for i, (tag, set_index, write) in enumerate(zip(batch_tags, set_indices, write_flags)):
+            lines = set_lines[set_index]
+            line = lines.get(tag)
+            if(line is not None):
+                hit_flags[i] = 1
+                batch_hits += 1
+                if(on_hit is not None):
+                    on_hit(set_index, line)
+                if(write):
+                    if(write_back):
+                        dirty[line] = 1
+                    else:
+                        words_written += 1
+                continue
+
+            if(write and not write_allocate):
+                words_written += 1
+                continue
+
+            fills += 1
+            if(len(lines) < associativity):
+                base = set_index * associativity
+                line = valid.find(0, base, base + associativity)
+                on_fill(set_index, line)
+            else:
+                line = replace(set_index)
+                if(dirty[line]):
+                    dirty[line] = 0
+                    writebacks += 1
+                del lines[tags[line]]
+            tags[line] = tag
+            valid[line] = 1
+            lines[tag] = line
+            if(write):
+                if(write_back):
+                    dirty[line] = 1
+                else:
+                    words_written += 1
+
+        batch_misses = num_addresses - batch_hits
+        self.hits += batch_hits
+        self.misses += batch_misses
+        self.writes += num_writes
+        self.reads += num_addresses - num_writes
+        self.writebacks += writebacks
+        self.bytes_from_next_level += fills * self.block_size
+        self.bytes_to_next_level += writebacks * self.block_size + words_written * self.word_size
+
+        return np.frombuffer(hit_flags, dtype=bool), batch_hits, batch_misses
+
+    def _fill_block(self, tag, set_index):
+        ## _fill without the evicted address, also counting a never-used prefetched victim as a useless prefetch
+        lines = self.set_lines[set_index]
+        if(len(lines) < self.associativity):
+            base = set_index * self.associativity
+            line = self.valid.find(0, base, base + self.associativity)
+            self._on_fill(set_index, line)
+        else:
+            line = self._replace(set_index)
+            self._evict_line(line)
+            del lines[self.tags[line]]
+            if(self.prefetched[line]):
+                self.prefetched[line] = 0
+                self.prefetch_useless += 1
+        self.tags[line] = tag
+        self.valid[line] = 1
+        lines[tag] = line
+        return line
+
+    def _access_many_prefetching(self, batch_tags, set_indices, write_flags, num_writes):
+        ## access_many's loop plus the prefetcher, kept separate so caches without one never pay for it
+        prefetcher = self.prefetcher
+        on_access = prefetcher.on_access
+        claim = prefetcher.claim if prefetcher.holds_blocks else None
+        set_lines = self.set_lines
+        prefetched = self.prefetched
+        on_hit = self._on_hit
+        fill_block = self._fill_block
+        write_line = self._write_line
+        write_allocate = self.write_allocate
+        index_bits = self.num_index_bits
+        index_mask = self._index_mask
+        tag_mask = self._tag_mask
+        issued_before = prefetcher.issued
+        discarded_before = prefetcher.discarded
+        num_addresses = len(batch_tags)
+        hit_flags = bytearray(num_addresses)
+        batch_hits = 0
+        demand_fills = 0
+        words_around = 0
+        useful = 0
+        prefetch_fills = 0
+
+        for i, (tag, set_index, write) in enumerate(zip(batch_tags, set_indices, write_flags)):
+            lines = set_lines[set_index]
+            line = lines.get(tag)
+            block = (tag << index_bits) | set_index
+            prefetch_hit = False
+            if(line is not None):
+                if(prefetched[line]):
+                    prefetched[line] = 0
+                    prefetch_hit = True
+                if(on_hit is not None):
+                    on_hit(set_index, line)
+            elif(claim is not None and claim(block)):
+                ## already fetched into the prefetcher, it moves into the cache with no demand traffic
+                line = fill_block(tag, set_index)
+                prefetch_hit = True
+
+            hit = line is not None
+            if(hit):
+                hit_flags[i] = 1
+                batch_hits += 1
+                useful += prefetch_hit
+                if(write):
+                    write_line(line)
+            elif(write and not write_allocate):
+                words_around += 1
+            else:
+                demand_fills += 1
+                line = fill_block(tag, set_index)
+                if(write):
+                    write_line(line)
+
+            targets = on_access(block, hit, prefetch_hit)
+            if(targets):
+                for target in targets:
+                    target_set = target & index_mask
+                    target_tag = (target >> index_bits) & tag_mask
+                    if(target_tag in set_lines[target_set]):
+                        continue
+                    prefetched[fill_block(target_tag, target_set)] = 1
+                    prefetch_fills += 1
+
+        buffer_fetches = prefetcher.issued - issued_before
+        batch_misses = num_addresses - batch_hits
+        self.hits += batch_hits
+        self.misses += batch_misses
+        self.writes += num_writes
+        self.reads += num_addresses - num_writes
+        self.prefetches_issued += prefetch_fills + buffer_fetches
+        self.prefetch_useful += useful
+        self.prefetch_useless += prefetcher.discarded - discarded_before
+        self.prefetch_bytes += (prefetch_fills + buffer_fetches) * self.block_size
+        self.bytes_from_next_level += (demand_fills + prefetch_fills + buffer_fetches) * self.block_size
+        self.bytes_to_next_level += words_around * self.word_size
+        return np.frombuffer(hit_flags, dtype=bool), batch_hits, batch_misses
+
+    def access_runs(self, addresses, counts, writes=None, leading_writes=None):
+        """
+        Simulates a run-length encoded trace, run i being counts[i] consecutive accesses to the block holding addresses[i]
+        (see block_runs.collapse_block_runs). Only the first access of a run can miss, the repeats are hits whatever
+        the replacement policy, so each run costs one lookup and statistics match access_many on the expanded trace.
+        With a prefetcher every access trains it, so runs are expanded back into accesses and go through
+        access_many's prefetching path instead (write order inside a run: leading writes, reads, then the other writes).
+
+        Args:
+            addresses: Any address inside each run's block (array, buffer or sequence, as for access_many).
+            counts: Accesses per run.
+            writes: Optional number of writes in each run, None means every access is a read.
+            leading_writes: Writes before the first read of each run, only needed for no-write-allocate caches,
+                            where those writes miss one by one until a read brings the block in.
+
+        Returns:
+            tuple: (hits, misses) for these runs only.
+        """
+        tag_array, set_array = self.decompose_addresses(addresses)
+        num_runs = tag_array.size
+        if(num_runs == 0):
+            return 0, 0
+        counts = np.asarray(counts, dtype=np.int64).ravel()
+        if(counts.size != num_runs or (counts.size and counts.min() <= 0)):
+            raise ValueError("counts must hold one positive repeat count per run.")
+        if(writes is None):
+            write_counts = repeat(0)
+            leading = repeat(0)
+            num_writes = 0
+        else:
+            writes = np.asarray(writes, dtype=np.int64).ravel()
+            if(writes.size != num_runs or np.any(writes > counts)):
+                raise ValueError("writes must hold one count per run, no larger than the run.")
+            write_counts = writes.tolist()
+            num_writes = int(writes.sum())
+            if(leading_writes is None):
+                if(not self.write_allocate and num_writes):
+                    raise ValueError("A no-write-allocate cache needs leading_writes to replay runs with writes.")
+                leading = repeat(0)
+            else:
+                leading = np.asarray(leading_writes, dtype=np.int64).ravel().tolist()
+        if(self.prefetcher is not None):
+            hits = 0
+            misses = 0
+            for batch_tags, set_indices, write_flags in iter_run_accesses((tag_array.tolist(), set_array.tolist()),
+                                                                          counts.tolist(), write_counts, leading):
+                _, batch_hits, batch_misses = self._access_many_prefetching(batch_tags, set_indices, write_flags,
+                                                                            sum(write_flags))
+                hits += batch_hits
+                misses += batch_misses
+            return hits, misses
+
+        set_lines = self.set_lines
+        tags = self.tags
+        valid = self.valid
+        dirty = self.dirty
+        associativity = self.associativity
+        on_hit = self._on_hit
+        on_fill = self._on_fill
+        replace = self._replace
+        write_back = self.write_policy == 'write-back'
+        write_allocate = self.write_allocate
+        total_accesses = int(counts.sum())
+        misses = 0
+        fills = 0
+        writebacks = 0
+        words_written = 0
+
+        for tag, set_index, count, run_writes, run_leading in zip(tag_array.tolist(), set_array.tolist(), counts.tolist(),
+                                                                  write_counts, leading):
+            lines = set_lines[set_index]
+            line = lines.get(tag)
+            if(line is None):
+                if(write_allocate):
+                    misses += 1
+                    repeats = count - 1
+                else:
+                    ## every write ahead of the first read goes around the cache and misses again
+                    misses += run_leading
+                    words_written += run_leading
+                    run_writes -= run_leading
+                    if(run_leading == count):
+                        continue
+                    misses += 1
+                    repeats = count - run_leading - 1
+                fills += 1
+                if(len(lines) < associativity):
+                    base = set_index * associativity
+                    line = valid.find(0, base, base + associativity)
+                    on_fill(set_index, line)
+                else:
+                    line = replace(set_index)
+                    if(dirty[line]):
+                        dirty[line] = 0
+                        writebacks += 1
+                    del lines[tags[line]]
+                tags[line] = tag
+                valid[line] = 1
+                lines[tag] = line
+                ## the repeats are hits, and a hit leaves the line in the same state however many times it happens
+                if(on_hit is not None and repeats):
+                    on_hit(set_index, line)
+            elif(on_hit is not None):
+                on_hit(set_index, line)
+            if(run_writes):
+                if(write_back):
+                    dirty[line] = 1
+                else:
+                    words_written += run_writes
+
+        self.hits += total_accesses - misses
+        self.misses += misses
+        self.writes += num_writes
+        self.reads += total_accesses - num_writes
+        self.writebacks += writebacks
+        self.bytes_from_next_level += fills * self.block_size
+        self.bytes_to_next_level += writebacks * self.block_size + words_written * self.word_size
+        return total_accesses - misses, misses
+
+    def _line_address(self, tag, set_index):
+        return ((tag << self.num_index_bits) | set_index) << self.num_offset_bits
+
+    def _fill(self, tag, set_index):
+        ## inserts a line, returns the evicted line's block address or None
+        lines = self.set_lines[set_index]
+        evicted = None
+        if(len(lines) < self.associativity):
+            ## fill the first invalid way
+            base = set_index * self.associativity
+            line = self.valid.find(0, base, base + self.associativity)
+            self._on_fill(set_index, line)
+        else:
+            line = self._replace(set_index)
+            self._evict_line(line)
+            victim_tag = self.tags[line]
+            del lines[victim_tag]
+            evicted = self._line_address(victim_tag, set_index)
+            ## as in _fill_block, a victim the prefetcher brought in and nobody used was a useless prefetch
+            if(self.prefetched[line]):
+                self.prefetched[line] = 0
+                self.prefetch_useless += 1
+        self.tags[line] = tag
+        self.valid[line] = 1
+        lines[tag] = line
+        return evicted
+
+    def access_with_eviction(self, address):
+        """
+        access() that also reports what the fill displaced.
+        Returns (hit, evicted_address) where evicted_address is the block address of the victim, or None.
+        """
+        tag, set_index = self._get_address_parts(address)
+        line = self.set_lines[set_index].get(tag)
+        if(line is not None):
+            self.hits += 1
+            self.reads += 1
+            self.policy.on_hit(set_index, line)
+            return True, None
+        self.misses += 1
+        self.reads += 1
+        self.bytes_from_next_level += self.block_size
+        return False, self._fill(tag, set_index)
+
+    def lookup(self, address):
+        """
+        Counts a hit or miss and updates recency on a hit, but never fills on a miss.
+        Used by exclusive hierarchies where a lower level is only searched, not filled, on demand.
+        """
+        tag, set_index = self._get_address_parts(address)
+        self.reads += 1
+        line = self.set_lines[set_index].get(tag)
+        if(line is not None):
+            self.hits += 1
+            self.policy.on_hit(set_index, line)
+            return True
+        self.misses += 1
+        return False
+
+    def contains(self, address):
+        """True if the block holding address is cached. Touches neither state nor statistics."""
+        tag, set_index = self._get_address_parts(address)
+        return tag in self.set_lines[set_index]
 
-        return hit 
+    def insert(self, address):
+        """
+        Places a block in the cache without counting an access, e.g. a victim from the level above.
+        An already present block is treated as a hit for the replacement policy.
+        Returns the evicted block address, or None.
+        """
+        tag, set_index = self._get_address_parts(address)
+        line = self.set_lines[set_index].get(tag)
+        if(line is not None):
+            self.policy.on_hit(set_index, line)
+            return None
+        return self._fill(tag, set_index)
+
+    def invalidate(self, address):
+        """Drops the block holding address if present, writing it back if dirty. Returns True if a line was invalidated."""
+        tag, set_index = self._get_address_parts(address)
+        line = self.set_lines[set_index].pop(tag, None)
+        if(line is None):
+            return False
+        self._evict_line(line)
+        self.valid[line] = 0
+        if(self.prefetched[line]):
+            self.prefetched[line] = 0
+            self.prefetch_useless += 1
+        self.policy.on_invalidate(set_index, line)
+        return True
 
     def get_miss_rate(self):
         total_accesses = self.hits + self.misses
@@ -123,13 +617,48 @@ class CacheSimulator:
             return 0.0
         return self.misses / total_accesses
 
+    def get_write_traffic(self):
+        """Read/write counts, dirty write-backs and bytes moved to and from the next level since the last reset_stats()."""
+        return {
+            'reads': self.reads,
+            'writes': self.writes,
+            'writebacks': self.writebacks,
+            'bytes_from_next_level': self.bytes_from_next_level,
+            'bytes_to_next_level': self.bytes_to_next_level,
+        }
+
+    def get_prefetch_stats(self):
+        """
+        Prefetches issued, useful (a demand access used the block), useless (evicted or discarded unused),
+        still pending, accuracy = useful / (useful + useless) and the bytes they pulled from the next level,
+        which bytes_from_next_level includes.
+        """
+        pending = self.prefetched.count(1) + (self.prefetcher.pending_blocks() if self.prefetcher is not None else 0)
+        resolved = self.prefetch_useful + self.prefetch_useless
+        return {
+            'issued': self.prefetches_issued,
+            'useful': self.prefetch_useful,
+            'useless': self.prefetch_useless,
+            'pending': pending,
+            'accuracy': self.prefetch_useful / resolved if resolved else 0.0,
+            'prefetch_bytes': self.prefetch_bytes,
+        }
+
     def reset_stats(self):
         self.hits = 0
         self.misses = 0
+        self.reads = 0
+        self.writes = 0
+        self.writebacks = 0
+        self.bytes_from_next_level = 0
+        self.bytes_to_next_level = 0
+        self.prefetches_issued = 0
+        self.prefetch_useful = 0
+        self.prefetch_useless = 0
+        self.prefetch_bytes = 0
         
     def reset(self):
-        self.cache = [[{'valid': False, 'tag': 0, 'lru_counter': 0} for _ in range(self.associativity)]
-                      for _ in range(self.num_sets)]
+        self._init_storage()
         self.reset_stats()
 
 def generate_row_major_addresses(start_address, rows, cols, data_size_bytes):
@@ -173,10 +702,159 @@ def generate_random_addresses(start_address, range_bytes, num_accesses, data_siz
         addresses.append(start_address + offset)
     return addresses
 
-def run_single_simulation(run_args, cache_config):
+def iter_run_accesses(columns, counts, write_counts, leading_writes):
+    """
+    Expands runs back into accesses, one run at a time, as batches of at most SIMULATION_CHUNK_SIZE accesses
+    (a long run is split across batches, so memory never depends on run length).
+
+    Args:
+        columns: Tuple of per-run value lists (e.g. (tags, set_indices) or (addresses,)), each repeated per access.
+        counts, write_counts, leading_writes: Per-run iterables as access_runs takes them. Inside a run the
+                                              leading writes come first, then the reads, then the other writes.
+
+    Yields:
+        tuple: One list per column plus the write flags.
+    """
+    batches = [[] for _ in columns]
+    write_flags = []
+    for values, count, run_writes, run_leading in zip(zip(*columns), counts, write_counts, leading_writes):
+        for write, length in ((True, run_leading), (False, count - run_writes), (True, run_writes - run_leading)):
+            while(length > 0):
+                take = min(length, SIMULATION_CHUNK_SIZE - len(write_flags))
+                for batch, value in zip(batches, values):
+                    batch.extend(repeat(value, take))
+                write_flags.extend(repeat(write, take))
+                length -= take
+                if(len(write_flags) == SIMULATION_CHUNK_SIZE):
+                    yield (*batches, write_flags)
+                    batches = [[] for _ in columns]
+                    write_flags = []
+    if(write_flags):
+        yield (*batches, write_flags)
+
+RANDOM_DISTRIBUTIONS = ['uniform', 'zipf', 'hotspot']
+
+def run_seed(base_seed, run_index):
+    """
+    The SeedSequence of run run_index, derived only from base_seed and the index: the same child
+    SeedSequence(base_seed).spawn(...)[run_index] would be, without depending on what was spawned before.
+    """
+    return np.random.SeedSequence(base_seed, spawn_key=(run_index,))
+
+def spawn_run_seeds(base_seed, num_runs):
+    """
+    One independent SeedSequence per run, derived only from base_seed and the run's index.
+    Run i draws the same addresses whichever process (or how many processes) executes it.
+    """
+    return [run_seed(base_seed, i) for i in range(num_runs)]
+
+def generate_random_address_array(start_address, range_bytes, num_accesses, data_size_bytes, rng=None,
+                                  distribution='uniform', zipf_exponent=1.1, hotspot_fraction=0.9,
+                                  hotspot_stride_bytes=4096, hotspot_elements=64):
+    """
+    Seeded, vectorized replacement for generate_random_addresses, returns a uint64 NumPy array.
+    The whole aligned-offset array comes from a single draw on rng (a numpy.random.Generator or anything
+    default_rng accepts as a seed, e.g. a SeedSequence from spawn_run_seeds), so it is bit-reproducible.
+
+    Distributions:
+        'uniform' - every data_size-aligned element in the range equally likely.
+        'zipf'    - element k (0-based) drawn with probability proportional to 1 / (k + 1) ** zipf_exponent,
+                    truncated to the range, so the hot elements sit at the start of it.
+        'hotspot' - hotspot_fraction of accesses go to hotspot_elements elements spaced hotspot_stride_bytes apart
+                    (a conflict-miss generator when the stride is a multiple of the set span), the rest are uniform.
+    """
+    if(distribution not in RANDOM_DISTRIBUTIONS):
+        raise ValueError(f"Unsupported random distribution: {distribution}")
+    if(range_bytes <= 0 or num_accesses <= 0 or data_size_bytes <= 0):
+        return np.zeros(0, dtype=np.uint64)
+    num_elements_in_range = range_bytes // data_size_bytes
+    if(num_elements_in_range == 0):
+        return np.zeros(0, dtype=np.uint64)
+
+    rng = rng if isinstance(rng, np.random.Generator) else np.random.default_rng(rng)
+
+    if(distribution == 'uniform'):
+        element_indices = rng.integers(0, num_elements_in_range, size=num_accesses, dtype=np.uint64)
+    elif(distribution == 'zipf'):
+        weights = np.arange(1, num_elements_in_range + 1, dtype=np.float64) ** -zipf_exponent
+        cdf = np.cumsum(weights)
+        cdf /= cdf[-1]
+        element_indices = np.searchsorted(cdf, rng.random(num_accesses), side='right')
+        element_indices = np.minimum(element_indices, num_elements_in_range - 1).astype(np.uint64)
+    else:
+        stride_elements = max(1, hotspot_stride_bytes // data_size_bytes)
+        hot_count = max(1, min(hotspot_elements, (num_elements_in_range - 1) // stride_elements + 1))
+        draws = rng.random(num_accesses)
+        hot = rng.integers(0, hot_count, size=num_accesses, dtype=np.uint64) * np.uint64(stride_elements)
+        cold = rng.integers(0, num_elements_in_range, size=num_accesses, dtype=np.uint64)
+        element_indices = np.where(draws < hotspot_fraction, hot, cold)
+
+    return element_indices * np.uint64(data_size_bytes) + np.uint64(start_address)
+
+## addresses per NumPy chunk when the lazy generators feed access_many
+SIMULATION_CHUNK_SIZE = 1 << 16
+
+def iter_row_major_addresses(start_address, rows, cols, data_size_bytes, chunk_size=None):
+    """
+    Lazy version of generate_row_major_addresses.
+    Yields one address at a time, or uint64 NumPy chunks of up to chunk_size addresses if chunk_size is given.
+    """
+    total = rows * cols
+    if(chunk_size is None):
+        for r in range(rows):
+            for c in range(cols):
+                yield start_address + (r * cols + c) * data_size_bytes
+        return
+
+    for first in range(0, total, chunk_size):
+        element_indices = np.arange(first, min(first + chunk_size, total), dtype=np.uint64)
+        yield element_indices * np.uint64(data_size_bytes) + np.uint64(start_address)
+
+def iter_col_major_addresses(start_address, rows, cols, data_size_bytes, chunk_size=None):
+    """
+    Lazy version of generate_col_major_addresses.
+    Yields one address at a time, or uint64 NumPy chunks of up to chunk_size addresses if chunk_size is given.
+    """
+    total = rows * cols
+    if(chunk_size is None):
+        for c in range(cols):
+            for r in range(rows):
+                yield start_address + (r * cols + c) * data_size_bytes
+        return
+
+    ## the k-th column-major access touches row k % rows of column k // rows
+    for first in range(0, total, chunk_size):
+        k = np.arange(first, min(first + chunk_size, total), dtype=np.uint64)
+        element_indices = (k % np.uint64(rows)) * np.uint64(cols) + k // np.uint64(rows)
+        yield element_indices * np.uint64(data_size_bytes) + np.uint64(start_address)
+
+def iter_random_addresses(start_address, range_bytes, num_accesses, data_size_bytes, chunk_size=None, rng=None):
+    """
+    Lazy version of generate_random_addresses.
+    Yields one address at a time drawn with the global random module (same stream as the list version),
+    or uint64 NumPy chunks of up to chunk_size addresses drawn from rng (a numpy.random.Generator, fresh if None).
+    """
+    if(range_bytes <= 0 or num_accesses <= 0 or data_size_bytes <= 0):
+        return
+    num_elements_in_range = range_bytes // data_size_bytes
+    if(num_elements_in_range == 0):
+        return
+
+    if(chunk_size is None):
+        for _ in range(num_accesses):
+            yield start_address + random.randrange(num_elements_in_range) * data_size_bytes
+        return
+
+    rng = rng if rng is not None else np.random.default_rng()
+    for first in range(0, num_accesses, chunk_size):
+        count = min(chunk_size, num_accesses - first)
+        element_indices = rng.integers(0, num_elements_in_range, size=count, dtype=np.uint64)
+        yield element_indices * np.uint64(data_size_bytes) + np.uint64(start_address)
+
+def run_single_simulation(run_args, cache_config, seed=None, random_options=None):
     """
     Runs a single cache simulation based on provided arguments.
-    Designed to be called by multiprocessing.Pool.map.
+    Designed to be called from a worker pool (see SimulationPool).
 
     Args:
         run_args (tuple): Contains parameters specific to this run:
@@ -185,6 +863,9 @@ def run_single_simulation(run_args, cache_config):
         cache_config (dict): Contains fixed cache parameters:
                              {'cache_size_bytes': int, 'block_size_bytes': int, 
                               'associativity': int, 'address_size_bits': int}
+                             plus any other CacheSimulator keyword (replacement_policy, write_policy, ...)
+        seed: Seed for the random access pattern (int, SeedSequence or Generator), None for a fresh unseeded one.
+        random_options (dict): Extra generate_random_address_array arguments, e.g. {'distribution': 'zipf'}.
                              
     Returns:
         float: The miss rate for this simulation run, or float('nan') on error.
@@ -192,25 +873,28 @@ def run_single_simulation(run_args, cache_config):
     access_type, start_addr, rows, cols, data_size, rand_range, num_rand_acc = run_args
 
     try:
-        cache = CacheSimulator(
-            cache_size_bytes=cache_config['cache_size_bytes'],
-            block_size_bytes=cache_config['block_size_bytes'],
-            associativity=cache_config['associativity'],
-            address_size_bits=cache_config['address_size_bits']
-        )
-
-        addresses = []
+        cache = CacheSimulator(**cache_config)
+
+        num_accesses = 0
         if(access_type == 'row_major'):
-            addresses = generate_row_major_addresses(start_addr, rows, cols, data_size)
+            address_chunks = iter_row_major_addresses(start_addr, rows, cols, data_size, SIMULATION_CHUNK_SIZE)
+            num_accesses = rows * cols
         elif(access_type == 'col_major'):
-            addresses = generate_col_major_addresses(start_addr, rows, cols, data_size)
+            address_chunks = iter_col_major_addresses(start_addr, rows, cols, data_size, SIMULATION_CHUNK_SIZE)
+            num_accesses = rows * cols
         elif(access_type == 'random'):
-            addresses = generate_random_addresses(start_addr, rand_range, num_rand_acc, data_size)
+            ## drawn in one call so the run is bit-reproducible from its seed, whatever the chunking
+            random_addresses = generate_random_address_array(start_addr, rand_range, num_rand_acc, data_size,
+                                                             rng=seed, **(random_options or {}))
+            address_chunks = (random_addresses[first:first + SIMULATION_CHUNK_SIZE]
+                              for first in range(0, random_addresses.size, SIMULATION_CHUNK_SIZE))
+            if(rand_range > 0 and num_rand_acc > 0 and data_size > 0 and rand_range // data_size > 0):
+                num_accesses = num_rand_acc
         else:
             ## unliekly branch, but good to have
             return float('nan') 
 
-        if(not addresses):
+        if(num_accesses <= 0):
             if(access_type == 'random' and rand_range < data_size and rand_range > 0):
                  pass # Fall through to return NaN
             elif(rows * cols == 0 and access_type != 'random'):
@@ -219,8 +903,8 @@ def run_single_simulation(run_args, cache_config):
             else:
                  return float('nan')
 
-        for addr in addresses:
-            cache.access(addr)
+        for chunk in address_chunks:
+            cache.access_many(chunk)
 
         return cache.get_miss_rate()
 
@@ -229,18 +913,243 @@ def run_single_simulation(run_args, cache_config):
 
 
 
+## worker-side cache of attached shared traces, name -> SharedMemory, so each worker attaches once per trace
+_attached_traces = {}
+
+def _attach_shared_trace(handle):
+    name, length = handle
+    shm = _attached_traces.get(name)
+    if(shm is None):
+        try:
+            shm = shared_memory.SharedMemory(name=name, track=False)
+        except TypeError:
+            ## python < 3.13 has no track flag, stop this process's tracker from unlinking a block it doesn't own
+            shm = shared_memory.SharedMemory(name=name)
+            try:
+                from multiprocessing import resource_tracker
+                resource_tracker.unregister(shm._name, 'shared_memory')
+            except Exception:
+                pass
+        _attached_traces[name] = shm
+    return np.ndarray((length,), dtype=np.uint64, buffer=shm.buf)
+
+def _run_pool_task(task):
+    ## one unit of pool work: a generated-pattern run or a replay of a shared trace, tagged with its index
+    run_index, kind, payload, cache_config, seed, random_options = task
+    if(kind == 'pattern'):
+        return run_index, run_single_simulation(payload, cache_config, seed, random_options)
+
+    try:
+        addresses = _attach_shared_trace(payload)
+        cache = CacheSimulator(**cache_config)
+        for first in range(0, addresses.size, SIMULATION_CHUNK_SIZE):
+            cache.access_many(addresses[first:first + SIMULATION_CHUNK_SIZE])
+        return run_index, cache.get_miss_rate()
+    except Exception:
+        return run_index, float('nan')
+
+class SimulationPool:
+    """
+    A worker pool created once and reused for a whole sweep.
+
+    Runs are handed out with imap_unordered and come back in completion order, but results are returned
+    in run order and run i always gets run_seed(base_seed, i), so a sweep is bit-reproducible no matter
+    how many processes execute it, which pool runs it or what earlier run() calls on the pool did
+    (repeating a run() call repeats its results). Large fixed traces are placed once in
+    multiprocessing.shared_memory with share_trace() and read in place by the workers instead of being
+    pickled per task.
+    """
+
+    def __init__(self, processes=None, base_seed=0):
+        self.processes = processes or multiprocessing.cpu_count()
+        self.base_seed = base_seed
+        self._pool = multiprocessing.Pool(processes=self.processes)
+        self._shared = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def share_trace(self, addresses):
+        """Copies a trace into shared memory once. Returns a handle to pass to run_trace()."""
+        addresses = np.ascontiguousarray(addresses, dtype=np.uint64).ravel()
+        shm = shared_memory.SharedMemory(create=True, size=max(addresses.nbytes, 1))
+        np.ndarray(addresses.shape, dtype=np.uint64, buffer=shm.buf)[:] = addresses
+        self._shared.append(shm)
+        return (shm.name, addresses.size)
+
+    def _collect(self, tasks, progress):
+        ## results come back in task order, whatever run indices the tasks carry
+        positions = {task[0]: position for position, task in enumerate(tasks)}
+        results = [float('nan')] * len(tasks)
+        for done, (run_index, result) in enumerate(self._pool.imap_unordered(_run_pool_task, tasks), start=1):
+            results[positions[run_index]] = result
+            if(progress is not None):
+                progress(done, len(tasks), run_index, result)
+        return results
+
+    def run(self, run_args_list, cache_config, progress=None, random_options=None, store=None):
+        """
+        Runs run_single_simulation for every run_args tuple in parallel.
+
+        Args:
+            run_args_list (list): run_args tuples, see run_single_simulation.
+            cache_config (dict): Cache parameters shared by every run.
+            progress (callable): Optional progress(done, total, run_index, miss_rate), called as runs finish.
+            random_options (dict): Passed to run_single_simulation for random runs.
+            store (ResultStore): Optional result_store.ResultStore, runs it already holds are not simulated again
+                                 and fresh results are added to it.
+
+        Returns:
+            list: Miss rates in the same order as run_args_list.
+        """
+        seeds = spawn_run_seeds(self.base_seed, len(run_args_list))
+        tasks = [(i, 'pattern', run_args, cache_config, seeds[i], random_options) for i, run_args in enumerate(run_args_list)]
+        if(store is None):
+            return self._collect(tasks, progress)
+
+        ## seeds are spawned before the lookup so a stored run keeps the seed it would have been simulated with
+        keys = [store.simulation_key(run_args, cache_config, seeds[i], random_options) for i, run_args in enumerate(run_args_list)]
+        stored = [store.get(key) for key in keys]
+        pending = [task for task, value in zip(tasks, stored) if value is None]
+        fresh = self._collect(pending, progress) if pending else []
+
+        results = list(stored)
+        for task, result in zip(pending, fresh):
+            run_index = task[0]
+            results[run_index] = result
+            if(not math.isnan(result)):
+                store.put(keys[run_index], result, {'run_args': task[2], 'run_index': run_index})
+        return results
+
+    def run_trace(self, trace_handle, cache_configs, progress=None):
+        """Replays one shared trace through every cache configuration in parallel, miss rates in config order."""
+        tasks = [(i, 'trace', trace_handle, config, None, None) for i, config in enumerate(cache_configs)]
+        return self._collect(tasks, progress)
+
+    def close(self):
+        self._pool.close()
+        self._pool.join()
+        for shm in self._shared:
+            shm.close()
+            shm.unlink()
+        self._shared = []
+
+SYSFS_CPU_ROOT = '/sys/devices/system/cpu'
+
+def _parse_sysfs_size(text):
+    ## sysfs sizes look like "48K", "2048K" or "32M"
+    text = text.strip().upper()
+    multiplier = {'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3}.get(text[-1:], 1)
+    return int(text.rstrip('KMG')) * multiplier
+
+def read_sysfs_caches(cpu_root=SYSFS_CPU_ROOT):
+    """
+    Reads every cpu*/cache/index* directory under cpu_root, no subprocess needed.
+
+    Returns:
+        list: One dict per distinct cache (level, type, size_bytes, ways, line_size, sets, instances, first_cpu), sorted
+              by level with data caches ahead of instruction ones. instances counts how many copies exist (per core,
+              per cluster...), told apart by shared_cpu_list. first_cpu is the lowest cpu number that has it, hybrid
+              CPUs list one entry per core type at the same level (P-core and E-core L2s).
+    """
+    caches = {}
+    cpu_names = sorted((name for name in os.listdir(cpu_root) if re.fullmatch(r'cpu\d+', name)),
+                       key=lambda name: int(name[3:]))
+    for cpu_name in cpu_names:
+        cache_dir = os.path.join(cpu_root, cpu_name, 'cache')
+        if(not os.path.isdir(cache_dir)):
+            continue
+        for index_name in sorted(os.listdir(cache_dir)):
+            if(not index_name.startswith('index')):
+                continue
+            fields = {}
+            for field in ('level', 'type', 'size', 'ways_of_associativity', 'coherency_line_size', 'number_of_sets',
+                          'shared_cpu_list'):
+                try:
+                    with open(os.path.join(cache_dir, index_name, field)) as f:
+                        fields[field] = f.read().strip()
+                except OSError:
+                    pass
+            if('level' not in fields or 'size' not in fields):
+                continue
+            entry = {
+                'level': int(fields['level']),
+                'type': fields.get('type', 'Unified'),
+                'size_bytes': _parse_sysfs_size(fields['size']),
+                'ways': int(fields.get('ways_of_associativity') or 0),
+                'line_size': int(fields.get('coherency_line_size') or 0),
+                'sets': int(fields.get('number_of_sets') or 0),
+            }
+            kind = tuple(entry.values())
+            _, sharers, cpus = caches.setdefault(kind, (entry, set(), set()))
+            sharers.add(fields.get('shared_cpu_list', cpu_name))
+            cpus.add(int(cpu_name[3:]))
+
+    type_order = {'Data': 0, 'Unified': 1, 'Instruction': 2}
+    result = []
+    for entry, sharers, cpus in caches.values():
+        entry['instances'] = len(sharers)
+        entry['first_cpu'] = min(cpus)
+        result.append(entry)
+    return sorted(result, key=lambda entry: (entry['level'], type_order.get(entry['type'], 3), entry['first_cpu']))
+
+def _detect_linux_caches():
+    levels = read_sysfs_caches()
+    if(not levels):
+        raise FileNotFoundError(f"No cache information under {SYSFS_CPU_ROOT}")
+    keys = {(1, 'Data'): 'l1d', (1, 'Instruction'): 'l1i', (2, 'Unified'): 'l2', (3, 'Unified'): 'l3'}
+    all_sizes = {"l1i": [], "l1d": [], "l2": [], "l3": []}
+    cache_details = f"Read from {SYSFS_CPU_ROOT}/cpu*/cache/index*:\n"
+    for entry in levels:
+        key = keys.get((entry['level'], entry['type']))
+        if(key is None and entry['level'] in (2, 3)):
+            key = f"l{entry['level']}"
+        if(key is not None):
+            all_sizes[key] = sorted(set(all_sizes[key] + [entry['size_bytes']]))
+        cache_details += (f"   - L{entry['level']} {entry['type']}: {entry['size_bytes']:,} bytes, {entry['ways']}-way, "
+                          f"{entry['line_size']} B lines, {entry['sets']} sets, x{entry['instances']}\n")
+    return levels, all_sizes, cache_details
+
+## get_system_cache_info() result, filled on the first call so detection runs once per process
+_system_cache_info = None
+
 def get_system_cache_info():
-    """Attempts to detect OS and retrieve L2/L3 cache size. I switch between Darwin and Windows."""
+    """
+    Attempts to detect OS and retrieve L2/L3 cache size. I switch between Linux (sysfs), Darwin and Windows.
+    Detection runs once per process, later calls get the same answer back.
+    'levels' holds the full per-cache detail (ways, line size, sets) where the OS exposes it, see read_sysfs_caches.
+    """
+    global _system_cache_info
+    if(_system_cache_info is None):
+        _system_cache_info = _detect_system_cache_info()
+    ## a deep copy, callers changing the nested levels must not change what later calls get back
+    return copy.deepcopy(_system_cache_info)
+
+def _detect_system_cache_info():
     os_name = platform.system()
     l2_l3_size_bytes = 16 * 1024 * 1024 
     method = f"Default placeholder ({l2_l3_size_bytes:,} bytes)"
     cache_details = "Could not automatically determine L1/L2/L3 cache sizes."
     all_sizes = {"l1i": [], "l1d": [], "l2": [], "l3": []}
+    levels = []
 
     logging.info(f"Detected OS: {os_name}")
 
     try:
-        if(os_name == "Darwin"):
+        if(os_name == "Linux"):
+            method = f"Attempted via sysfs ({SYSFS_CPU_ROOT}) on Linux."
+            levels, all_sizes, cache_details = _detect_linux_caches()
+            all_found_sizes = all_sizes["l2"] + all_sizes["l3"]
+            if(all_found_sizes):
+                l2_l3_size_bytes = max(all_found_sizes)
+                method = f'Detected max L2/L3 cache size via sysfs ({l2_l3_size_bytes:,} bytes).'
+            else:
+                method += ' No L2/L3 cache listed, using default.'
+
+        elif(os_name == "Darwin"):
             method = "Attempted via `sysctl` on macOS."
             cmd = ["sysctl", "-a"]
             process = subprocess.run(cmd, capture_output=True, text=True, check=True)
@@ -316,7 +1225,7 @@ def get_system_cache_info():
             cache_details = f"Automatic detection not implemented for {os_name}."
 
     except FileNotFoundError:
-        method = f"Command for {os_name} not found, using default placeholder."
+        method = f"Command or sysfs entries for {os_name} not found, using default placeholder."
         cache_details = f"Could not execute system command to find cache size."
     except subprocess.CalledProcessError as e:
         method = f"Command for {os_name} failed (Error {e.returncode}), using default placeholder."
@@ -330,193 +1239,60 @@ def get_system_cache_info():
         "l2_l3_size_bytes": l2_l3_size_bytes, 
         "method": method,
         "details": cache_details,
-        "all_sizes": all_sizes
-    }
-
-if(__name__ == "__main__"):
-    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
-    logging.info("Starting cache simulation script.")
-
-    system_info = get_system_cache_info()
-    detected_os = system_info["os"]
-    l2_l3_detection_method = system_info["method"]
-    cache_detection_details = system_info["details"]
-    parsed_cache_sizes = system_info["all_sizes"]
-
-    L1_CACHE_SIZE_BYTES = 4096
-    BLOCK_SIZE_BYTES = 64 
-    ASSOCIATIVITY = 8 
-    START_ADDRESS = 0x10000000 
-    L2_L3_CACHE_SIZE_BYTES = system_info["l2_l3_size_bytes"] 
-    NUM_RANDOM_RUNS = 30
-    ADDRESS_SIZE_BITS = 64
-    NUM_PROCESSES = multiprocessing.cpu_count() 
-
-    data_types = {
-        'char': {'size': 1}, 
-        'short': {'size': 2}, 
-        'int': {'size': 4}, 
-        'long': {'size': 8}
-    }
-    
-    cache_config_dict = {
-        'cache_size_bytes': L1_CACHE_SIZE_BYTES, 
-        'block_size_bytes': BLOCK_SIZE_BYTES,
-        'associativity': ASSOCIATIVITY,
-        'address_size_bits': ADDRESS_SIZE_BITS
+        "all_sizes": all_sizes,
+        "levels": levels
     }
 
-    logging.info("--- Cache Configuration ---")
-    logging.info(f"Detected OS: {detected_os}")
-    logging.info(f"L2/L3 Size Determination: {l2_l3_detection_method}")
-    logging.info(f" >> Size used for simulation: {L2_L3_CACHE_SIZE_BYTES:,} bytes")
-    logging.info(f"Simulated L1 Cache Size: {L1_CACHE_SIZE_BYTES} bytes")
-    logging.info(f"Simulated L1 Block Size: {BLOCK_SIZE_BYTES} bytes")
-    logging.info(f"Simulated L1 Associativity: {ASSOCIATIVITY}-way")
-    try:
-         dummy_cache = CacheSimulator(**cache_config_dict)
-         logging.info(f"Simulated L1 Number of Sets: {dummy_cache.num_sets}")
-    except ValueError as e:
-         logging.error(f"  Error initializing dummy cache for config print: {e}")
-         logging.info(f"Simulated L1 Number of Sets: Error in config") 
-    logging.info(f"Simulated Start Address: {START_ADDRESS:x}")
-    logging.info(f"Parallel Processes: {NUM_PROCESSES}")
-    logging.info("-"*20)
-
-    results = {}
-
-    for name, properties in data_types.items():
-        logging.info(f"Starting simulation for data type: {name} (size: {properties['size']} bytes)")
-        data_size = properties['size']
-        results[name] = {'row_major': float('nan'), 'col_major': float('nan'), 'random': float('nan')}
-        
-        rows, cols = 0, 0
-        total_elements = 0
-        
-        if(name == 'char'):
-            rows, cols = 64, 64 
-            total_elements = rows * cols
-        elif(name == 'int'):
-            rows, cols = 32, 32 
-            total_elements = rows * cols
-        elif(name == 'short' or name == 'long'):
-            total_elements = L2_L3_CACHE_SIZE_BYTES // data_size
-            if(total_elements <= 0):
-                 logging.warning(f"L2/L3 cache size too small for data type {name}. Skipping.")
-                 continue
-            rows = int(math.sqrt(total_elements))
-            while(rows > 0 and total_elements % rows != 0):
-                 rows -= 1
-            if(rows == 0):
-                 logging.warning(f"Could not find suitable integer dimensions for {total_elements} elements. Skipping {name}.")
-                 continue
-            cols = total_elements // rows
-        else:
-            logging.warning(f"Unknown data type {name}. Skipping.")
-            continue
+def system_cache_configs(levels=None):
+    """
+    CacheSimulator parameters for each detected data/unified cache level, L1 first.
 
-        total_bytes = rows * cols * data_size
-        if(rows <= 0 or cols <= 0):
-             logging.warning(f"Invalid dimensions ({rows}x{cols}) calculated for {name}. Skipping.")
-             continue
-        logging.info(f"  Array Dimensions: {rows} x {cols} ({total_elements:,} elements, {total_bytes:,} bytes total)")
+    Set counts that aren't a power of two (sliced last-level caches, e.g. 114688 sets) can't be indexed with a bit
+    field, those levels keep their ways and line size with the set count rounded to the nearest power of two
+    (114688 sets become 131072) and are flagged 'approximate', compare cache_size_bytes with detected_size_bytes.
+    Hybrid CPUs list several caches per level (P-core and E-core L2s), only the one serving the lowest numbered
+    cpu (cpu0's) is kept for each level and type, so every entry is a separate level of one core's hierarchy.
 
-        base_args = (START_ADDRESS, rows, cols, data_size)
-        random_access_start_addr = START_ADDRESS + L2_L3_CACHE_SIZE_BYTES // 2
-        random_access_range_bytes = L2_L3_CACHE_SIZE_BYTES
-        num_accesses_per_run = rows * cols
+    Args:
+        levels (list): read_sysfs_caches()-style entries, the detected ones by default.
 
-        logging.info("    Simulating Row Major Access...")
-        row_major_args = ('row_major',) + base_args + (0, 0) 
-        worker_func = partial(run_single_simulation, cache_config=cache_config_dict)
-        try:
-             temp_cache = CacheSimulator(**cache_config_dict)
-             row_major_addresses = generate_row_major_addresses(START_ADDRESS, rows, cols, data_size)
-             if(row_major_addresses):
-                 for addr in row_major_addresses:
-                     temp_cache.access(addr)
-                 results[name]['row_major'] = temp_cache.get_miss_rate()
-             else:
-                 results[name]['row_major'] = 0.0
-             logging.info(f"      Row Major Miss Rate: {results[name]['row_major']:.4f}")
-        except Exception as e:
-            logging.error(f"      Error during row major simulation: {e}")
-            
+    Returns:
+        list: Dicts with level, cache_size_bytes, block_size_bytes, associativity, detected_size_bytes and approximate.
+    """
+    if(levels is None):
+        levels = get_system_cache_info()["levels"]
+    configs = []
+    chosen = {}
+    for entry in sorted(levels, key=lambda entry: entry.get('first_cpu', 0)):
+        chosen.setdefault((entry['level'], entry['type']), entry)
+    for entry in levels:
+        if(chosen[(entry['level'], entry['type'])] is not entry):
+            continue
+        if(entry['type'] == 'Instruction' or not entry['ways'] or not entry['line_size']):
+            continue
+        sets = entry['sets'] or entry['size_bytes'] // (entry['ways'] * entry['line_size'])
+        if(sets <= 0):
+            continue
+        simulated_sets = 1 << (sets.bit_length() - 1)
+        if(sets - simulated_sets > 2 * simulated_sets - sets):
+            simulated_sets *= 2
+        configs.append({
+            'level': entry['level'],
+            'cache_size_bytes': simulated_sets * entry['ways'] * entry['line_size'],
+            'block_size_bytes': entry['line_size'],
+            'associativity': entry['ways'],
+            'detected_size_bytes': entry['size_bytes'],
+            'approximate': simulated_sets != sets,
+        })
+    return configs
 
-        logging.info("    Simulating Column Major Access...")
-        col_major_args = ('col_major',) + base_args + (0, 0)
-        try:
-             temp_cache = CacheSimulator(**cache_config_dict)
-             col_major_addresses = generate_col_major_addresses(START_ADDRESS, rows, cols, data_size)
-             if(col_major_addresses):
-                 for addr in col_major_addresses:
-                     temp_cache.access(addr)
-                 results[name]['col_major'] = temp_cache.get_miss_rate()
-             else:
-                 results[name]['col_major'] = 0.0
-             logging.info(f"      Col Major Miss Rate: {results[name]['col_major']:.4f}")
-        except Exception as e:
-            logging.error(f"      Error during column major simulation: {e}")
-
-
-        logging.info(f"    Simulating Random Access ({NUM_RANDOM_RUNS} runs, parallel)...")
-        random_run_args_list = [
-            ('random', random_access_start_addr, rows, cols, data_size, 
-             random_access_range_bytes, num_accesses_per_run)
-            for _ in range(NUM_RANDOM_RUNS)
-        ]
-        
-        random_miss_rates = []
-        try:
-            logging.info(f"      Starting parallel pool with {NUM_PROCESSES} processes...")
-            with multiprocessing.Pool(processes=NUM_PROCESSES) as pool:
-                worker_func = partial(run_single_simulation, cache_config=cache_config_dict)
-                random_miss_rates = pool.map(worker_func, random_run_args_list)
-            logging.info(f"      Parallel pool finished.")
-        except Exception as e:
-             logging.error(f"      Error during parallel random simulation: {e}")
-
-        valid_random_rates = [r for r in random_miss_rates if isinstance(r, (int, float)) and not math.isnan(r)]
-        if(valid_random_rates):
-             avg_random_miss_rate = sum(valid_random_rates) / len(valid_random_rates)
-             results[name]['random'] = avg_random_miss_rate
-        else:
-             logging.warning(f"      No valid results obtained from parallel random runs for {name}.")
-
-        logging.info(f"      Average Random Miss Rate: {results[name]['random']:.4f}")
-        logging.info("-"*10)
-
-    logging.info("--- Final Miss Rate Report --- Generating Table --- ")
-    header1 = "L1 Cache Config: {:,} bytes, {} bytes/block, {}-way associative".format(
-        L1_CACHE_SIZE_BYTES, BLOCK_SIZE_BYTES, ASSOCIATIVITY
-    )
-    header2 = "Start Address: {:x}".format(START_ADDRESS)
-    header3 = "Array Size for short/long matched L2/L3 Size: {:,} bytes ({})".format(
-        L2_L3_CACHE_SIZE_BYTES, l2_l3_detection_method
-    )
-    header4 = "Random Access Range: Offset +{:,} bytes, Size {:,} bytes".format(
-        L2_L3_CACHE_SIZE_BYTES // 2, L2_L3_CACHE_SIZE_BYTES
-    )
-    separator = "="*65
-    table_header = "{:<10} | {:<15} | {:<15} | {:<15}".format("Data Type", "Row Major MR", "Col Major MR", "Random MR")
-    table_separator = "-" * 65
-    
-    table_lines = [header1, header2, header3, header4, separator, table_header, table_separator]
-    
-    for name in data_types.keys():
-        rm_mr = results.get(name, {}).get('row_major', float('nan'))
-        cm_mr = results.get(name, {}).get('col_major', float('nan'))
-        rand_mr = results.get(name, {}).get('random', float('nan'))
-
-        rm_str = f"{rm_mr:.4f}" if isinstance(rm_mr, (int, float)) and not math.isnan(rm_mr) else "N/A"
-        cm_str = f"{cm_mr:.4f}" if isinstance(cm_mr, (int, float)) and not math.isnan(cm_mr) else "N/A"
-        rand_str = f"{rand_mr:.4f}" if isinstance(rand_mr, (int, float)) and not math.isnan(rand_mr) else "N/A"
-        table_lines.append("{:<10} | {:<15} | {:<15} | {:<15}".format(name, rm_str, cm_str, rand_str))
-        
-    table_lines.append(separator)
-    
-    print("\n".join(table_lines))
-    logging.info("Script finished.")
+if(__name__ == "__main__"):
+    ## the assignment's experiment (char/short/int/long arrays, row/col major and 30 seeded random runs on a
+    ## 4K/64B/8-way L1) lives in sweep_assignment.json, sweep.py runs it, resumes it and prints the table.
+    ## Extra arguments go to sweep.py, e.g. --output or --processes
+    import sweep
+    sys.argv = [sweep.__file__, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'sweep_assignment.json')] + sys.argv[1:]
+    sweep.main()
 
 """
 ==============================================================================
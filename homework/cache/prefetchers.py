@@ -0,0 +1,215 @@
+from collections import deque
+
+class Prefetcher:
+    """
+    Base class for CacheSimulator prefetchers. Blocks are cache block numbers (address >> offset bits).
+
+    After every demand access the cache calls on_access(block, hit, prefetch_hit), prefetch_hit meaning the access
+    was the first use of a prefetched block, and fills every block it returns into the cache as a prefetch
+    (blocks already present are skipped). Prefetchers that keep blocks outside the cache (stream buffers) set
+    holds_blocks = True: on a demand miss the cache first calls claim(block), and a True answer moves the block
+    into the cache without a memory access. Such prefetchers count the blocks they fetch in `issued` and the ones
+    they throw away unused in `discarded`, the cache turns both into traffic and useless-prefetch statistics.
+    """
+    name = None
+    holds_blocks = False
+
+    def __init__(self):
+        self.issued = 0
+        self.discarded = 0
+
+    def on_access(self, block, hit, prefetch_hit):
+        return None
+
+    def claim(self, block):
+        return False
+
+    def pending_blocks(self):
+        """Blocks fetched into the prefetcher itself that are still waiting for a demand access."""
+        return 0
+
+    def reset(self):
+        self.issued = 0
+        self.discarded = 0
+
+class NextLinePrefetcher(Prefetcher):
+    """
+    Tagged next-N-line prefetching: a miss, or the first use of a prefetched block, fetches the `degree` blocks after it,
+    so a sequential stream stays `degree` blocks ahead after its first miss.
+    """
+    name = 'next-line'
+
+    def __init__(self, degree=1):
+        super().__init__()
+        if(degree <= 0):
+            raise ValueError("Prefetch degree must be positive.")
+        self.degree = degree
+        self.offsets = range(1, degree + 1)
+
+    def on_access(self, block, hit, prefetch_hit):
+        if(hit and not prefetch_hit):
+            return None
+        return [block + offset for offset in self.offsets]
+
+class StridePrefetcher(Prefetcher):
+    """
+    PC-less stride detection on the miss (and prefetch-hit) stream.
+    A small LRU table tracks up to `table_size` streams, each (last block, stride, confidence). An access continuing
+    a stream's stride raises its confidence, one within `max_distance` blocks of a stream's last block retrains its stride,
+    anything else starts a new stream. Streams seen with the same stride `threshold` times in a row prefetch
+    `degree` strides ahead. Column-major traversal is a single stream with a stride of one row.
+    """
+    name = 'stride'
+
+    def __init__(self, degree=2, table_size=16, threshold=2, max_distance=1 << 16):
+        super().__init__()
+        if(degree <= 0 or table_size <= 0):
+            raise ValueError("Prefetch degree and stride table size must be positive.")
+        self.degree = degree
+        self.table_size = table_size
+        self.threshold = threshold
+        self.max_distance = max_distance
+        ## most recently used last, entries are [last block, stride, confidence]
+        self.streams = []
+
+    def on_access(self, block, hit, prefetch_hit):
+        if(hit and not prefetch_hit):
+            return None
+        streams = self.streams
+        match = None
+        nearest = None
+        nearest_distance = self.max_distance + 1
+        for stream in streams:
+            delta = block - stream[0]
+            if(delta == stream[1] and delta):
+                match = stream
+                break
+            if(0 < abs(delta) < nearest_distance):
+                nearest = stream
+                nearest_distance = abs(delta)
+
+        if(match is not None):
+            match[0] = block
+            match[2] += 1
+        elif(nearest is not None):
+            match = nearest
+            match[1] = block - match[0]
+            match[0] = block
+            match[2] = 1
+        else:
+            match = [block, 0, 0]
+            if(len(streams) == self.table_size):
+                streams.pop(0)
+            streams.append(match)
+            return None
+        streams.remove(match)
+        streams.append(match)
+
+        if(match[2] < self.threshold):
+            return None
+        stride = match[1]
+        return [block + stride * k for k in range(1, self.degree + 1) if block + stride * k >= 0]
+
+    def reset(self):
+        super().reset()
+        self.streams = []
+
+class StreamBufferPrefetcher(Prefetcher):
+    """
+    Jouppi stream buffers: `num_buffers` FIFOs of `depth` sequential blocks kept beside the cache, so prefetches
+    never evict demand data. A miss that matches a buffered block takes it (blocks ahead of it in that buffer are
+    dropped) and the buffer refills to depth, a miss that matches nothing reallocates the least recently used
+    buffer to the blocks after it.
+    """
+    name = 'stream-buffer'
+    holds_blocks = True
+
+    def __init__(self, num_buffers=4, depth=4):
+        super().__init__()
+        if(num_buffers <= 0 or depth <= 0):
+            raise ValueError("Stream buffer count and depth must be positive.")
+        self.num_buffers = num_buffers
+        self.depth = depth
+        ## most recently used last
+        self.buffers = []
+
+    def claim(self, block):
+        for buffer in self.buffers:
+            if(block in buffer):
+                while(buffer[0] != block):
+                    buffer.popleft()
+                    self.discarded += 1
+                buffer.popleft()
+                next_block = buffer[-1] + 1 if buffer else block + 1
+                while(len(buffer) < self.depth):
+                    buffer.append(next_block)
+                    next_block += 1
+                    self.issued += 1
+                self.buffers.remove(buffer)
+                self.buffers.append(buffer)
+                return True
+        return False
+
+    def on_access(self, block, hit, prefetch_hit):
+        if(hit):
+            return None
+        if(len(self.buffers) == self.num_buffers):
+            self.discarded += len(self.buffers.pop(0))
+        self.buffers.append(deque(range(block + 1, block + 1 + self.depth)))
+        self.issued += self.depth
+        return None
+
+    def pending_blocks(self):
+        return sum(len(buffer) for buffer in self.buffers)
+
+    def reset(self):
+        super().reset()
+        self.buffers = []
+
+PREFETCHERS = {prefetcher.name: prefetcher for prefetcher in (NextLinePrefetcher, StridePrefetcher, StreamBufferPrefetcher)}
+
+def make_prefetcher(prefetcher):
+    """None, a name in PREFETCHERS (default settings), a Prefetcher subclass, or a configured instance (which is reset)."""
+    if(prefetcher is None):
+        return None
+    if(isinstance(prefetcher, Prefetcher)):
+        prefetcher.reset()
+        return prefetcher
+    if(isinstance(prefetcher, type) and issubclass(prefetcher, Prefetcher)):
+        return prefetcher()
+    if(prefetcher not in PREFETCHERS):
+        raise ValueError(f"Unsupported prefetcher: {prefetcher}")
+    return PREFETCHERS[prefetcher]()
+
+def main():
+    ## imported here, cache_simulator itself imports this module
+    import time
+    from cache_simulator import CacheSimulator, iter_row_major_addresses, iter_col_major_addresses, SIMULATION_CHUNK_SIZE
+
+    start_address = 0x10000000
+    rows, cols = 1024, 1024
+    cache_config = {'cache_size_bytes': 32 * 1024, 'block_size_bytes': 64, 'associativity': 8}
+    print(f"{rows} x {cols} arrays, {cache_config['cache_size_bytes'] // 1024}K/{cache_config['block_size_bytes']}B/"
+          f"{cache_config['associativity']}w, traffic relative to no prefetching")
+    print("{:<10} | {:<5} | {:<13} | {:>9} | {:>9} | {:>9} | {:>8} | {:>7} | {:>6}".format(
+        "Pattern", "Type", "Prefetcher", "Miss rate", "Issued", "Useful", "Accuracy", "Traffic", "Time s"))
+    print("-" * 98)
+    for name, make_chunks in (('row_major', iter_row_major_addresses), ('col_major', iter_col_major_addresses)):
+        for type_name, data_size in (('short', 2), ('long', 8)):
+            chunks = list(make_chunks(start_address, rows, cols, data_size, SIMULATION_CHUNK_SIZE))
+            baseline_bytes = None
+            for prefetcher in [None] + list(PREFETCHERS):
+                cache = CacheSimulator(**cache_config, prefetcher=prefetcher)
+                start = time.perf_counter()
+                for chunk in chunks:
+                    cache.access_many(chunk)
+                elapsed = time.perf_counter() - start
+                stats = cache.get_prefetch_stats()
+                traffic = cache.get_write_traffic()['bytes_from_next_level']
+                baseline_bytes = baseline_bytes or traffic
+                print("{:<10} | {:<5} | {:<13} | {:>9.4f} | {:>9,} | {:>9,} | {:>8.1%} | {:>6.2f}x | {:>6.2f}".format(
+                    name, type_name, prefetcher or "none", cache.get_miss_rate(), stats['issued'], stats['useful'],
+                    stats['accuracy'], traffic / baseline_bytes, elapsed))
+
+if(__name__ == "__main__"):
+    main()
@@ -0,0 +1,185 @@
+import random
+from collections import OrderedDict
+
+class ReplacementPolicy:
+    """
+    Base class for CacheSimulator replacement policies.
+
+    Lines are identified by their global index in the cache storage (set_index * associativity + way).
+    Call order per access:
+        hit  -> on_hit(set_index, line)
+        miss -> on_fill(set_index, line) when the cache filled an invalid way,
+                replace(set_index) when the set is full, which picks the victim and records the refill
+                of that same line in one call (one call per miss keeps the steady-state miss path cheap)
+    and on_invalidate(set_index, line) whenever a line is dropped without being replaced.
+    Policies that ignore hits set updates_on_hit = False so the cache can skip the call entirely.
+    """
+    name = None
+    updates_on_hit = True
+
+    def __init__(self, num_sets, associativity, seed=None):
+        self.num_sets = num_sets
+        self.associativity = associativity
+
+    def on_hit(self, set_index, line):
+        pass
+
+    def on_fill(self, set_index, line):
+        pass
+
+    def on_invalidate(self, set_index, line):
+        pass
+
+    def replace(self, set_index):
+        raise NotImplementedError
+
+class LRUPolicy(ReplacementPolicy):
+    """Exact LRU, an OrderedDict of lines per set from least to most recently used, every operation O(1)."""
+    name = 'LRU'
+
+    def __init__(self, num_sets, associativity, seed=None):
+        super().__init__(num_sets, associativity, seed)
+        self.order = [OrderedDict() for _ in range(num_sets)]
+
+    def on_hit(self, set_index, line):
+        self.order[set_index].move_to_end(line)
+
+    def on_fill(self, set_index, line):
+        self.order[set_index][line] = None
+
+    def on_invalidate(self, set_index, line):
+        self.order[set_index].pop(line, None)
+
+    def replace(self, set_index):
+        ## the LRU line becomes the MRU one since it is refilled straight away
+        order = self.order[set_index]
+        line = next(iter(order))
+        order.move_to_end(line)
+        return line
+
+class FIFOPolicy(LRUPolicy):
+    """First-in first-out, LRU's insertion order without the reordering on hits."""
+    name = 'FIFO'
+    updates_on_hit = False
+
+    def on_hit(self, set_index, line):
+        pass
+
+class RandomPolicy(ReplacementPolicy):
+    """Uniformly random victim, seedable for reproducible runs."""
+    name = 'Random'
+    updates_on_hit = False
+
+    def __init__(self, num_sets, associativity, seed=None):
+        super().__init__(num_sets, associativity, seed)
+        self.rng = random.Random(seed)
+
+    def replace(self, set_index):
+        return set_index * self.associativity + self.rng.randrange(self.associativity)
+
+class TreePLRUPolicy(ReplacementPolicy):
+    """
+    Tree pseudo-LRU, associativity - 1 bits per set arranged as a binary tree.
+    Each bit points toward the half that was used less recently, touching a way flips the bits on its path away from it.
+    The (node, bit) path for each way is precomputed so updates are log2(associativity) byte stores.
+    """
+    name = 'PLRU'
+
+    def __init__(self, num_sets, associativity, seed=None):
+        if(associativity & (associativity - 1)):
+            raise ValueError("Tree PLRU needs a power-of-two associativity.")
+        super().__init__(num_sets, associativity, seed)
+        self.nodes_per_set = max(associativity - 1, 1)
+        self.bits = bytearray(num_sets * self.nodes_per_set)
+        self.depth = associativity.bit_length() - 1
+
+        ## for each way, the tree nodes on its path and the bit value that points away from it
+        self.paths = []
+        for way in range(associativity):
+            path = []
+            node = 0
+            for level in range(self.depth):
+                went_right = (way >> (self.depth - 1 - level)) & 1
+                path.append((node, 0 if went_right else 1))
+                node = 2 * node + 1 + went_right
+            self.paths.append(path)
+
+    def on_hit(self, set_index, line):
+        bits = self.bits
+        base = set_index * self.nodes_per_set
+        for node, value in self.paths[line - set_index * self.associativity]:
+            bits[base + node] = value
+
+    on_fill = on_hit
+
+    def replace(self, set_index):
+        bits = self.bits
+        base = set_index * self.nodes_per_set
+        node = 0
+        way = 0
+        for _ in range(self.depth):
+            go_right = bits[base + node]
+            way = (way << 1) | go_right
+            node = 2 * node + 1 + go_right
+        line = set_index * self.associativity + way
+        self.on_hit(set_index, line)
+        return line
+
+class SRRIPPolicy(ReplacementPolicy):
+    """
+    Static re-reference interval prediction (Jaleel et al., ISCA 2010) with 2-bit RRPVs.
+    Hits predict near re-reference (0), fills predict long (max - 1), the victim is the first line predicted distant (max),
+    aging the whole set when none is.
+    """
+    name = 'SRRIP'
+    rrpv_bits = 2
+
+    def __init__(self, num_sets, associativity, seed=None):
+        super().__init__(num_sets, associativity, seed)
+        self.max_rrpv = (1 << self.rrpv_bits) - 1
+        self.rrpv = bytearray([self.max_rrpv]) * (num_sets * associativity)
+
+    def on_hit(self, set_index, line):
+        self.rrpv[line] = 0
+
+    def on_fill(self, set_index, line):
+        self.rrpv[line] = self.max_rrpv - 1
+
+    def replace(self, set_index):
+        rrpv = self.rrpv
+        base = set_index * self.associativity
+        end = base + self.associativity
+        line = rrpv.find(self.max_rrpv, base, end)
+        if(line == -1):
+            ## age every line by the same amount in one go, instead of looping +1 until one hits max
+            age = self.max_rrpv - max(rrpv[base:end])
+            rrpv[base:end] = bytes(value + age for value in rrpv[base:end])
+            line = rrpv.find(self.max_rrpv, base, end)
+        self.on_fill(set_index, line)
+        return line
+
+class BRRIPPolicy(SRRIPPolicy):
+    """Bimodal RRIP, fills predict distant (max) except for 1 in `long_interval_odds` that predict long (max - 1)."""
+    name = 'BRRIP'
+    long_interval_odds = 32
+
+    def __init__(self, num_sets, associativity, seed=None):
+        super().__init__(num_sets, associativity, seed)
+        self.rng = random.Random(seed)
+
+    def on_fill(self, set_index, line):
+        if(self.rng.randrange(self.long_interval_odds) == 0):
+            self.rrpv[line] = self.max_rrpv - 1
+        else:
+            self.rrpv[line] = self.max_rrpv
+
+REPLACEMENT_POLICIES = {policy.name: policy for policy in
+                        (LRUPolicy, FIFOPolicy, RandomPolicy, TreePLRUPolicy, SRRIPPolicy, BRRIPPolicy)}
+
+def make_replacement_policy(policy, num_sets, associativity, seed=None):
+    """Instantiates a policy given its name in REPLACEMENT_POLICIES or a ReplacementPolicy subclass."""
+    if(isinstance(policy, type) and issubclass(policy, ReplacementPolicy)):
+        return policy(num_sets, associativity, seed)
+    if(policy not in REPLACEMENT_POLICIES):
+        raise ValueError(f"Unsupported replacement policy: {policy}")
+    return REPLACEMENT_POLICIES[policy](num_sets, associativity, seed)
@@ -0,0 +1,240 @@
+import os
+import time
+import json
+import sqlite3
+import hashlib
+import inspect
+import argparse
+
+import numpy as np
+
+from cache_simulator import CacheSimulator
+
+## bump whenever a simulator change alters results, every entry recorded under an older version then stops matching
+## 2: block run replay (access_runs) and prefetch traffic counted in bytes_from_next_level
+SIMULATOR_VERSION = 2
+
+DEFAULT_STORE_PATH = 'cache_results.sqlite'
+DEFAULT_MAX_ENTRIES = 100_000
+
+## bytes read per step while hashing a trace file
+FINGERPRINT_BLOCK_BYTES = 1 << 20
+
+def canonical_cache_config(cache_config):
+    """
+    The full CacheSimulator configuration a cache_config dict describes, with every omitted argument
+    filled in from the constructor defaults, so {'associativity': 8, ...} and the same dict with
+    replacement_policy='LRU' spelled out map to the same key.
+    """
+    defaults = {name: parameter.default for name, parameter in inspect.signature(CacheSimulator.__init__).parameters.items()
+                if name != 'self' and parameter.default is not inspect.Parameter.empty}
+    config = dict(defaults, **cache_config)
+    policy = config['replacement_policy']
+    config['replacement_policy'] = policy if isinstance(policy, str) else policy.name
+    prefetcher = config.pop('prefetcher')
+    ## left out when disabled so keys stored before prefetchers existed stay valid
+    if(prefetcher is not None):
+        config['prefetcher'] = _prefetcher_description(prefetcher)
+    return config
+
+def _prefetcher_description(prefetcher):
+    ## a name, or a configured instance as its name plus constructor arguments
+    if(isinstance(prefetcher, str)):
+        return prefetcher
+    if(isinstance(prefetcher, type)):
+        return prefetcher.name
+    arguments = [name for name in inspect.signature(type(prefetcher).__init__).parameters if name != 'self']
+    return {'name': prefetcher.name, **{name: getattr(prefetcher, name) for name in arguments}}
+
+def _seed_description(seed):
+    ## SeedSequence children differ only by spawn_key, so both have to be part of the key
+    if(isinstance(seed, np.random.SeedSequence)):
+        return {'entropy': seed.entropy, 'spawn_key': list(seed.spawn_key)}
+    if(seed is None or isinstance(seed, (int, np.integer))):
+        return None if seed is None else int(seed)
+    raise ValueError(f"Can't key a result on seed of type {type(seed).__name__}, use an int or a SeedSequence.")
+
+def _digest(description):
+    text = json.dumps(description, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(text.encode()).hexdigest()
+
+def trace_fingerprint(path):
+    """BLAKE2b content hash of a trace file, read in fixed-size blocks so any trace length is fine."""
+    digest = hashlib.blake2b(digest_size=20)
+    with open(path, 'rb') as f:
+        while True:
+            block = f.read(FINGERPRINT_BLOCK_BYTES)
+            if(not block):
+                break
+            digest.update(block)
+    return digest.hexdigest()
+
+class ResultStore:
+    """
+    On-disk cache of simulation results in a single SQLite file.
+
+    Entries are keyed by a hash of the full cache configuration plus the workload that ran through it:
+    the generator parameters and seed for the row/col/random patterns, or a content fingerprint for
+    trace files. Values are anything JSON can hold (usually a miss rate or a stats dict).
+    The store keeps at most max_entries results, evicting the least recently read or written ones.
+    Results recorded under another SIMULATOR_VERSION are never returned and can be dropped with prune(),
+    so a commit that changes what the simulator computes for the same key has to bump SIMULATOR_VERSION.
+    The entry count is read once on open and kept up to date by this object, so only one store object
+    should write to a file at a time.
+    """
+
+    def __init__(self, path=DEFAULT_STORE_PATH, max_entries=DEFAULT_MAX_ENTRIES):
+        if(max_entries <= 0):
+            raise ValueError("A result store needs room for at least one entry.")
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._db = sqlite3.connect(path)
+        self._db.execute("""CREATE TABLE IF NOT EXISTS results (
+                                key TEXT PRIMARY KEY, value TEXT NOT NULL, description TEXT NOT NULL,
+                                version INTEGER NOT NULL, created REAL NOT NULL, last_used REAL NOT NULL)""")
+        self._db.execute("CREATE INDEX IF NOT EXISTS results_last_used ON results (last_used)")
+        ## content hashes of trace files, only recomputed when the file's size or mtime changes
+        self._db.execute("""CREATE TABLE IF NOT EXISTS fingerprints (
+                                path TEXT PRIMARY KEY, size INTEGER NOT NULL, mtime_ns INTEGER NOT NULL,
+                                fingerprint TEXT NOT NULL)""")
+        self._db.commit()
+        self._count = self._db.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __len__(self):
+        return self._count
+
+    def make_key(self, cache_config, workload):
+        """
+        Key for one simulation.
+
+        Args:
+            cache_config (dict): CacheSimulator keyword arguments, missing ones take the constructor defaults.
+            workload (dict): Everything else that decides the result, e.g. {'run_args': ..., 'seed': ...}
+                             or {'trace': self.fingerprint(path)}. Must be JSON-serializable.
+
+        Returns:
+            str: Hex key for get()/put().
+        """
+        description = {'version': SIMULATOR_VERSION, 'cache': canonical_cache_config(cache_config), 'workload': workload}
+        return _digest(description)
+
+    def simulation_key(self, run_args, cache_config, seed=None, random_options=None):
+        """make_key for a run_single_simulation call."""
+        workload = {'run_args': list(run_args), 'random_options': random_options or {}}
+        if(run_args[0] == 'random'):
+            workload['seed'] = _seed_description(seed)
+        return self.make_key(cache_config, workload)
+
+    def trace_key(self, path, cache_config, **options):
+        """make_key for replaying a trace file, extra options (chunking is not one, it never changes results) are keyed too."""
+        return self.make_key(cache_config, dict(options, trace=self.fingerprint(path)))
+
+    def fingerprint(self, path):
+        """trace_fingerprint(path), remembered against the file's size and mtime so unchanged traces are hashed once."""
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        row = self._db.execute("SELECT size, mtime_ns, fingerprint FROM fingerprints WHERE path = ?", (path,)).fetchone()
+        if(row is not None and row[0] == stat.st_size and row[1] == stat.st_mtime_ns):
+            return row[2]
+        fingerprint = trace_fingerprint(path)
+        self._db.execute("INSERT OR REPLACE INTO fingerprints VALUES (?, ?, ?, ?)",
+                         (path, stat.st_size, stat.st_mtime_ns, fingerprint))
+        self._db.commit()
+        return fingerprint
+
+    def get(self, key, default=None):
+        """Stored value for key, or default. A hit marks the entry as recently used."""
+        row = self._db.execute("SELECT value FROM results WHERE key = ? AND version = ?",
+                               (key, SIMULATOR_VERSION)).fetchone()
+        if(row is None):
+            self.misses += 1
+            return default
+        self.hits += 1
+        self._db.execute("UPDATE results SET last_used = ? WHERE key = ?", (time.time(), key))
+        self._db.commit()
+        return json.loads(row[0])
+
+    def put(self, key, value, description=None):
+        """Stores value under key (replacing any previous one), then evicts LRU entries beyond max_entries."""
+        now = time.time()
+        if(self._db.execute("SELECT 1 FROM results WHERE key = ?", (key,)).fetchone() is None):
+            self._count += 1
+        self._db.execute("INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?)",
+                         (key, json.dumps(value), json.dumps(description, default=str), SIMULATOR_VERSION, now, now))
+        self._evict()
+        self._db.commit()
+
+    def get_or_compute(self, key, compute, description=None):
+        """get(key), falling back to compute() and storing its result. NaN results (failed runs) are not stored."""
+        value = self.get(key)
+        if(value is None):
+            value = compute()
+            if(not (isinstance(value, float) and value != value)):
+                self.put(key, value, description)
+        return value
+
+    def _evict(self):
+        excess = len(self) - self.max_entries
+        if(excess > 0):
+            evicted = self._db.execute("DELETE FROM results WHERE key IN (SELECT key FROM results ORDER BY last_used ASC LIMIT ?)",
+                                       (excess,)).rowcount
+            self._count -= evicted
+
+    def invalidate(self, key):
+        """Drops one entry. Returns True if it existed."""
+        deleted = self._db.execute("DELETE FROM results WHERE key = ?", (key,)).rowcount
+        self._count -= deleted
+        self._db.commit()
+        return deleted > 0
+
+    def prune(self, older_than_seconds=None):
+        """
+        Drops stale entries: everything recorded under another SIMULATOR_VERSION, plus, if older_than_seconds
+        is given, everything created longer ago than that. Returns the number of entries removed.
+        """
+        deleted = self._db.execute("DELETE FROM results WHERE version != ?", (SIMULATOR_VERSION,)).rowcount
+        if(older_than_seconds is not None):
+            deleted += self._db.execute("DELETE FROM results WHERE created < ?",
+                                        (time.time() - older_than_seconds,)).rowcount
+        self._count -= deleted
+        self._db.commit()
+        return deleted
+
+    def clear(self):
+        """Drops every stored result and trace fingerprint."""
+        self._db.execute("DELETE FROM results")
+        self._db.execute("DELETE FROM fingerprints")
+        self._count = 0
+        self._db.commit()
+
+    def close(self):
+        self._db.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect or clean up a cache simulation result store.")
+    parser.add_argument('--store', default=DEFAULT_STORE_PATH, help="Result store file")
+    parser.add_argument('--clear', action='store_true', help="Drop every stored result")
+    parser.add_argument('--prune', action='store_true', help="Drop results from older simulator versions")
+    parser.add_argument('--older-than', type=float, default=None, metavar='DAYS',
+                        help="With --prune, also drop results created more than DAYS ago")
+    args = parser.parse_args()
+
+    with ResultStore(args.store) as store:
+        if(args.clear):
+            store.clear()
+            print(f"Cleared {args.store}")
+        elif(args.prune):
+            older_than = args.older_than * 86400 if args.older_than is not None else None
+            print(f"Pruned {store.prune(older_than):,} entries from {args.store}")
+        print(f"{args.store}: {len(store):,} entries (limit {store.max_entries:,}), simulator version {SIMULATOR_VERSION}")
+
+if(__name__ == "__main__"):
+    main()
@@ -0,0 +1,185 @@
+import time
+import math
+from collections import namedtuple
+from statistics import NormalDist
+
+import numpy as np
+
+from cache_simulator import (CacheSimulator, iter_row_major_addresses, iter_col_major_addresses,
+                             generate_random_address_array, SIMULATION_CHUNK_SIZE)
+
+## miss rate estimate with its confidence interval; units is how many sets/windows it was built from,
+## sampled_accesses the accesses counted in the estimate and simulated_accesses those simulated at all
+## (warm-up included), out of total_accesses in the trace
+SampledResult = namedtuple('SampledResult', ['miss_rate', 'ci_low', 'ci_high', 'half_width', 'units',
+                                             'sampled_accesses', 'simulated_accesses', 'total_accesses'])
+
+def ratio_estimate(misses, accesses, population_units, confidence=0.95, total_accesses=None, simulated_accesses=None):
+    """
+    Combined-ratio estimate of the miss rate from per-unit (per set or per window) miss and access counts,
+    units drawn from population_units without replacement. The variance is the usual cluster-sampling one,
+    s^2 = sum((m_i - R a_i)^2) / (n - 1), var(R) = (1 - n / N) s^2 / (n * mean(a)^2).
+
+    Returns:
+        SampledResult: With a zero-width interval when fewer than two units saw any access.
+    """
+    misses = np.asarray(misses, dtype=np.float64)
+    accesses = np.asarray(accesses, dtype=np.float64)
+    used = accesses > 0
+    misses, accesses = misses[used], accesses[used]
+    sampled = int(accesses.sum())
+    total_accesses = sampled if total_accesses is None else total_accesses
+    simulated_accesses = sampled if simulated_accesses is None else simulated_accesses
+    if(sampled == 0):
+        return SampledResult(float('nan'), float('nan'), float('nan'), float('nan'), 0, 0, simulated_accesses,
+                             total_accesses)
+
+    rate = misses.sum() / accesses.sum()
+    units = accesses.size
+    half_width = 0.0
+    if(units > 1):
+        residual_variance = np.sum((misses - rate * accesses) ** 2) / (units - 1)
+        finite_population = max(0.0, 1 - units / population_units) if population_units else 1.0
+        variance = finite_population * residual_variance / (units * accesses.mean() ** 2)
+        half_width = NormalDist().inv_cdf(0.5 + confidence / 2) * math.sqrt(variance)
+    return SampledResult(rate, max(0.0, rate - half_width), min(1.0, rate + half_width), half_width,
+                         units, sampled, simulated_accesses, total_accesses)
+
+def choose_sample_sets(num_sets, sample_fraction, seed=0):
+    """A seeded random subset of sets (at least two), random rather than every k-th so strided traces don't alias."""
+    count = min(num_sets, max(2, int(round(num_sets * sample_fraction))))
+    return np.sort(np.random.default_rng(seed).choice(num_sets, size=count, replace=False))
+
+def set_sampled_miss_rate(cache_config, address_chunks, sample_fraction=1 / 8, seed=0, confidence=0.95):
+    """
+    Set sampling: only accesses that map to a random subset of sets are simulated. Sets never interact,
+    so the sampled sets behave exactly as in a full run, only the extrapolation to the other sets is estimated.
+
+    Args:
+        cache_config (dict): CacheSimulator keyword arguments.
+        address_chunks: Iterable of address arrays.
+        sample_fraction (float): Share of sets to simulate.
+        seed (int): Picks the sampled sets.
+        confidence (float): Confidence level of the interval.
+
+    Returns:
+        SampledResult
+    """
+    cache = CacheSimulator(**cache_config)
+    sample_sets = choose_sample_sets(cache.num_sets, sample_fraction, seed)
+    in_sample = np.zeros(cache.num_sets, dtype=bool)
+    in_sample[sample_sets] = True
+    set_misses = np.zeros(cache.num_sets, dtype=np.int64)
+    set_accesses = np.zeros(cache.num_sets, dtype=np.int64)
+
+    total = 0
+    for chunk in address_chunks:
+        chunk = np.asarray(chunk).ravel()
+        total += chunk.size
+        _, set_indices = cache.decompose_addresses(chunk)
+        set_indices = set_indices.astype(np.intp)
+        keep = in_sample[set_indices]
+        if(not keep.any()):
+            continue
+        hit_mask, _, _ = cache.access_many(chunk[keep])
+        kept_sets = set_indices[keep]
+        set_accesses += np.bincount(kept_sets, minlength=cache.num_sets)
+        set_misses += np.bincount(kept_sets[~hit_mask], minlength=cache.num_sets)
+
+    ## sets the trace never touches are real units with no accesses, they carry no weight in the ratio
+    return ratio_estimate(set_misses[sample_sets], set_accesses[sample_sets], cache.num_sets, confidence, total)
+
+def time_sampled_miss_rate(cache_config, address_chunks, period=100_000, warmup=5_000, measure=5_000, confidence=0.95):
+    """
+    Time sampling: of every period accesses, the first warmup + measure are simulated and only the
+    measure part is counted, the rest is skipped (the cache keeps its state across the gap, so warmup
+    must be long enough to refresh it).
+
+    Returns:
+        SampledResult: One unit per measurement window.
+    """
+    if(warmup < 0 or measure <= 0 or warmup + measure > period):
+        raise ValueError("Need 0 <= warmup, 0 < measure and warmup + measure <= period.")
+    cache = CacheSimulator(**cache_config)
+    window_misses = []
+    window_accesses = []
+
+    offset = 0
+    simulated_total = 0
+    for chunk in address_chunks:
+        chunk = np.asarray(chunk).ravel()
+        positions = np.arange(offset, offset + chunk.size, dtype=np.int64)
+        offset += chunk.size
+        phase = positions % period
+        simulated = phase < warmup + measure
+        if(not simulated.any()):
+            continue
+        hit_mask, _, _ = cache.access_many(chunk[simulated])
+        simulated_total += hit_mask.size
+        measured = phase[simulated] >= warmup
+        windows = positions[simulated][measured] // period
+        if(windows.size == 0):
+            continue
+        first_window = int(windows[0])
+        misses = np.bincount(windows - first_window, weights=~hit_mask[measured])
+        accesses = np.bincount(windows - first_window)
+        ## a window cut by a chunk boundary continues where the last chunk left it
+        for i, (window_miss, window_access) in enumerate(zip(misses.tolist(), accesses.tolist())):
+            if(i == 0 and len(window_misses) == first_window + 1):
+                window_misses[-1] += window_miss
+                window_accesses[-1] += window_access
+            else:
+                window_misses.append(window_miss)
+                window_accesses.append(window_access)
+
+    ## the trace splits into offset // measure windows of which one per period was measured
+    return ratio_estimate(window_misses, window_accesses, max(len(window_accesses), offset // measure), confidence,
+                          offset, simulated_total)
+
+def full_miss_rate(cache_config, address_chunks):
+    cache = CacheSimulator(**cache_config)
+    for chunk in address_chunks:
+        cache.access_many(chunk)
+    return cache.get_miss_rate()
+
+def main():
+    start_address = 0x10000000
+    rows, cols, data_size = 1024, 1024, 8
+    cache_config = {'cache_size_bytes': 256 * 1024, 'block_size_bytes': 64, 'associativity': 8}
+    random_addresses = generate_random_address_array(start_address, 16 * 1024 * 1024, rows * cols, data_size, rng=4200)
+
+    workloads = {
+        'row_major': lambda: iter_row_major_addresses(start_address, rows, cols, data_size, SIMULATION_CHUNK_SIZE),
+        'col_major': lambda: iter_col_major_addresses(start_address, rows, cols, data_size, SIMULATION_CHUNK_SIZE),
+        'random': lambda: (random_addresses[first:first + SIMULATION_CHUNK_SIZE]
+                           for first in range(0, random_addresses.size, SIMULATION_CHUNK_SIZE)),
+    }
+    samplers = {
+        'sets 1/8': lambda chunks: set_sampled_miss_rate(cache_config, chunks, 1 / 8),
+        'sets 1/32': lambda chunks: set_sampled_miss_rate(cache_config, chunks, 1 / 32),
+        'time 20%': lambda chunks: time_sampled_miss_rate(cache_config, chunks, 100_000, 10_000, 10_000),
+        'time 5%': lambda chunks: time_sampled_miss_rate(cache_config, chunks, 200_000, 5_000, 5_000),
+    }
+
+    print(f"{rows} x {cols} long, random over 16 MB, {cache_config['cache_size_bytes'] // 1024}K/"
+          f"{cache_config['block_size_bytes']}B/{cache_config['associativity']}w, 95% intervals")
+    print("{:<10} | {:<9} | {:>8} | {:>8} | {:>8} | {:>23} | {:>8} | {:>6}".format(
+        "Pattern", "Sampling", "Full", "Sampled", "Error", "Interval", "Cost", "Time s"))
+    print("-" * 100)
+    for name, make_chunks in workloads.items():
+        start = time.perf_counter()
+        full = full_miss_rate(cache_config, make_chunks())
+        print("{:<10} | {:<9} | {:>8.4f} | {:>8} | {:>8} | {:>23} | {:>8} | {:>6.2f}".format(
+            name, "none", full, "", "", "", "100%", time.perf_counter() - start))
+        for sampler_name, sampler in samplers.items():
+            start = time.perf_counter()
+            result = sampler(make_chunks())
+            elapsed = time.perf_counter() - start
+            covered = "" if result.ci_low <= full <= result.ci_high else " (miss)"
+            print("{:<10} | {:<9} | {:>8} | {:>8.4f} | {:>+8.4f} | {:>23} | {:>7.1%} | {:>6.2f}".format(
+                "", sampler_name, "", result.miss_rate, result.miss_rate - full,
+                f"[{result.ci_low:.4f}, {result.ci_high:.4f}]" + covered,
+                result.simulated_accesses / result.total_accesses, elapsed))
+
+if(__name__ == "__main__"):
+    main()
@@ -0,0 +1,261 @@
+import time
+
+import numpy as np
+
+from cache_simulator import (CacheSimulator, iter_row_major_addresses, iter_col_major_addresses,
+                             iter_random_addresses, SIMULATION_CHUNK_SIZE)
+
+class FenwickTree:
+    """Binary indexed tree over positions 1..size supporting point add and prefix sum in O(log n)."""
+
+    def __init__(self, size):
+        self.size = size
+        self.tree = [0] * (size + 1)
+
+    @classmethod
+    def from_ones(cls, size, positions):
+        """Builds a tree with a 1 at each of positions in O(size)."""
+        fenwick = cls(size)
+        tree = fenwick.tree
+        for position in positions:
+            tree[position] += 1
+        for i in range(1, size + 1):
+            parent = i + (i & -i)
+            if(parent <= size):
+                tree[parent] += tree[i]
+        return fenwick
+
+    def add(self, position, delta):
+        tree = self.tree
+        size = self.size
+        while(position <= size):
+            tree[position] += delta
+            position += position & -position
+
+    def prefix_sum(self, position):
+        tree = self.tree
+        total = 0
+        while(position > 0):
+            total += tree[position]
+            position -= position & -position
+        return total
+
+class ReuseDistanceTracker:
+    """
+    Exact LRU stack distances for a fully-associative cache (Mattson et al.).
+    Every live block has a 1 in a Fenwick tree at its last-access timestamp, so the number of
+    distinct blocks touched since a block's previous access is a single prefix-sum query.
+    Timestamps are renumbered when the tree fills, so its size tracks the number of distinct blocks,
+    not the trace length.
+    """
+
+    def __init__(self, initial_capacity=1 << 16):
+        self.capacity = initial_capacity
+        self.fenwick = FenwickTree(initial_capacity)
+        self.last_access = {}
+        self.clock = 0
+
+    def _compact(self):
+        ## renumber live timestamps to 1..m in order, growing the tree if it is more than half full
+        live = sorted(self.last_access.items(), key=lambda item: item[1])
+        self.capacity = max(self.capacity, 2 * len(live))
+        self.last_access = {block: i + 1 for i, (block, _) in enumerate(live)}
+        self.fenwick = FenwickTree.from_ones(self.capacity, range(1, len(live) + 1))
+        self.clock = len(live)
+
+    def access(self, block):
+        """Records an access and returns its stack distance, or -1 for the first touch of a block."""
+        if(self.clock == self.capacity):
+            self._compact()
+        self.clock += 1
+
+        previous = self.last_access.get(block)
+        self.last_access[block] = self.clock
+        if(previous is None):
+            self.fenwick.add(self.clock, 1)
+            return -1
+
+        ## live blocks = len(last_access), those at or before `previous` include the block itself
+        distance = len(self.last_access) - self.fenwick.prefix_sum(previous)
+        self.fenwick.add(previous, -1)
+        self.fenwick.add(self.clock, 1)
+        return distance
+
+class StackDistanceProfiler:
+    """
+    Single-pass LRU miss-rate analysis for many cache configurations sharing one block size.
+
+    Fully-associative caches of every size come from one ReuseDistanceTracker histogram.
+    Set-associative caches come from per-set LRU stacks, one family per distinct set count,
+    truncated at the largest associativity of interest, since deeper positions always miss.
+    Those stacks are plain lists searched with list.index, so each access costs O(max_associativity) per
+    distinct set count in Python, cheap for the usual 1-16 ways but it grows with both.
+    Results are exact, they match replaying the trace through CacheSimulator for each configuration.
+    """
+
+    def __init__(self, block_size_bytes, set_counts=(), max_associativity=0, address_size_bits=64):
+        if(block_size_bytes <= 0 or block_size_bytes & (block_size_bytes - 1)):
+            raise ValueError("Block size must be a power of two.")
+        for num_sets in set_counts:
+            if(num_sets <= 0 or num_sets & (num_sets - 1)):
+                raise ValueError("Set counts must be powers of two.")
+
+        self.block_size = block_size_bytes
+        self.num_offset_bits = block_size_bytes.bit_length() - 1
+        self.address_size = address_size_bits
+        self.max_associativity = max_associativity
+        self.set_counts = sorted(set(set_counts))
+
+        self.tracker = ReuseDistanceTracker()
+        self.full_histogram = np.zeros(0, dtype=np.int64)
+        self.cold_misses = 0
+        self.total_accesses = 0
+
+        ## per set count: list of per-set MRU-first stacks and a histogram of stack depths
+        self.set_stacks = {num_sets: [[] for _ in range(num_sets)] for num_sets in self.set_counts}
+        self.set_histograms = {num_sets: np.zeros(max_associativity, dtype=np.int64) for num_sets in self.set_counts}
+
+    def _block_numbers(self, addresses):
+        addresses = np.asarray(addresses)
+        if(addresses.dtype.kind == 'i' and addresses.size and addresses.min() < 0):
+            raise ValueError("Address cannot be negative.")
+        addresses = addresses.ravel().astype(np.uint64, copy=False)
+        if(self.address_size < 64):
+            ## bits above the address width never reach the cache, CacheSimulator masks them off the tag
+            addresses = addresses & np.uint64((1 << self.address_size) - 1)
+        return addresses >> np.uint64(self.num_offset_bits)
+
+    def process(self, addresses):
+        """Feeds one chunk of addresses (array, buffer or sequence) into the analysis."""
+        block_numbers = self._block_numbers(addresses)
+        if(block_numbers.size == 0):
+            return
+        blocks = block_numbers.tolist()
+
+        tracker_access = self.tracker.access
+        distances = [tracker_access(block) for block in blocks]
+        distances = np.asarray(distances, dtype=np.int64)
+        self.cold_misses += int(np.count_nonzero(distances < 0))
+        counts = np.bincount(distances[distances >= 0])
+        if(counts.size > self.full_histogram.size):
+            counts[:self.full_histogram.size] += self.full_histogram
+            self.full_histogram = counts
+        else:
+            self.full_histogram[:counts.size] += counts
+
+        depth_limit = self.max_associativity
+        for num_sets in self.set_counts:
+            stacks = self.set_stacks[num_sets]
+            set_mask = num_sets - 1
+            depth_counts = [0] * depth_limit
+            for block in blocks:
+                stack = stacks[block & set_mask]
+                try:
+                    depth = stack.index(block)
+                except ValueError:
+                    stack.insert(0, block)
+                    if(len(stack) > depth_limit):
+                        stack.pop()
+                    continue
+                depth_counts[depth] += 1
+                if(depth):
+                    del stack[depth]
+                    stack.insert(0, block)
+            self.set_histograms[num_sets] += np.asarray(depth_counts, dtype=np.int64)
+
+        self.total_accesses += len(blocks)
+
+    def miss_rate(self, cache_size_bytes, associativity=None):
+        """
+        LRU miss rate of a cache_size_bytes cache with this block size.
+        associativity=None means fully-associative, otherwise the set count must have been profiled.
+        """
+        if(self.total_accesses == 0):
+            return 0.0
+        num_blocks = cache_size_bytes // self.block_size
+        if(associativity is None):
+            hits = int(self.full_histogram[:num_blocks].sum())
+        else:
+            num_sets = num_blocks // associativity
+            if(num_sets not in self.set_histograms or associativity > self.max_associativity):
+                raise ValueError(f"{cache_size_bytes} bytes {associativity}-way was not part of this profile.")
+            hits = int(self.set_histograms[num_sets][:associativity].sum())
+        return (self.total_accesses - hits) / self.total_accesses
+
+def stack_distance_sweep(address_chunks, block_size_bytes, cache_sizes, associativities, address_size_bits=64):
+    """
+    Miss rates for every (cache size, associativity) pair from a single pass over the trace.
+
+    Args:
+        address_chunks: Iterable of address arrays (e.g. from trace_reader.iter_trace_chunks or the iter_* generators).
+        block_size_bytes (int): Block size shared by every configuration.
+        cache_sizes (iterable): Cache sizes in bytes.
+        associativities (iterable): Associativities, None meaning fully-associative.
+
+    Returns:
+        dict: {(cache_size, associativity): miss rate}, skipping pairs that don't form a valid cache.
+    """
+    configs = []
+    for cache_size in cache_sizes:
+        num_blocks = cache_size // block_size_bytes
+        for associativity in associativities:
+            if(associativity is None):
+                configs.append((cache_size, None))
+            elif(num_blocks >= associativity and num_blocks % associativity == 0):
+                ## CacheSimulator can only index a power of two of sets
+                num_sets = num_blocks // associativity
+                if(num_sets & (num_sets - 1) == 0):
+                    configs.append((cache_size, associativity))
+
+    set_counts = {(size // block_size_bytes) // assoc for size, assoc in configs if assoc is not None}
+    max_associativity = max((assoc for _, assoc in configs if assoc is not None), default=0)
+    profiler = StackDistanceProfiler(block_size_bytes, set_counts, max_associativity, address_size_bits)
+    for chunk in address_chunks:
+        profiler.process(chunk)
+
+    return {config: profiler.miss_rate(*config) for config in configs}
+
+def main():
+    start_address = 0x10000000
+    block_size = 64
+    cache_sizes = [1024, 2048, 4096, 8192, 16384, 32768]
+    associativities = [1, 2, 4, 8, 16, None]
+    rows, cols, data_size = 512, 512, 8
+
+    workloads = {
+        'row_major': lambda: iter_row_major_addresses(start_address, rows, cols, data_size, SIMULATION_CHUNK_SIZE),
+        'col_major': lambda: iter_col_major_addresses(start_address, rows, cols, data_size, SIMULATION_CHUNK_SIZE),
+        'random': lambda: iter_random_addresses(start_address, 64 * 1024, rows * cols, data_size, SIMULATION_CHUNK_SIZE,
+                                                rng=np.random.default_rng(4200)),
+    }
+
+    for name, make_chunks in workloads.items():
+        start = time.perf_counter()
+        miss_rates = stack_distance_sweep(make_chunks(), block_size, cache_sizes, associativities)
+        single_pass = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for cache_size, associativity in miss_rates:
+            ways = associativity if associativity is not None else cache_size // block_size
+            cache = CacheSimulator(cache_size, block_size, ways)
+            for chunk in make_chunks():
+                cache.access_many(chunk)
+            if(cache.get_miss_rate() != miss_rates[(cache_size, associativity)]):
+                raise AssertionError(f"Stack distance mismatch for {name} {cache_size} bytes {associativity}-way")
+        replay = time.perf_counter() - start
+
+        print(f"{name}: {len(miss_rates)} configurations, single pass {single_pass:.2f}s vs per-config replay {replay:.2f}s")
+        header = "{:>8} | ".format("Size") + " | ".join(
+            "{:>7}".format('full' if assoc is None else f"{assoc}-way") for assoc in associativities)
+        print(header)
+        print("-" * len(header))
+        for cache_size in cache_sizes:
+            cells = []
+            for assoc in associativities:
+                rate = miss_rates.get((cache_size, assoc))
+                cells.append("{:>7}".format("N/A" if rate is None else f"{rate:.4f}"))
+            print("{:>8} | ".format(cache_size) + " | ".join(cells))
+        print()
+
+if(__name__ == "__main__"):
+    main()
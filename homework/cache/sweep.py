@@ -0,0 +1,236 @@
+import os
+import csv
+import json
+import time
+import math
+import hashlib
+import argparse
+import itertools
+import multiprocessing
+
+from cache_simulator import run_single_simulation, run_seed, RANDOM_DISTRIBUTIONS
+from result_store import canonical_cache_config
+
+PATTERNS = ['row_major', 'col_major', 'random']
+
+## job fields that are CacheSimulator arguments, everything else describes the workload
+CACHE_FIELDS = ['cache_size_bytes', 'block_size_bytes', 'associativity', 'address_size_bits', 'replacement_policy',
+                'policy_seed', 'write_policy', 'write_allocate', 'word_size_bytes', 'prefetcher']
+
+WORKLOAD_DEFAULTS = {
+    'start_address': 0x10000000,
+    'random_offset_bytes': 0,
+    'distribution': 'uniform',
+    'base_seed': 0,
+}
+
+## output columns, the cache and workload description of a job followed by its result
+CSV_FIELDS = (['key', 'pattern', 'data_size', 'rows', 'cols', 'num_accesses', 'start_address', 'random_offset_bytes',
+               'random_range_bytes', 'distribution', 'base_seed', 'run'] + CACHE_FIELDS + ['miss_rate', 'elapsed_s'])
+
+def load_spec(path):
+    """Reads a sweep spec from JSON, or YAML if the file ends in .yaml/.yml (needs PyYAML)."""
+    with open(path) as f:
+        if(path.lower().endswith(('.yaml', '.yml'))):
+            try:
+                import yaml
+            except ImportError:
+                raise ImportError("YAML sweep specs need PyYAML (pip install pyyaml), or write the spec as JSON.")
+            return yaml.safe_load(f)
+        return json.load(f)
+
+def _array_dimensions(total_elements):
+    ## as close to square as possible, the way cache_simulator's __main__ sizes its arrays
+    rows = int(math.sqrt(total_elements))
+    while(rows > 0 and total_elements % rows != 0):
+        rows -= 1
+    return rows, total_elements // rows if rows else 0
+
+def normalize_job(params):
+    """
+    Turns one grid point into a canonical job: defaults filled in, array_bytes resolved to rows x cols,
+    and fields that can't change the result dropped, so equivalent points compare (and hash) equal.
+    """
+    params = dict(WORKLOAD_DEFAULTS, **params)
+    pattern = params.get('pattern')
+    if(pattern not in PATTERNS):
+        raise ValueError(f"Unsupported access pattern: {pattern}")
+    data_size = params['data_size']
+    if('array_bytes' in params):
+        rows, cols = _array_dimensions(params['array_bytes'] // data_size)
+    else:
+        rows, cols = params['rows'], params['cols']
+
+    cache = canonical_cache_config({field: params[field] for field in CACHE_FIELDS if field in params})
+    job = {'pattern': pattern, 'data_size': data_size, 'rows': rows, 'cols': cols,
+           'start_address': params['start_address'], 'cache': cache}
+    if(pattern == 'random'):
+        if(params['distribution'] not in RANDOM_DISTRIBUTIONS):
+            raise ValueError(f"Unsupported random distribution: {params['distribution']}")
+        job.update(num_accesses=params.get('num_accesses', rows * cols),
+                   random_offset_bytes=params['random_offset_bytes'],
+                   random_range_bytes=params.get('random_range_bytes', params.get('array_bytes', rows * cols * data_size)),
+                   distribution=params['distribution'], base_seed=params['base_seed'], run=params.get('run', 0))
+    else:
+        ## seeds and the random-only knobs don't matter for a deterministic traversal
+        job.update(num_accesses=rows * cols)
+    return job
+
+def job_key(job):
+    text = json.dumps(job, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(text.encode()).hexdigest()[:20]
+
+def expand_spec(spec):
+    """
+    Expands a sweep spec into unique normalized jobs, as {key: job} in first-seen order.
+
+    Spec format (JSON/YAML or a plain dict):
+        base:  parameters shared by every job
+        cases: optional list of parameter dicts, each one crossed with the grid (e.g. one per data type)
+        grid:  {parameter: [values]}, the cartesian product is taken
+        runs:  repetitions of each random job, run i draws from run_seed(base_seed, i)
+
+    Parameters are CACHE_FIELDS plus pattern, data_size, rows/cols or array_bytes, start_address,
+    num_accesses, random_offset_bytes, random_range_bytes, distribution and base_seed.
+    """
+    base = spec.get('base', {})
+    cases = spec.get('cases') or [{}]
+    grid = spec.get('grid', {})
+    names = list(grid)
+    runs = spec.get('runs', 1)
+
+    jobs = {}
+    for case in cases:
+        for values in itertools.product(*(grid[name] for name in names)):
+            params = dict(base, **case, **dict(zip(names, values)))
+            for run in range(runs if params.get('pattern') == 'random' else 1):
+                job = normalize_job(dict(params, run=run))
+                jobs.setdefault(job_key(job), job)
+    return jobs
+
+def job_cost(job):
+    ## accesses are what the simulator spends its time on
+    return job['num_accesses']
+
+def _run_sweep_job(item):
+    key, job = item
+    run_args = (job['pattern'], job['start_address'] + job.get('random_offset_bytes', 0), job['rows'], job['cols'],
+                job['data_size'], job.get('random_range_bytes', 0), job.get('num_accesses', 0))
+    seed = None
+    if(job['pattern'] == 'random'):
+        ## run_seed is what SimulationPool(base_seed=...).run() hands run i on every call, however the jobs are scheduled
+        seed = run_seed(job['base_seed'], job['run'])
+        random_options = {'distribution': job['distribution']}
+    else:
+        random_options = None
+    start = time.perf_counter()
+    miss_rate = run_single_simulation(run_args, job['cache'], seed, random_options)
+    return key, miss_rate, time.perf_counter() - start
+
+def job_row(key, job, miss_rate, elapsed):
+    row = {field: job.get(field, '') for field in CSV_FIELDS}
+    row.update(job['cache'])
+    row.update(key=key, miss_rate=miss_rate, elapsed_s=round(elapsed, 4))
+    return row
+
+def completed_keys(path):
+    """Keys of the jobs an earlier (possibly interrupted) sweep already wrote to path."""
+    if(not os.path.exists(path)):
+        return set()
+    with open(path, newline='') as f:
+        return {row['key'] for row in csv.DictReader(f) if row.get('miss_rate') not in (None, '', 'nan')}
+
+def run_sweep(spec, output_path, processes=None, progress=None):
+    """
+    Runs every job of a sweep spec that output_path doesn't already hold, largest first across a process pool,
+    appending one CSV row per job as soon as it finishes, so an interrupted sweep resumes where it stopped.
+    A failed job (NaN miss rate) is reported to progress but not written, the next resume retries it.
+
+    Args:
+        spec (dict): Sweep spec, see expand_spec.
+        output_path (str): CSV file, created with a header if missing, appended to otherwise.
+        processes (int): Pool size, all cores by default.
+        progress (callable): Optional progress(done, total, row), called as jobs finish.
+
+    Returns:
+        tuple: (jobs run now, jobs skipped because they were already done)
+    """
+    jobs = expand_spec(spec)
+    done = completed_keys(output_path)
+    pending = sorted(((key, job) for key, job in jobs.items() if key not in done), key=lambda item: -job_cost(item[1]))
+    skipped = len(jobs) - len(pending)
+    if(not pending):
+        return 0, skipped
+
+    write_header = not os.path.exists(output_path) or os.path.getsize(output_path) == 0
+    with open(output_path, 'a', newline='') as f, multiprocessing.Pool(processes or multiprocessing.cpu_count()) as pool:
+        writer = csv.DictWriter(f, fieldnames=CSV_FIELDS)
+        if(write_header):
+            writer.writeheader()
+        ## chunksize 1 so the big jobs handed out first don't drag small ones along with them
+        for count, (key, miss_rate, elapsed) in enumerate(pool.imap_unordered(_run_sweep_job, pending, chunksize=1), start=1):
+            row = job_row(key, jobs[key], miss_rate, elapsed)
+            if(not math.isnan(miss_rate)):
+                writer.writerow(row)
+                f.flush()
+            if(progress is not None):
+                progress(count, len(pending), row)
+    return len(pending), skipped
+
+def write_parquet(csv_path, parquet_path):
+    """Converts a finished sweep CSV to Parquet (needs pyarrow)."""
+    try:
+        import pyarrow.csv
+        import pyarrow.parquet
+    except ImportError:
+        raise ImportError("Parquet output needs pyarrow (pip install pyarrow), the CSV has every result already.")
+    pyarrow.parquet.write_table(pyarrow.csv.read_csv(csv_path), parquet_path)
+
+def summarize(csv_path):
+    """
+    Mean miss rate per configuration, random runs averaged, as {(pattern, data_size, cache label): (mean, runs)}.
+    Only the last row of each job counts, and failed (NaN) rows that older sweeps wrote are left out.
+    """
+    latest = {}
+    with open(csv_path, newline='') as f:
+        for row in csv.DictReader(f):
+            if(row.get('miss_rate') not in (None, '') and not math.isnan(float(row['miss_rate']))):
+                latest[row['key']] = row
+    groups = {}
+    for row in latest.values():
+        label = f"{int(row['cache_size_bytes']) // 1024}K/{row['block_size_bytes']}B/{row['associativity']}w {row['replacement_policy']}"
+        if(row.get('prefetcher')):
+            label += f" +{row['prefetcher']}"
+        group = groups.setdefault((row['pattern'], int(row['data_size']), label), [])
+        group.append(float(row['miss_rate']))
+    return {group: (sum(rates) / len(rates), len(rates)) for group, rates in sorted(groups.items())}
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a declarative cache simulation sweep.")
+    parser.add_argument('spec', help="Sweep spec, JSON or YAML")
+    parser.add_argument('--output', default='sweep_results.csv', help="CSV results, resumed if it already exists")
+    parser.add_argument('--parquet', default=None, help="Also write the results to this Parquet file at the end")
+    parser.add_argument('--processes', type=int, default=None)
+    args = parser.parse_args()
+
+    spec = load_spec(args.spec)
+    start = time.perf_counter()
+
+    def report(done, total, row):
+        miss_rate = float(row['miss_rate'])
+        result = "failed, retried on the next run" if math.isnan(miss_rate) else f"{miss_rate:.4f}"
+        print(f"[{done}/{total}] {row['pattern']} {row['data_size']}B {row['rows']}x{row['cols']} "
+              f"{row['cache_size_bytes']}/{row['block_size_bytes']}/{row['associativity']} -> {result}")
+
+    ran, skipped = run_sweep(spec, args.output, args.processes, report)
+    print(f"Ran {ran} jobs, {skipped} already in {args.output}, {time.perf_counter() - start:.1f}s")
+    if(args.parquet):
+        write_parquet(args.output, args.parquet)
+
+    print("{:<10} | {:>5} | {:<30} | {:>9} | {:>5}".format("Pattern", "Size", "Cache", "Miss rate", "Runs"))
+    print("-" * 72)
+    for (pattern, data_size, label), (mean, runs) in summarize(args.output).items():
+        print("{:<10} | {:>5} | {:<30} | {:>9.4f} | {:>5}".format(pattern, data_size, label, mean, runs))
+
+if(__name__ == "__main__"):
+    main()
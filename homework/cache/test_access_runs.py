@@ -0,0 +1,70 @@
+import numpy as np
+import pytest
+
+from cache_simulator import CacheSimulator
+from block_runs import (BLOCK_RUN_DTYPE, collapse_block_runs, simulate_block_runs, write_block_runs,
+                        iter_block_run_file)
+from cache_instrumentation import InstrumentedCacheSimulator
+
+PREFETCHERS = ['next-line', 'stride', 'stream-buffer']
+
+def _traces():
+    rng = np.random.default_rng(7)
+    sequential = np.arange(0, 8192 * 64, 64, dtype=np.uint64)
+    ## several accesses per block, strided walks and random jumps, with writes mixed in
+    strided = np.repeat(np.arange(0, 4096 * 192, 192, dtype=np.uint64), 3)
+    mixed = np.concatenate((np.repeat(rng.integers(0, 1 << 20, 2000, dtype=np.uint64), rng.integers(1, 6, 2000)),
+                            strided))
+    return {
+        'sequential': (sequential, None),
+        'strided': (strided, None),
+        'mixed': (mixed, rng.random(mixed.size) < 0.3),
+    }
+
+def _stats(cache):
+    return (cache.hits, cache.misses, cache.get_write_traffic(), cache.get_prefetch_stats())
+
+@pytest.mark.parametrize('prefetcher', PREFETCHERS)
+@pytest.mark.parametrize('write_allocate', [True, False])
+@pytest.mark.parametrize('trace', ['sequential', 'strided', 'mixed'])
+def test_access_runs_matches_access_many(prefetcher, write_allocate, trace):
+    addresses, is_write = _traces()[trace]
+    config = dict(cache_size_bytes=4096, block_size_bytes=64, associativity=4, prefetcher=prefetcher,
+                  write_allocate=write_allocate)
+
+    expanded = CacheSimulator(**config)
+    expanded.access_many(addresses, is_write)
+    replayed = simulate_block_runs(CacheSimulator(**config), [collapse_block_runs(addresses, 64, is_write)], 64)
+
+    assert _stats(replayed) == _stats(expanded)
+    assert replayed.get_prefetch_stats()['issued'] > 0
+
+@pytest.mark.parametrize('write_allocate', [True, False])
+def test_instrumented_access_runs_matches_access_many(write_allocate):
+    addresses, is_write = _traces()['mixed']
+    config = dict(cache_size_bytes=4096, block_size_bytes=64, associativity=4, write_allocate=write_allocate)
+
+    expanded = InstrumentedCacheSimulator(**config)
+    expanded.access_many(addresses, is_write)
+    replayed = simulate_block_runs(InstrumentedCacheSimulator(**config), [collapse_block_runs(addresses, 64, is_write)], 64)
+
+    assert _stats(replayed) == _stats(expanded)
+    assert replayed.miss_counts == expanded.miss_counts
+    assert replayed.access_count == expanded.access_count
+    assert np.array_equal(replayed.set_misses, expanded.set_misses)
+    assert np.array_equal(replayed.set_evictions, expanded.set_evictions)
+
+def test_runs_longer_than_32_bits(tmp_path):
+    ## a tight loop on one block, more accesses than a 32-bit count holds
+    runs = np.zeros(2, dtype=BLOCK_RUN_DTYPE)
+    runs['block'] = [1, 2]
+    runs['count'] = [(1 << 32) + 5, 3]
+    runs['writes'] = [(1 << 32) + 1, 0]
+    path = tmp_path / 'loop.brun'
+    write_block_runs(path, [runs], 64)
+    replayed = list(iter_block_run_file(path))
+
+    assert np.array_equal(np.concatenate(replayed), runs)
+    cache = simulate_block_runs(CacheSimulator(4096, 64, 4), replayed, 64)
+    assert (cache.hits, cache.misses) == ((1 << 32) + 6, 2)
+    assert cache.writes == (1 << 32) + 1
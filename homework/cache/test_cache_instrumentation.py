@@ -0,0 +1,29 @@
+import numpy as np
+import pytest
+
+from cache_simulator import SIMULATION_CHUNK_SIZE
+from cache_instrumentation import InstrumentedCacheSimulator
+
+@pytest.mark.parametrize('prefetcher', ['next-line', 'stride', 'stream-buffer'])
+def test_prefetched_lines_are_hits_and_prefetch_evictions_are_counted(prefetcher):
+    addresses = np.arange(0, 4096 * 64, 64, dtype=np.uint64)
+    cache = InstrumentedCacheSimulator(4096, 64, 4, prefetcher=prefetcher)
+    cache.access_many(addresses[:2048])
+    for address in addresses[2048:].tolist():
+        cache.access(address)
+
+    assert sum(cache.miss_counts.values()) == cache.misses
+    assert cache.miss_counts['compulsory'] == cache.misses
+    assert cache.get_prefetch_stats()['useful'] > 0
+    fills = cache.get_write_traffic()['bytes_from_next_level'] // cache.block_size
+    ## the stream buffer holds its blocks outside the cache until they are used
+    assert int(cache.set_evictions.sum()) == fills - cache.num_blocks - cache.prefetcher.pending_blocks()
+
+def test_access_runs_splits_long_runs():
+    cache = InstrumentedCacheSimulator(4096, 64, 4, sample_every=1)
+    events = []
+    cache.event_callback = events.append
+    count = 3 * SIMULATION_CHUNK_SIZE + 5
+    assert cache.access_runs([64, 128], [count, 2], [count, 1], [count, 0]) == (count, 2)
+    assert cache.access_count == count + 2
+    assert [event.is_write for event in events[-2:]] == [False, True]
@@ -0,0 +1,44 @@
+from cache_simulator import CacheSimulator, read_sysfs_caches, system_cache_configs
+
+def test_prefetched_victim_of_a_hierarchy_fill_is_useless():
+    ## one 2-way set: block 1 is prefetched, then evicted unused by two hierarchy fills
+    cache = CacheSimulator(128, 64, 2, prefetcher='next-line')
+    cache.access(0)
+    cache.access_with_eviction(128)
+    cache.access_with_eviction(192)
+    ## demand hits on the blocks that took its way are not prefetch hits
+    assert cache.access(128) and cache.access(192)
+
+    stats = cache.get_prefetch_stats()
+    assert stats['useless'] == 1
+    assert stats['useful'] == 0
+
+def _write_sysfs_cache(cpu_root, cpu, index, level, cache_type, size_kb, ways, sets, shared):
+    cache_dir = cpu_root / f'cpu{cpu}' / 'cache' / f'index{index}'
+    cache_dir.mkdir(parents=True)
+    fields = {'level': level, 'type': cache_type, 'size': f'{size_kb}K', 'ways_of_associativity': ways,
+              'coherency_line_size': 64, 'number_of_sets': sets, 'shared_cpu_list': shared}
+    for name, value in fields.items():
+        (cache_dir / name).write_text(f'{value}\n')
+
+def test_hybrid_sysfs_keeps_one_cache_per_level(tmp_path):
+    ## cpu0-1 are P-cores with private 2M L2s, cpu2-9 E-cores sharing a 4M L2 per cluster of 4, one 30M L3
+    for cpu in range(10):
+        if(cpu < 2):
+            _write_sysfs_cache(tmp_path, cpu, 0, 1, 'Data', 48, 12, 64, cpu)
+            _write_sysfs_cache(tmp_path, cpu, 1, 2, 'Unified', 2048, 16, 2048, cpu)
+        else:
+            cluster = 2 + (cpu - 2) // 4 * 4
+            _write_sysfs_cache(tmp_path, cpu, 0, 1, 'Data', 32, 8, 64, cpu)
+            _write_sysfs_cache(tmp_path, cpu, 1, 2, 'Unified', 4096, 16, 4096, f'{cluster}-{cluster + 3}')
+        _write_sysfs_cache(tmp_path, cpu, 2, 3, 'Unified', 30720, 12, 40960, '0-9')
+
+    levels = read_sysfs_caches(cpu_root=tmp_path)
+    assert len(levels) == 5
+    assert [(entry['level'], entry['first_cpu'], entry['instances']) for entry in levels] == \
+        [(1, 0, 2), (1, 2, 8), (2, 0, 2), (2, 2, 2), (3, 0, 1)]
+
+    configs = system_cache_configs(levels)
+    assert [(config['level'], config['cache_size_bytes'], config['associativity']) for config in configs] == \
+        [(1, 48 * 1024, 12), (2, 2048 * 1024, 16), (3, 24 * 1024 * 1024, 12)]
+    assert configs[2]['approximate']
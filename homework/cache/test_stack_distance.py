@@ -0,0 +1,15 @@
+import numpy as np
+
+from cache_simulator import CacheSimulator
+from stack_distance import stack_distance_sweep
+
+def test_sweep_skips_set_counts_that_are_not_powers_of_two():
+    addresses = np.random.default_rng(3).integers(0, 1 << 18, 20000, dtype=np.uint64)
+    ## 24K of 64-byte blocks is 384 blocks: 192 sets at 2 ways and 96 at 4, neither a power of two
+    miss_rates = stack_distance_sweep([addresses], 64, [24576, 8192], [2, 4, None])
+
+    assert set(miss_rates) == {(24576, None), (8192, 2), (8192, 4), (8192, None)}
+    for (cache_size, associativity), miss_rate in miss_rates.items():
+        cache = CacheSimulator(cache_size, 64, associativity or cache_size // 64)
+        cache.access_many(addresses)
+        assert cache.get_miss_rate() == miss_rate
@@ -0,0 +1,57 @@
+import math
+import csv
+
+import sweep
+from sweep import run_sweep, summarize, CSV_FIELDS
+
+SPEC = {
+    'base': {'pattern': 'random', 'data_size': 8, 'array_bytes': 65536, 'num_accesses': 2000,
+             'cache_size_bytes': 4096, 'block_size_bytes': 64, 'associativity': 8, 'base_seed': 1},
+    'runs': 2,
+}
+
+def test_failed_jobs_are_not_written_and_rerun_once(tmp_path, monkeypatch):
+    output = tmp_path / 'sweep.csv'
+    real_job = sweep._run_sweep_job
+    failing = {'run': 1}
+
+    def flaky_job(item):
+        key, miss_rate, elapsed = real_job(item)
+        return key, float('nan') if item[1]['run'] == failing['run'] else miss_rate, elapsed
+
+    ## in-process pool stand-in, so the patched job function is the one that runs
+    class InlinePool:
+        def __init__(self, processes):
+            pass
+        def __enter__(self):
+            return self
+        def __exit__(self, *exc):
+            return False
+        def imap_unordered(self, function, items, chunksize=1):
+            return map(function, items)
+
+    monkeypatch.setattr(sweep.multiprocessing, 'Pool', InlinePool)
+    monkeypatch.setattr(sweep, '_run_sweep_job', flaky_job)
+    assert run_sweep(SPEC, str(output), processes=1) == (2, 0)
+    with open(output, newline='') as f:
+        assert len(list(csv.DictReader(f))) == 1
+
+    failing['run'] = None
+    assert run_sweep(SPEC, str(output), processes=1) == (1, 1)
+    (mean, runs), = summarize(str(output)).values()
+    assert runs == 2 and not math.isnan(mean)
+
+def test_summarize_skips_nan_rows_and_keeps_the_last_row_per_key(tmp_path):
+    output = tmp_path / 'old.csv'
+    base = {field: '' for field in CSV_FIELDS}
+    base.update(pattern='random', data_size=8, cache_size_bytes=4096, block_size_bytes=64, associativity=8,
+                replacement_policy='LRU')
+    rows = [dict(base, key='a', miss_rate='nan'), dict(base, key='a', miss_rate='0.5'), dict(base, key='a', miss_rate='0.7'),
+            dict(base, key='b', miss_rate='0.9'), dict(base, key='c', miss_rate='nan')]
+    with open(output, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=CSV_FIELDS)
+        writer.writeheader()
+        writer.writerows(rows)
+
+    (mean, runs), = summarize(str(output)).values()
+    assert runs == 2 and math.isclose(mean, 0.8)
@@ -0,0 +1,228 @@
+import os
+import mmap
+import gzip
+import argparse
+
+import numpy as np
+
+from cache_simulator import CacheSimulator
+
+## addresses per chunk handed to the simulator, 8 MB of uint64s
+DEFAULT_CHUNK_SIZE = 1 << 20
+
+ADDRESS_DTYPE = np.dtype('<u8')
+## address plus an R/W flag byte (0 read, 1 write), packed to 9 bytes per record
+RW_RECORD_DTYPE = np.dtype([('address', '<u8'), ('write', 'u1')])
+
+TRACE_FORMATS = ['binary', 'binary.gz', 'binary-rw', 'binary-rw.gz', 'text', 'text.gz']
+
+## text trace flags that mean a store, anything else in the flag column is a load
+WRITE_FLAGS = {'W', 'S', '1'}
+
+def detect_trace_format(path):
+    """
+    Guesses the trace format from the file name.
+    '.rw.bin' files are packed address + R/W flag records, '.bin' and unknown extensions raw little-endian uint64s,
+    '.txt'/'.trace' text, each optionally gzip-compressed with a trailing '.gz'.
+    """
+    name = os.path.basename(path).lower()
+    compressed = name.endswith('.gz')
+    if(compressed):
+        name = name[:-3]
+    if(name.endswith('.rw.bin')):
+        trace_format = 'binary-rw'
+    elif(name.endswith('.txt') or name.endswith('.trace') or (compressed and not name.endswith('.bin'))):
+        trace_format = 'text'
+    else:
+        trace_format = 'binary'
+    return trace_format + '.gz' if compressed else trace_format
+
+def _split_records(records):
+    if(records.dtype == RW_RECORD_DTYPE):
+        return records['address'].copy(), records['write'].astype(bool)
+    return records, None
+
+def _iter_mmap_chunks(path, chunk_size, dtype):
+    with open(path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if(size % dtype.itemsize != 0):
+            raise ValueError(f"Binary trace {path} is {size} bytes, not a whole number of {dtype.itemsize}-byte records.")
+        if(size == 0):
+            return
+
+        total = size // dtype.itemsize
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            for start in range(0, total, chunk_size):
+                count = min(chunk_size, total - start)
+                byte_offset = start * dtype.itemsize
+                ## copy out of the mapping so the map can be closed and the pages dropped behind us
+                chunk = np.frombuffer(mm, dtype=dtype, count=count, offset=byte_offset).copy()
+                if(hasattr(mm, 'madvise') and hasattr(mmap, 'MADV_DONTNEED')):
+                    page_start = byte_offset - (byte_offset % mmap.PAGESIZE)
+                    mm.madvise(mmap.MADV_DONTNEED, page_start, byte_offset + count * dtype.itemsize - page_start)
+                yield _split_records(chunk)
+
+def _iter_binary_stream_chunks(f, chunk_size, dtype):
+    chunk_bytes = chunk_size * dtype.itemsize
+    leftover = b''
+    while True:
+        data = f.read(chunk_bytes - len(leftover))
+        if(not data):
+            break
+        data = leftover + data
+        usable = len(data) - (len(data) % dtype.itemsize)
+        leftover = data[usable:]
+        if(usable):
+            yield _split_records(np.frombuffer(data[:usable], dtype=dtype).copy())
+    if(leftover):
+        raise ValueError(f"Binary trace ends with a partial record ({len(leftover)} bytes).")
+
+def _iter_text_chunks(f, chunk_size):
+    ## one access per line: an address (hex 0x... or decimal), optionally preceded by an R/W (or L/S) flag,
+    ## blank lines and '#' comments skipped
+    addresses = []
+    writes = []
+    flagged = False
+    for line in f:
+        line = line.strip()
+        if(not line or line.startswith('#')):
+            continue
+        parts = line.split()
+        if(len(parts) == 1):
+            addresses.append(int(parts[0], 0))
+            writes.append(False)
+        else:
+            addresses.append(int(parts[1], 0))
+            writes.append(parts[0].upper() in WRITE_FLAGS)
+            flagged = True
+        if(len(addresses) == chunk_size):
+            yield np.array(addresses, dtype=np.uint64), np.array(writes, dtype=bool) if flagged else None
+            addresses = []
+            writes = []
+            flagged = False
+    if(addresses):
+        yield np.array(addresses, dtype=np.uint64), np.array(writes, dtype=bool) if flagged else None
+
+def iter_trace_records(path, chunk_size=DEFAULT_CHUNK_SIZE, trace_format=None):
+    """
+    Streams a trace from disk in fixed-size chunks.
+    Raw binary traces are memory-mapped, gzip and text traces are read incrementally,
+    so memory use is bounded by chunk_size no matter how long the trace is.
+
+    Args:
+        path (str): Trace file.
+        chunk_size (int): Accesses per yielded chunk (the last chunk may be shorter).
+        trace_format (str): One of TRACE_FORMATS, guessed from the name if None.
+
+    Yields:
+        tuple: (addresses, is_write) where addresses is a uint64 array and is_write a bool array,
+               or None when the chunk carries no R/W information (all reads).
+    """
+    if(chunk_size <= 0):
+        raise ValueError("Chunk size must be positive.")
+    trace_format = trace_format or detect_trace_format(path)
+
+    if(trace_format == 'binary'):
+        yield from _iter_mmap_chunks(path, chunk_size, ADDRESS_DTYPE)
+    elif(trace_format == 'binary-rw'):
+        yield from _iter_mmap_chunks(path, chunk_size, RW_RECORD_DTYPE)
+    elif(trace_format in ('binary.gz', 'binary-rw.gz')):
+        dtype = RW_RECORD_DTYPE if trace_format == 'binary-rw.gz' else ADDRESS_DTYPE
+        with gzip.open(path, 'rb') as f:
+            yield from _iter_binary_stream_chunks(f, chunk_size, dtype)
+    elif(trace_format == 'text'):
+        with open(path, 'r') as f:
+            yield from _iter_text_chunks(f, chunk_size)
+    elif(trace_format == 'text.gz'):
+        with gzip.open(path, 'rt') as f:
+            yield from _iter_text_chunks(f, chunk_size)
+    else:
+        raise ValueError(f"Unsupported trace format: {trace_format}")
+
+def iter_trace_chunks(path, chunk_size=DEFAULT_CHUNK_SIZE, trace_format=None):
+    """iter_trace_records without the R/W column, yields uint64 address arrays only."""
+    for addresses, _ in iter_trace_records(path, chunk_size, trace_format):
+        yield addresses
+
+def write_binary_trace(path, address_chunks):
+    """
+    Writes addresses as raw little-endian uint64s, gzip-compressed if path ends in '.gz'.
+    address_chunks is an iterable of address arrays/lists, so a trace can be written without holding it all.
+    Returns the number of addresses written.
+    """
+    opener = gzip.open if path.lower().endswith('.gz') else open
+    written = 0
+    with opener(path, 'wb') as f:
+        for chunk in address_chunks:
+            chunk = np.asarray(chunk, dtype=ADDRESS_DTYPE)
+            f.write(chunk.tobytes())
+            written += chunk.size
+    return written
+
+def write_rw_trace(path, record_chunks):
+    """
+    Writes packed address + R/W flag records ('binary-rw'), gzip-compressed if path ends in '.gz'.
+    record_chunks is an iterable of (addresses, is_write) pairs. Returns the number of records written.
+    """
+    opener = gzip.open if path.lower().endswith('.gz') else open
+    written = 0
+    with opener(path, 'wb') as f:
+        for addresses, is_write in record_chunks:
+            addresses = np.asarray(addresses, dtype=ADDRESS_DTYPE).ravel()
+            records = np.empty(addresses.size, dtype=RW_RECORD_DTYPE)
+            records['address'] = addresses
+            records['write'] = np.asarray(is_write, dtype=bool).ravel() if is_write is not None else False
+            f.write(records.tobytes())
+            written += addresses.size
+    return written
+
+def simulate_trace(cache, path, chunk_size=DEFAULT_CHUNK_SIZE, trace_format=None):
+    """
+    Streams a trace file through cache.access_many chunk by chunk, R/W flags included.
+    Returns the cache so callers can read hits/misses/get_miss_rate()/get_write_traffic().
+    """
+    for addresses, is_write in iter_trace_records(path, chunk_size, trace_format):
+        cache.access_many(addresses, is_write)
+    return cache
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay an address trace file through a CacheSimulator.")
+    parser.add_argument('trace', help="Trace file (raw uint64, .rw.bin records, text, any of them .gz)")
+    parser.add_argument('--format', dest='trace_format', default=None, choices=TRACE_FORMATS)
+    parser.add_argument('--cache-size', type=int, default=4096)
+    parser.add_argument('--block-size', type=int, default=64)
+    parser.add_argument('--associativity', type=int, default=8)
+    parser.add_argument('--address-bits', type=int, default=64)
+    parser.add_argument('--write-policy', default='write-back', choices=['write-back', 'write-through'])
+    parser.add_argument('--no-write-allocate', action='store_true')
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument('--result-store', default=None, metavar='PATH',
+                        help="Reuse the stored result if this trace (by content) already ran through this cache")
+    args = parser.parse_args()
+
+    cache_config = {'cache_size_bytes': args.cache_size, 'block_size_bytes': args.block_size,
+                    'associativity': args.associativity, 'address_size_bits': args.address_bits,
+                    'write_policy': args.write_policy, 'write_allocate': not args.no_write_allocate}
+
+    def simulate():
+        cache = CacheSimulator(**cache_config)
+        simulate_trace(cache, args.trace, args.chunk_size, args.trace_format)
+        return dict(cache.get_write_traffic(), hits=cache.hits, misses=cache.misses, miss_rate=cache.get_miss_rate())
+
+    if(args.result_store):
+        from result_store import ResultStore
+        with ResultStore(args.result_store) as store:
+            ## the format decides how the bytes are parsed, so it is part of the key along with the content hash
+            key = store.trace_key(args.trace, cache_config, trace_format=args.trace_format or detect_trace_format(args.trace))
+            traffic = store.get_or_compute(key, simulate, {'trace': os.path.abspath(args.trace)})
+            if(store.hits):
+                print(f"(stored result from {args.result_store})")
+    else:
+        traffic = simulate()
+    print(f"Accesses: {traffic['hits'] + traffic['misses']:,}  Hits: {traffic['hits']:,}  Misses: {traffic['misses']:,}  "
+          f"Miss rate: {traffic['miss_rate']:.4f}")
+    print(f"Reads: {traffic['reads']:,}  Writes: {traffic['writes']:,}  Write-backs: {traffic['writebacks']:,}  "
+          f"Bytes in: {traffic['bytes_from_next_level']:,}  Bytes out: {traffic['bytes_to_next_level']:,}")
+
+if(__name__ == "__main__"):
+    main()
@@ -1,9 +1,18 @@
 import struct
-import csv
 from dataclasses import dataclass
 from typing import List
 
-@dataclass
+from trace_sinks import CsvTraceSink
+from rv32i import RV32ICore, BRANCH_NAMES, MASK32, to_signed
+
+## opcodes without an rs1 operand (LUI, AUIPC, JAL), they never forward or stall on it
+NO_RS1_OPS = (0x37, 0x17, 0x6F)
+
+## decoded fields of a bubble, in PipelineReg order after instr and pc (see PipelineSimulator._decode_fields)
+NOP_FIELDS = (0, 0, 0, 0, 0, 0, False, False, "", "", False, False, 0, False)
+
+## slots and in-place updates, the simulator keeps four of these for the whole run and never allocates new ones
+@dataclass(slots=True)
 class PipelineReg:
     instr: int = 0
     pc: int = 0 
@@ -21,28 +30,61 @@ class PipelineReg:
     mem_wr: bool = False
     wb_sel: int = 0
     branch_ctrl: bool = False
+    ## value written to rd, filled in when the instruction executes in EX
+    result: int = 0
 
     @classmethod
     def nop(cls):
         return cls(instr=0, pc=0, op=0, fct3=0, rd=0, rs1=0, rs2=0, imm=0, reg_write=False, alu_src=False, mem_rd=False, mem_wr=False, wb_sel=0, branch_ctrl=False)
 
+    def load(self, instr, pc, fields):
+        """Overwrites this register with a decoded instruction, fields as returned by _decode_fields."""
+        self.instr = instr
+        self.pc = pc
+        (self.op, self.fct3, self.rd, self.rs1, self.rs2, self.imm, self.reg_write, self.alu_src,
+         self.fwd_a, self.fwd_b, self.mem_rd, self.mem_wr, self.wb_sel, self.branch_ctrl) = fields
+        self.result = 0
+
+    def clear(self):
+        """Turns this register into a bubble in place, what nop() builds."""
+        self.load(0, 0, NOP_FIELDS)
+
 class PipelineSimulator:
-    def __init__(self, binary_file: str):
+    def __init__(self, binary_file: str, verbose: bool = True):
+        ## verbose prints every stall, flush and branch as it happens, turn it off for long runs
+        self.verbose = verbose
         self.pc = 0
         self.instructions = self._load_instructions(binary_file)
         self.max_pc = len(self.instructions) * 4
+        ## instruction word -> decoded fields, the whole image is decoded once here so decode() is a lookup
+        self.decode_cache = {instr: self._decode_fields(instr) for instr in set(self.instructions) if instr != 0}
         self.if_id = PipelineReg.nop()
         self.id_ex = PipelineReg.nop()
         self.ex_mem = PipelineReg.nop()
         self.mem_wb = PipelineReg.nop()
         self.cycle = 0
-        self.retired_instr_count = 0 
+        self.register_write_count = 0
         self.stall_pipeline = False 
+        self.flush_pipeline = False
         self.branch_target = 0
-        self.register_values = {0: 0}
+        ## register_write_count only counts register writers, this counts every instruction leaving WB
+        self.completed_instr_count = 0
+        self.stall_count = 0
+        self.flush_count = 0
+        ## architectural state: every instruction runs on the core as it passes EX, wrong-path instructions
+        ## are flushed before they get there. The image is also mapped at address 0 for loads, fetch reads the list.
+        self.core = RV32ICore()
+        self.core.load_program(self.instructions)
+        ## every word of the image is decoded for the core too, so an unsupported one fails here with its pc
+        ## rather than partway through a run
+        for index, instr in enumerate(self.instructions):
+            if(instr != 0):
+                self.core.decode(instr, index * 4)
         self.pc_write_enable = True
         self.if_id_write_enable = True
         self.id_ex_write_enable = True
+        ## the register logged for a cycle with every stage empty
+        self._idle_reg = PipelineReg.nop()
 
     def _load_instructions(self, binary_file: str) -> List[int]:
         instructions = []
@@ -59,7 +101,8 @@ class PipelineSimulator:
         except FileNotFoundError:
             print(f"Error: Binary file not found at {binary_file}")
             return []
-        print(f"Loaded {len(instructions)} instructions.")
+        if(self.verbose):
+            print(f"Loaded {len(instructions)} instructions.")
         return instructions
 
     def _sign_extend(self, value, bits):
@@ -69,7 +112,10 @@ class PipelineSimulator:
     def _decode_instruction(self, instr: int, current_pc: int) -> PipelineReg:
         if instr == 0:
             return PipelineReg.nop()
+        return PipelineReg(instr, current_pc, *self._decode_fields(instr))
 
+    def _decode_fields(self, instr: int) -> tuple:
+        ## every PipelineReg field after instr and pc, in declaration order, so PipelineReg(instr, pc, *fields) works
         op = instr & 0x7F
         rd = (instr >> 7) & 0x1F
         fct3 = (instr >> 12) & 0x7
@@ -88,9 +134,18 @@ class PipelineSimulator:
                 ((instr >> 25) & 0x3F) << 5 | ## imm[10:5]
                 ((instr >> 8) & 0xF) << 1, ## imm[4:1]
                 13) ## B-immediates are multiples of 2
+        elif(op == 0x6F): ## J-type (jal)
+            imm = self._sign_extend(
+                ((instr >> 31) << 20) | ## imm[20]
+                ((instr >> 12) & 0xFF) << 12 | ## imm[19:12]
+                ((instr >> 20) & 0x1) << 11 | ## imm[11]
+                ((instr >> 21) & 0x3FF) << 1, ## imm[10:1]
+                21)
+        elif(op in [0x37, 0x17]): ## U-type (lui, auipc)
+            imm = self._sign_extend(instr & 0xFFFFF000, 32)
 
 
-        reg_write = op in [0x33, 0x13, 0x03, 0x67, 0x37, 0x17] ## R, I, Load, JALR, LUI, AUIPC
+        reg_write = op in [0x33, 0x13, 0x03, 0x67, 0x37, 0x17, 0x6F] ## R, I, Load, JALR, LUI, AUIPC, JAL
         alu_src = op in [0x13, 0x03, 0x23, 0x67, 0x37, 0x17] ## I, Load, Store, JALR, LUI, AUIPC
         mem_rd = op == 0x03 ## Load
         mem_wr = op == 0x23 ## Store
@@ -101,26 +156,24 @@ class PipelineSimulator:
             wb_sel = 1 ## Load uses memory data
 
 
-        return PipelineReg(
-            instr=instr, pc=current_pc, op=op, rd=rd, fct3=fct3, rs1=rs1, rs2=rs2, imm=imm,
-            reg_write=reg_write, alu_src=alu_src, mem_rd=mem_rd, mem_wr=mem_wr,
-            wb_sel=wb_sel, branch_ctrl=branch_ctrl
-        )
+        return (op, fct3, rd, rs1, rs2, imm, reg_write, alu_src, "", "", mem_rd, mem_wr, wb_sel, branch_ctrl)
 
     def _check_forwarding(self):
         fwd_a = ""
         fwd_b = ""
 
         ## EX hazard: Result from ALU stage (end of EX / start of MEM)
+        ## LUI, AUIPC and JAL have immediate bits where rs1 would be
+        reads_rs1 = self.id_ex.op not in NO_RS1_OPS
         if(self.ex_mem.reg_write and self.ex_mem.rd != 0):
-            if(self.ex_mem.rd == self.id_ex.rs1):
+            if(reads_rs1 and self.ex_mem.rd == self.id_ex.rs1):
                 fwd_a = "EX"
             if(self.id_ex.op in [0x33, 0x23, 0x63] and self.ex_mem.rd == self.id_ex.rs2):
                 fwd_b = "EX"
 
         ## MEM hazard: Result from Memory stage (end of MEM / start of WB)
         if(self.mem_wb.reg_write and self.mem_wb.rd != 0):
-            if(self.mem_wb.rd == self.id_ex.rs1 and fwd_a == ""):
+            if(reads_rs1 and self.mem_wb.rd == self.id_ex.rs1 and fwd_a == ""):
                 fwd_a = "MEM"
             if(self.id_ex.op in [0x33, 0x23, 0x63] and self.mem_wb.rd == self.id_ex.rs2 and fwd_b == ""):
                 fwd_b = "MEM"
@@ -130,7 +183,7 @@ class PipelineSimulator:
 
     def _check_load_use_hazard(self):
         if(self.id_ex.instr != 0 and self.ex_mem.mem_rd): # Instr in ID, Load in EX
-            rs1_needed = self.id_ex.rs1 != 0 and self.ex_mem.rd == self.id_ex.rs1
+            rs1_needed = self.id_ex.op not in NO_RS1_OPS and self.id_ex.rs1 != 0 and self.ex_mem.rd == self.id_ex.rs1
             rs2_needed = self.id_ex.op in [0x33, 0x23, 0x63] and self.id_ex.rs2 != 0 and self.ex_mem.rd == self.id_ex.rs2
 
             if(rs1_needed or rs2_needed):
@@ -146,66 +199,66 @@ class PipelineSimulator:
         if(self.mem_wb.instr == 0): ## NOP in WB
             return
 
+        ## the register file was updated when the instruction executed, WB only retires it
+        if(self.verbose and self.mem_wb.reg_write and self.mem_wb.rd != 0):
+            print(f"Cycle {self.cycle}: WB: x{self.mem_wb.rd} = {to_signed(self.mem_wb.result)}")
 
-        if self.mem_wb.reg_write and self.mem_wb.rd == 5:
-             if(self.mem_wb.op == 0x13):
-                 if(self.mem_wb.fct3 == 0):
-                     if(self.mem_wb.rs1 == 0 and self.mem_wb.imm == 3):
-                         self.register_values[5] = 3
-                         print(f"Cycle {self.cycle}: WB: x5 set to 3")
-                     elif(self.mem_wb.rs1 == 5 and self.mem_wb.imm == -1):
-                         val_rs1 = self.register_values.get(5, 0)
-                         self.register_values[5] = val_rs1 + self.mem_wb.imm
-                         print(f"Cycle {self.cycle}: WB: x5 decremented to {self.register_values[5]}")
-
+        self.completed_instr_count += 1
         if(self.mem_wb.reg_write):
-             self.retired_instr_count += 1
+             self.register_write_count += 1
 
 
     def memory(self):
-        self.mem_wb = self.ex_mem
+        ## latches move by swapping, the old MEM/WB object becomes EX/MEM's storage and is overwritten
+        ## by execute() (or cleared) later this cycle
+        self.mem_wb, self.ex_mem = self.ex_mem, self.mem_wb
 
 
     def execute(self):
-        self.ex_mem = self.id_ex
+        ## same swap, ID/EX gets the spare object and decode() (or a clear) refills it
+        self.ex_mem, self.id_ex = self.id_ex, self.ex_mem
+        reg = self.ex_mem
 
-        if(self.id_ex.instr == 0):
+        if(reg.instr == 0):
              return
 
-        if(self.id_ex.branch_ctrl):
-            branch_eval = False
-            if(self.id_ex.op == 0x63 and self.id_ex.fct3 == 1):
-                 val_rs1 = self.register_values.get(self.id_ex.rs1, 0)
-                 val_rs2 = self.register_values.get(self.id_ex.rs2, 0)
-                 if(self.id_ex.rs1 == 5):
-                     val_rs1 = self.register_values.get(5,0)
-                 if(self.id_ex.rs2 == 5):
-                     val_rs2 = self.register_values.get(5,0)
-
-                 if(val_rs1 != val_rs2):
-                     branch_eval = True
-                     print(f"Cycle {self.cycle}: EX: BNE condition TRUE (rs1={val_rs1}, rs2={val_rs2})")
-                 else:
-                     print(f"Cycle {self.cycle}: EX: BNE condition FALSE (rs1={val_rs1}, rs2={val_rs2})")
-
-
-
-            if(branch_eval):
-                self.branch_target = self.id_ex.pc + self.id_ex.imm
-                self.flush_pipeline = True
+        core = self.core
+        if(reg.branch_ctrl and self.verbose):
+            val_rs1 = to_signed(core.regs[reg.rs1])
+            val_rs2 = to_signed(core.regs[reg.rs2])
+        next_pc = core.execute(reg.instr, reg.pc)
+        if(reg.reg_write):
+            reg.result = core.regs[reg.rd]
+        taken = next_pc != (reg.pc + 4) & MASK32
+        if(reg.branch_ctrl and self.verbose):
+            print(f"Cycle {self.cycle}: EX: {BRANCH_NAMES[reg.fct3]} condition {'TRUE' if taken else 'FALSE'} (rs1={val_rs1}, rs2={val_rs2})")
+
+        ## taken branches and jumps redirect fetch from EX
+        if(taken):
+            self.branch_target = next_pc
+            self.flush_pipeline = True
+            if(self.verbose):
                 print(f"Cycle {self.cycle}: EX: Branch Taken! Target PC=0x{self.branch_target:x}. Signaling flush.")
 
 
     def decode(self):
-        decoded_reg = self._decode_instruction(self.if_id.instr, self.if_id.pc)
-        self.id_ex = decoded_reg
+        instr = self.if_id.instr
+        if(instr == 0):
+            self.id_ex.clear()
+            return
+        fields = self.decode_cache.get(instr)
+        if(fields is None):
+            ## only words that weren't in the loaded image, e.g. written in by hand
+            fields = self.decode_cache[instr] = self._decode_fields(instr)
+        self.id_ex.load(instr, self.if_id.pc, fields)
 
 
     def fetch(self, do_flush: bool):
         next_pc = self.pc
         if(self.pc_write_enable):
             if(do_flush):
-                print(f"Cycle {self.cycle}: Fetch - Branch taken, PC -> 0x{self.branch_target:x}")
+                if(self.verbose):
+                    print(f"Cycle {self.cycle}: Fetch - Branch taken, PC -> 0x{self.branch_target:x}")
                 next_pc = self.branch_target
             else:
                 next_pc = self.pc + 4
@@ -216,107 +269,138 @@ class PipelineSimulator:
             instr_addr_index = current_pc_for_fetch >> 2
             if(0 <= instr_addr_index < len(self.instructions)):
                 fetched_instr = self.instructions[instr_addr_index]
-            else:
+            elif(self.verbose):
                 print(f"Cycle {self.cycle}: PC 0x{current_pc_for_fetch:x} out of instruction bounds. Fetching NOP.")
 
-        if(self.if_id_write_enable):
-            if(do_flush):
+        ## a flush disables the IF/ID write, so it has to squash the wrong-path instruction there itself
+        if(do_flush):
+            if(self.verbose):
                 print(f"Cycle {self.cycle}: Fetch - Flushing IF/ID <- NOP")
-                self.if_id = PipelineReg.nop()
-            else:
-                self.if_id.instr = fetched_instr
-                self.if_id.pc = current_pc_for_fetch
+            self.if_id.clear()
+        elif(self.if_id_write_enable):
+            self.if_id.instr = fetched_instr
+            self.if_id.pc = current_pc_for_fetch
 
         self.pc = next_pc
 
 
-    def run(self, output_file: str):
+    def run(self, output_file: str = None, sink=None, max_cycles: int = None):
+        """
+        Runs the program to completion.
+
+        Args:
+            output_file (str): Write the per-cycle CSV trace here, shorthand for sink=CsvTraceSink(output_file).
+            sink (TraceSink): Where the per-cycle trace goes (see trace_sinks). With neither, nothing is traced.
+            max_cycles (int): Cycle limit, 15 per instruction in the image by default. Looping programs need more.
+
+        Returns:
+            dict: get_stats() at the end of the run, None if there was nothing to run.
+        """
         if(not self.instructions):
             print("Error: No instructions loaded. Exiting simulation.")
-            return
+            return None
+
+        if(sink is None and output_file is not None):
+            sink = CsvTraceSink(output_file)
+        if(sink is not None):
+            sink.open()
+        try:
+            self._run_cycles(sink, max_cycles)
+        finally:
+            if(sink is not None):
+                sink.close()
+        return self.get_stats()
 
+    def _run_cycles(self, sink, max_cycles):
         total_instructions = len(self.instructions)
-        max_cycles = total_instructions * 15 if total_instructions > 0 else 100
+        if(max_cycles is None):
+            max_cycles = total_instructions * 15 if total_instructions > 0 else 100
+
+        while(self.cycle < max_cycles):
+            self.pc_write_enable = True
+            self.if_id_write_enable = True
+            self.id_ex_write_enable = True
+            do_flush = False
+
+            if(sink is not None):
+                logged = False
+                for stage_name, reg in (('IF', self.if_id), ('ID', self.id_ex), ('EX', self.ex_mem), ('MEM', self.mem_wb)):
+                    if(reg.instr != 0):
+                        sink.record(self.cycle, stage_name, reg)
+                        logged = True
+                if(not logged and self.register_write_count < total_instructions):
+                    self._idle_reg.pc = self.pc
+                    sink.record(self.cycle, '---', self._idle_reg)
 
-        with open(output_file, 'w', newline='') as f:
-            writer = csv.writer(f)
-            writer.writerow(['Cycle', 'PC', 'Instr', 'Stage', 'Op', 'Fct3', 'Rd', 'Rs1', 'Rs2', 'Imm',
-                             'RegWrite', 'ALUSrc', 'MemRd', 'MemWr', 'WBSel', 'Branch', 'FwdA', 'FwdB'])
+            self._check_load_use_hazard()
 
-            while(self.cycle < max_cycles):
+            if(self.flush_pipeline):
+                if(self.verbose):
+                    print(f"Cycle {self.cycle}: Flush detected! Handling flush.")
+                self.flush_count += 1
                 self.pc_write_enable = True
-                self.if_id_write_enable = True
-                self.id_ex_write_enable = True
-                do_flush = False
+                self.if_id_write_enable = False
+                self.id_ex_write_enable = False
+                do_flush = True
+                self.flush_pipeline = False
+                self.stall_pipeline = False
 
-                log_entries = []
-                stages = {'IF': self.if_id, 'ID': self.id_ex, 'EX': self.ex_mem, 'MEM': self.mem_wb}
-                for stage_name, reg in stages.items():
-                    if(reg.instr != 0):
-                        log_entries.append([
-                            self.cycle, f"0x{reg.pc:04x}", f"0x{reg.instr:08x}", stage_name,
-                            f"0x{reg.op:02x}", reg.fct3, reg.rd, reg.rs1, reg.rs2, reg.imm,
-                            reg.reg_write, reg.alu_src, reg.mem_rd, reg.mem_wr,
-                            reg.wb_sel, reg.branch_ctrl, reg.fwd_a, reg.fwd_b
-                        ])
-                if(not log_entries and self.retired_instr_count < total_instructions):
-                     log_entries.append([self.cycle, f"0x{self.pc:04x}", "0x00000000", "---",
-                                         "0x00", 0, 0, 0, 0, 0, False, False, False, False, 0, False, "", ""])
-                for entry in log_entries:
-                    writer.writerow(entry)
-
-                self._check_load_use_hazard()
-
-                if(self.flush_pipeline):
-                    print(f"Cycle {self.cycle}: Flush detected! Handling flush.")
-                    self.pc_write_enable = True
-                    self.if_id_write_enable = False
-                    self.id_ex_write_enable = False
-                    do_flush = True
-                    self.flush_pipeline = False
-                    self.stall_pipeline = False
-
-                if(self.stall_pipeline):
+            if(self.stall_pipeline):
+                if(self.verbose):
                     print(f"Cycle {self.cycle}: Stall detected! Handling stall.")
-                    self.pc_write_enable = False
-                    self.if_id_write_enable = False
-                    self.id_ex_write_enable = False
-
-                self.writeback()
-                self.memory()
-
-                if(self.id_ex_write_enable):
-                    self.execute()
-                else:
-                    self.ex_mem = PipelineReg.nop()
-
-                if(self.if_id_write_enable):
-                    self.decode()
-                    self._check_forwarding()
-                else:
-                    if(not self.stall_pipeline):
-                         self.id_ex = PipelineReg.nop()
-
-                if(self.pc_write_enable):
-                    self.fetch(do_flush)
-                else:
-                    print(f"Cycle {self.cycle}: Stall - PC/Fetch blocked.")
-    
-                self.stall_pipeline = False
+                self.stall_count += 1
+                self.pc_write_enable = False
+                self.if_id_write_enable = False
+                self.id_ex_write_enable = False
 
-                if(self.pc >= self.max_pc and \
-                   self.if_id.instr == 0 and self.id_ex.instr == 0 and \
-                   self.ex_mem.instr == 0 and self.mem_wb.instr == 0):
-                    print(f"Cycle {self.cycle+1}: Pipeline empty after PC reached end. Terminating.")
-                    break
+            self.writeback()
+            self.memory()
 
-                self.cycle += 1
+            if(self.id_ex_write_enable):
+                self.execute()
+            else:
+                self.ex_mem.clear()
 
-            if(self.cycle >= max_cycles):
-                print(f"Warning: Simulation reached max cycles ({max_cycles}). Terminating.")
+            if(self.if_id_write_enable):
+                self.decode()
+                self._check_forwarding()
             else:
-                print(f"Simulation finished in {self.cycle} cycles.")
-                print(f"Total instructions retired: {self.retired_instr_count}")
+                if(not self.stall_pipeline):
+                     self.id_ex.clear()
+
+            if(self.pc_write_enable):
+                self.fetch(do_flush)
+            elif(self.verbose):
+                print(f"Cycle {self.cycle}: Stall - PC/Fetch blocked.")
+
+            self.stall_pipeline = False
+
+            if(self.pc >= self.max_pc and \
+               self.if_id.instr == 0 and self.id_ex.instr == 0 and \
+               self.ex_mem.instr == 0 and self.mem_wb.instr == 0):
+                if(self.verbose):
+                    print(f"Cycle {self.cycle+1}: Pipeline empty after PC reached end. Terminating.")
+                break
+
+            self.cycle += 1
+
+        if(self.cycle >= max_cycles):
+            print(f"Warning: Simulation reached max cycles ({max_cycles}). Terminating.")
+        elif(self.verbose):
+            print(f"Simulation finished in {self.cycle} cycles.")
+            print(f"Total instructions retired: {self.completed_instr_count}")
+            print(f"Register writes: {self.register_write_count}")
+
+    def get_stats(self):
+        """Summary of the run so far: cycles, retired instructions, register writes, CPI, stall and flush counts."""
+        return {
+            'cycles': self.cycle,
+            'retired': self.completed_instr_count,
+            'register_writes': self.register_write_count,
+            'cpi': self.cycle / self.completed_instr_count if self.completed_instr_count else 0.0,
+            'stalls': self.stall_count,
+            'flushes': self.flush_count,
+        }
 
 def encode_instruction(op: int, rd: int, fct3: int, rs1: int, rs2: int, imm: int = 0) -> int:
     instr = (op & 0x7F) | ((rd & 0x1F) << 7) | ((fct3 & 0x7) << 12) | ((rs1 & 0x1F) << 15)
@@ -0,0 +1,133 @@
+import os
+import time
+import struct
+import argparse
+import tempfile
+
+from hazards_simulator import PipelineSimulator, encode_instruction
+from rv32i import RV32ICore, encode_rv32i
+
+## the body of branch_simulator's loop, without the bne
+LOOP_BODY = [
+    encode_instruction(op=0x03, rd=6, fct3=0x2, rs1=7, rs2=0, imm=0),    ## lw x6, 0(x7)
+    encode_instruction(op=0x13, rd=6, fct3=0x0, rs1=6, rs2=0, imm=1),    ## addi x6, x6, 1
+    encode_instruction(op=0x23, rd=0, fct3=0x2, rs1=7, rs2=6, imm=0),    ## sw x6, 0(x7)
+    encode_instruction(op=0x13, rd=7, fct3=0x0, rs1=7, rs2=0, imm=4),    ## addi x7, x7, 4
+    encode_instruction(op=0x13, rd=5, fct3=0x0, rs1=5, rs2=0, imm=-1),   ## addi x5, x5, -1
+]
+LOOP_BRANCH = encode_instruction(op=0x63, rd=0, fct3=0x1, rs1=5, rs2=0, imm=-20)   ## bne x5, x0, loop
+LOOP_SETUP = [
+    encode_instruction(op=0x03, rd=7, fct3=0x2, rs1=10, rs2=0, imm=0),   ## lw x7, 0(x10)
+    encode_instruction(op=0x13, rd=5, fct3=0x0, rs1=0, rs2=0, imm=3),    ## addi x5, x0, 3
+]
+## all eight words of branch_simulator's program
+BRANCH_PROGRAM = LOOP_SETUP + LOOP_BODY + [LOOP_BRANCH]
+
+## data the counted loop walks over
+COUNTED_LOOP_DATA = 0x10000
+
+def counted_loop_program(iterations):
+    """
+    branch_simulator's loop as a real counted loop: x5 = iterations, x7 = COUNTED_LOOP_DATA, then the
+    body incrementing one word per iteration and a bne back, run for real by the pipeline.
+    """
+    upper = (iterations + 0x800) >> 12
+    return [
+        encode_rv32i(op=0x37, rd=5, imm=upper),                                 ## lui x5, upper
+        encode_rv32i(op=0x13, rd=5, rs1=5, imm=iterations - (upper << 12)),     ## addi x5, x5, lower
+        encode_rv32i(op=0x37, rd=7, imm=COUNTED_LOOP_DATA >> 12),               ## lui x7, data
+        encode_rv32i(op=0x03, rd=6, fct3=0x2, rs1=7),                           ## lw x6, 0(x7)
+        encode_rv32i(op=0x13, rd=6, rs1=6, imm=1),                              ## addi x6, x6, 1
+        encode_rv32i(op=0x23, fct3=0x2, rs1=7, rs2=6),                          ## sw x6, 0(x7)
+        encode_rv32i(op=0x13, rd=7, rs1=7, imm=4),                              ## addi x7, x7, 4
+        encode_rv32i(op=0x13, rd=5, rs1=5, imm=-1),                             ## addi x5, x5, -1
+        encode_rv32i(op=0x63, fct3=0x1, rs1=5, rs2=0, imm=-20),                 ## bne x5, x0, loop
+    ]
+
+class UncachedPipelineSimulator(PipelineSimulator):
+    """decode() as it was before the decode cache, decoding the IF/ID word from scratch every cycle."""
+
+    def decode(self):
+        self.id_ex = self._decode_instruction(self.if_id.instr, self.if_id.pc)
+
+def write_program(path, instructions):
+    with open(path, 'wb') as f:
+        f.write(struct.pack(f'<{len(instructions)}I', *instructions))
+
+def unrolled_loop_program(iterations):
+    """branch_simulator's loop unrolled `iterations` times, the same few words decoded over and over."""
+    return LOOP_SETUP + LOOP_BODY * iterations
+
+def benchmark_decode(simulator_class, bin_file, iterations):
+    """Seconds for `iterations` decode() calls cycling through the eight words of the branch program."""
+    simulator = simulator_class(bin_file, verbose=False)
+    words = BRANCH_PROGRAM
+    start = time.perf_counter()
+    for i in range(iterations):
+        simulator.if_id.instr = words[i & 7]
+        simulator.decode()
+    return time.perf_counter() - start
+
+def benchmark_run(simulator_class, bin_file):
+    """(seconds, stats) for a full untraced run()."""
+    simulator = simulator_class(bin_file, verbose=False)
+    start = time.perf_counter()
+    stats = simulator.run()
+    return time.perf_counter() - start, stats
+
+def benchmark_counted_loop(bin_file, iterations):
+    """(seconds, stats) for the counted loop through the 5-stage model, checking its architectural results."""
+    simulator = PipelineSimulator(bin_file, verbose=False)
+    start = time.perf_counter()
+    stats = simulator.run(max_cycles=20 * iterations + 100)
+    elapsed = time.perf_counter() - start
+    core = simulator.core
+    assert core.regs[5] == 0 and core.regs[7] == COUNTED_LOOP_DATA + 4 * iterations, "counted loop didn't finish"
+    assert core.memory.load(COUNTED_LOOP_DATA + 4 * (iterations - 1), 4) == 1
+    return elapsed, stats
+
+def benchmark_functional(instructions, iterations):
+    """(seconds, instructions executed) for the same loop on RV32ICore alone, no timing model."""
+    core = RV32ICore()
+    core.load_program(instructions)
+    start = time.perf_counter()
+    core.run(end=4 * len(instructions))
+    return time.perf_counter() - start, core.instructions_executed
+
+def main():
+    parser = argparse.ArgumentParser(description="Decode and whole-pipeline throughput of the 5-stage simulator.")
+    parser.add_argument('--decodes', type=int, default=4_000_000, help="decode() calls in the decode benchmark")
+    parser.add_argument('--iterations', type=int, default=200_000, help="Loop iterations in the unrolled program")
+    parser.add_argument('--loop-iterations', type=int, default=1_000_000, help="Iterations of the counted loop")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        loop_file = os.path.join(directory, 'loop.bin')
+        write_program(loop_file, BRANCH_PROGRAM)
+        program_file = os.path.join(directory, 'unrolled.bin')
+        write_program(program_file, unrolled_loop_program(args.iterations))
+
+        print(f"decode() x {args.decodes:,} over the branch loop words")
+        uncached = benchmark_decode(UncachedPipelineSimulator, loop_file, args.decodes)
+        cached = benchmark_decode(PipelineSimulator, loop_file, args.decodes)
+        print(f"  uncached {uncached:.2f}s ({args.decodes / uncached / 1e6:.2f}M/s), "
+              f"cached {cached:.2f}s ({args.decodes / cached / 1e6:.2f}M/s), {uncached / cached:.1f}x")
+
+        print(f"run() on the loop unrolled {args.iterations:,} times")
+        for name, simulator_class in (('uncached', UncachedPipelineSimulator), ('cached', PipelineSimulator)):
+            elapsed, stats = benchmark_run(simulator_class, program_file)
+            print(f"  {name:<8} {elapsed:.2f}s, {stats['cycles']:,} cycles ({stats['cycles'] / elapsed / 1e3:.0f}k cycles/s), "
+                  f"CPI {stats['cpi']:.3f}")
+
+        counted = counted_loop_program(args.loop_iterations)
+        counted_file = os.path.join(directory, 'counted.bin')
+        write_program(counted_file, counted)
+        print(f"run() on the counted loop, {args.loop_iterations:,} iterations")
+        elapsed, stats = benchmark_counted_loop(counted_file, args.loop_iterations)
+        print(f"  pipeline   {elapsed:.2f}s, {stats['cycles']:,} cycles ({stats['cycles'] / elapsed / 1e3:.0f}k cycles/s), "
+              f"CPI {stats['cpi']:.3f}, {stats['flushes']:,} flushes")
+        elapsed, executed = benchmark_functional(counted, args.loop_iterations)
+        print(f"  functional {elapsed:.2f}s, {executed:,} instructions ({executed / elapsed / 1e3:.0f}k instructions/s)")
+
+if(__name__ == "__main__"):
+    main()
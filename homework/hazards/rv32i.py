@@ -0,0 +1,306 @@
+import struct
+
+MASK32 = 0xFFFFFFFF
+SIGN32 = 0x80000000
+
+PAGE_BITS = 12
+PAGE_SIZE = 1 << PAGE_BITS
+PAGE_MASK = PAGE_SIZE - 1
+
+def to_signed(value):
+    """A 32-bit register value (stored unsigned) as a signed int."""
+    return value - ((value & SIGN32) << 1)
+
+def _sign_extend(value, bits):
+    sign_bit = 1 << (bits - 1)
+    return (value & (sign_bit - 1)) - (value & sign_bit)
+
+class SparseMemory:
+    """
+    Byte-addressable little-endian 32-bit address space. Memory is kept in 4 KiB pages that are only
+    allocated when first written, bytes that were never written read as zero.
+    """
+
+    def __init__(self):
+        self.pages = {}
+
+    def load(self, address, size, signed=False):
+        """Reads a size-byte value, zero or sign extended to a 32-bit register value."""
+        address &= MASK32
+        offset = address & PAGE_MASK
+        if(offset + size <= PAGE_SIZE):
+            page = self.pages.get(address >> PAGE_BITS)
+            value = int.from_bytes(page[offset:offset + size], 'little') if page is not None else 0
+        else:
+            value = int.from_bytes(self.read_bytes(address, size), 'little')
+        if(signed and value >> (size * 8 - 1)):
+            value = (value - (1 << (size * 8))) & MASK32
+        return value
+
+    def store(self, address, size, value):
+        """Writes the low size bytes of value."""
+        address &= MASK32
+        offset = address & PAGE_MASK
+        data = (value & ((1 << (size * 8)) - 1)).to_bytes(size, 'little')
+        if(offset + size <= PAGE_SIZE):
+            page = self.pages.get(address >> PAGE_BITS)
+            if(page is None):
+                page = self.pages[address >> PAGE_BITS] = bytearray(PAGE_SIZE)
+            page[offset:offset + size] = data
+        else:
+            self.write_bytes(address, data)
+
+    def read_bytes(self, address, size):
+        data = bytearray(size)
+        for i in range(size):
+            byte_address = (address + i) & MASK32
+            page = self.pages.get(byte_address >> PAGE_BITS)
+            if(page is not None):
+                data[i] = page[byte_address & PAGE_MASK]
+        return bytes(data)
+
+    def write_bytes(self, address, data):
+        """Copies data in starting at address, a page at a time, e.g. to load a program or data image."""
+        position = 0
+        while(position < len(data)):
+            byte_address = (address + position) & MASK32
+            offset = byte_address & PAGE_MASK
+            count = min(PAGE_SIZE - offset, len(data) - position)
+            page = self.pages.get(byte_address >> PAGE_BITS)
+            if(page is None):
+                page = self.pages[byte_address >> PAGE_BITS] = bytearray(PAGE_SIZE)
+            page[offset:offset + count] = data[position:position + count]
+            position += count
+
+## ALU operations on unsigned 32-bit values, keyed by (fct3, fct7) for R-type and fct3 for I-type
+_ALU_REG = {
+    (0x0, 0x00): lambda a, b: (a + b) & MASK32,                          ## add
+    (0x0, 0x20): lambda a, b: (a - b) & MASK32,                          ## sub
+    (0x1, 0x00): lambda a, b: (a << (b & 31)) & MASK32,                  ## sll
+    (0x2, 0x00): lambda a, b: int(to_signed(a) < to_signed(b)),          ## slt
+    (0x3, 0x00): lambda a, b: int(a < b),                                ## sltu
+    (0x4, 0x00): lambda a, b: a ^ b,                                     ## xor
+    (0x5, 0x00): lambda a, b: a >> (b & 31),                             ## srl
+    (0x5, 0x20): lambda a, b: (to_signed(a) >> (b & 31)) & MASK32,       ## sra
+    (0x6, 0x00): lambda a, b: a | b,                                     ## or
+    (0x7, 0x00): lambda a, b: a & b,                                     ## and
+}
+_ALU_IMM = {
+    0x0: _ALU_REG[(0x0, 0x00)],                                          ## addi
+    0x2: _ALU_REG[(0x2, 0x00)],                                          ## slti
+    0x3: _ALU_REG[(0x3, 0x00)],                                          ## sltiu
+    0x4: _ALU_REG[(0x4, 0x00)],                                          ## xori
+    0x6: _ALU_REG[(0x6, 0x00)],                                          ## ori
+    0x7: _ALU_REG[(0x7, 0x00)],                                          ## andi
+}
+_SHIFT_IMM = {
+    (0x1, 0x00): _ALU_REG[(0x1, 0x00)],                                  ## slli
+    (0x5, 0x00): _ALU_REG[(0x5, 0x00)],                                  ## srli
+    (0x5, 0x20): _ALU_REG[(0x5, 0x20)],                                  ## srai
+}
+_BRANCH = {
+    0x0: lambda a, b: a == b,                                            ## beq
+    0x1: lambda a, b: a != b,                                            ## bne
+    0x4: lambda a, b: to_signed(a) < to_signed(b),                       ## blt
+    0x5: lambda a, b: to_signed(a) >= to_signed(b),                      ## bge
+    0x6: lambda a, b: a < b,                                             ## bltu
+    0x7: lambda a, b: a >= b,                                            ## bgeu
+}
+BRANCH_NAMES = {0x0: 'BEQ', 0x1: 'BNE', 0x4: 'BLT', 0x5: 'BGE', 0x6: 'BLTU', 0x7: 'BGEU'}
+## (size, signed) by fct3
+_LOADS = {0x0: (1, True), 0x1: (2, True), 0x2: (4, False), 0x4: (1, False), 0x5: (2, False)}
+_STORES = {0x0: 1, 0x1: 2, 0x2: 4}
+
+## the per-format execute functions, each takes (core, fn, rd, rs1, rs2, imm, pc) and returns the next pc
+def _exec_alu_reg(core, fn, rd, rs1, rs2, imm, pc):
+    regs = core.regs
+    if(rd):
+        regs[rd] = fn(regs[rs1], regs[rs2])
+    return (pc + 4) & MASK32
+
+def _exec_alu_imm(core, fn, rd, rs1, rs2, imm, pc):
+    ## imm is already the unsigned 32-bit operand (or the shift amount)
+    regs = core.regs
+    if(rd):
+        regs[rd] = fn(regs[rs1], imm)
+    return (pc + 4) & MASK32
+
+def _exec_load(core, fn, rd, rs1, rs2, imm, pc):
+    size, signed = fn
+    value = core.memory.load((core.regs[rs1] + imm) & MASK32, size, signed)
+    if(rd):
+        core.regs[rd] = value
+    return (pc + 4) & MASK32
+
+def _exec_store(core, fn, rd, rs1, rs2, imm, pc):
+    core.memory.store((core.regs[rs1] + imm) & MASK32, fn, core.regs[rs2])
+    return (pc + 4) & MASK32
+
+def _exec_branch(core, fn, rd, rs1, rs2, imm, pc):
+    regs = core.regs
+    if(fn(regs[rs1], regs[rs2])):
+        return (pc + imm) & MASK32
+    return (pc + 4) & MASK32
+
+def _exec_jal(core, fn, rd, rs1, rs2, imm, pc):
+    if(rd):
+        core.regs[rd] = (pc + 4) & MASK32
+    return (pc + imm) & MASK32
+
+def _exec_jalr(core, fn, rd, rs1, rs2, imm, pc):
+    ## target read before rd is written, rd may be rs1
+    target = (core.regs[rs1] + imm) & MASK32 & ~1
+    if(rd):
+        core.regs[rd] = (pc + 4) & MASK32
+    return target
+
+def _exec_lui(core, fn, rd, rs1, rs2, imm, pc):
+    if(rd):
+        core.regs[rd] = imm
+    return (pc + 4) & MASK32
+
+def _exec_auipc(core, fn, rd, rs1, rs2, imm, pc):
+    if(rd):
+        core.regs[rd] = (pc + imm) & MASK32
+    return (pc + 4) & MASK32
+
+def _exec_nop(core, fn, rd, rs1, rs2, imm, pc):
+    return (pc + 4) & MASK32
+
+def encode_rv32i(op, rd=0, fct3=0, rs1=0, rs2=0, imm=0, fct7=0):
+    """
+    Encodes any RV32I instruction. imm is the byte offset for branches and JAL, the upper 20 bits for
+    LUI/AUIPC, and for shifts the shift amount with 0x400 set for srai. Unlike hazards_simulator's
+    encode_instruction (kept as the homework used it) rs2 is encoded for stores and branches too.
+    """
+    instr = (op & 0x7F) | ((rd & 0x1F) << 7)
+    if(op in (0x37, 0x17)): ## U-type
+        return instr | ((imm & 0xFFFFF) << 12)
+    if(op == 0x6F): ## J-type
+        return (instr | ((imm >> 12) & 0xFF) << 12 | ((imm >> 11) & 0x1) << 20 |
+                ((imm >> 1) & 0x3FF) << 21 | ((imm >> 20) & 0x1) << 31)
+    instr |= ((fct3 & 0x7) << 12) | ((rs1 & 0x1F) << 15)
+    if(op == 0x33): ## R-type
+        return instr | ((rs2 & 0x1F) << 20) | ((fct7 & 0x7F) << 25)
+    if(op == 0x23): ## S-type
+        return instr & ~(0x1F << 7) | ((imm & 0x1F) << 7) | ((rs2 & 0x1F) << 20) | (((imm >> 5) & 0x7F) << 25)
+    if(op == 0x63): ## B-type
+        return (instr & ~(0x1F << 7) | ((imm >> 11) & 0x1) << 7 | ((imm >> 1) & 0xF) << 8 |
+                ((rs2 & 0x1F) << 20) | ((imm >> 5) & 0x3F) << 25 | ((imm >> 12) & 0x1) << 31)
+    return instr | ((imm & 0xFFF) << 20) ## I-type
+
+def decode_rv32i(instr):
+    """
+    Decodes an RV32I word into (execute function, operation, rd, rs1, rs2, imm) for RV32ICore.
+    FENCE, ECALL and EBREAK decode to no-ops. Raises ValueError for anything outside RV32I.
+    """
+    op = instr & 0x7F
+    rd = (instr >> 7) & 0x1F
+    fct3 = (instr >> 12) & 0x7
+    rs1 = (instr >> 15) & 0x1F
+    rs2 = (instr >> 20) & 0x1F
+    fct7 = instr >> 25
+    fn = None
+    imm = 0
+
+    if(op == 0x33): ## R-type
+        fn = _ALU_REG.get((fct3, fct7))
+        execute = _exec_alu_reg
+    elif(op == 0x13): ## I-type ALU
+        if(fct3 in (0x1, 0x5)):
+            fn = _SHIFT_IMM.get((fct3, fct7))
+            imm = rs2
+        else:
+            fn = _ALU_IMM[fct3]
+            imm = _sign_extend(instr >> 20, 12) & MASK32
+        execute = _exec_alu_imm
+    elif(op == 0x03): ## loads
+        fn = _LOADS.get(fct3)
+        imm = _sign_extend(instr >> 20, 12)
+        execute = _exec_load
+    elif(op == 0x23): ## stores
+        fn = _STORES.get(fct3)
+        imm = _sign_extend(((instr >> 25) << 5) | ((instr >> 7) & 0x1F), 12)
+        execute = _exec_store
+    elif(op == 0x63): ## branches
+        fn = _BRANCH.get(fct3)
+        imm = _sign_extend(((instr >> 31) << 12) | ((instr >> 7) & 0x1) << 11 |
+                           ((instr >> 25) & 0x3F) << 5 | ((instr >> 8) & 0xF) << 1, 13)
+        execute = _exec_branch
+    elif(op == 0x6F): ## jal
+        fn = 'jal'
+        imm = _sign_extend(((instr >> 31) << 20) | ((instr >> 12) & 0xFF) << 12 |
+                           ((instr >> 20) & 0x1) << 11 | ((instr >> 21) & 0x3FF) << 1, 21)
+        execute = _exec_jal
+    elif(op == 0x67 and fct3 == 0): ## jalr
+        fn = 'jalr'
+        imm = _sign_extend(instr >> 20, 12)
+        execute = _exec_jalr
+    elif(op == 0x37): ## lui
+        fn = 'lui'
+        imm = instr & 0xFFFFF000
+        execute = _exec_lui
+    elif(op == 0x17): ## auipc
+        fn = 'auipc'
+        imm = instr & 0xFFFFF000
+        execute = _exec_auipc
+    elif(op in (0x0F, 0x73)): ## fence, ecall, ebreak
+        fn = 'system'
+        execute = _exec_nop
+
+    if(fn is None):
+        raise ValueError(f"Unsupported RV32I instruction 0x{instr:08x}")
+    return (execute, fn, rd, rs1, rs2, imm)
+
+class RV32ICore:
+    """
+    Architectural state of an RV32I hart: 32 registers (unsigned 32-bit values, x0 always zero),
+    a SparseMemory and nothing else. execute() runs one instruction, decoded once per distinct word
+    into a dispatch entry, and returns the next pc, it knows nothing about timing, so the pipeline
+    model decides when each instruction executes.
+    """
+
+    def __init__(self, memory=None):
+        self.regs = [0] * 32
+        self.memory = memory if memory is not None else SparseMemory()
+        self.instructions_executed = 0
+        self._decoded = {}
+
+    def load_program(self, instructions, address=0):
+        """Writes instruction words into memory starting at address."""
+        self.memory.write_bytes(address, struct.pack(f'<{len(instructions)}I', *instructions))
+
+    def decode(self, instr, pc):
+        """instr's dispatch entry, decoded once per distinct word. Raises ValueError naming pc for words outside RV32I."""
+        entry = self._decoded.get(instr)
+        if(entry is None):
+            try:
+                entry = decode_rv32i(instr)
+            except ValueError as e:
+                raise ValueError(f"{e} at pc 0x{pc:04x}") from None
+            self._decoded[instr] = entry
+        return entry
+
+    def execute(self, instr, pc):
+        """Executes instr as if fetched from pc, returns the next pc."""
+        entry = self._decoded.get(instr)
+        if(entry is None):
+            entry = self.decode(instr, pc)
+        self.instructions_executed += 1
+        execute, fn, rd, rs1, rs2, imm = entry
+        return execute(self, fn, rd, rs1, rs2, imm, pc)
+
+    def run(self, pc=0, end=None, max_instructions=None):
+        """
+        Purely functional run from pc, fetching from memory, until pc reaches end (or leaves [0, end)),
+        or max_instructions have executed. The reference the pipeline's architectural results must match.
+
+        Returns:
+            int: The pc execution stopped at.
+        """
+        executed = 0
+        load = self.memory.load
+        while((end is None or 0 <= pc < end) and (max_instructions is None or executed < max_instructions)):
+            pc = self.execute(load(pc, 4), pc)
+            executed += 1
+        return pc
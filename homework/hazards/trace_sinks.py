@@ -0,0 +1,303 @@
+import os
+import csv
+import time
+import struct
+from collections import deque
+
+import numpy as np
+
+## columns of a pipeline trace, one row per occupied stage per cycle (same order as the CSV)
+TRACE_FIELDS = ['Cycle', 'PC', 'Instr', 'Stage', 'Op', 'Fct3', 'Rd', 'Rs1', 'Rs2', 'Imm',
+                'RegWrite', 'ALUSrc', 'MemRd', 'MemWr', 'WBSel', 'Branch', 'FwdA', 'FwdB']
+
+## '---' is the row logged for a cycle with every stage empty
+STAGES = ['IF', 'ID', 'EX', 'MEM', '---']
+FORWARD_SOURCES = ['', 'EX', 'MEM']
+_STAGE_CODES = {stage: code for code, stage in enumerate(STAGES)}
+_FORWARD_CODES = {source: code for code, source in enumerate(FORWARD_SOURCES)}
+
+## one fixed-width record per trace row for ColumnarTraceSink, field i holds column TRACE_FIELDS[i]
+## (Stage, FwdA and FwdB as indexes into STAGES / FORWARD_SOURCES)
+TRACE_DTYPE = np.dtype([('cycle', '<u8'), ('pc', '<u4'), ('instr', '<u4'), ('stage', 'u1'), ('op', 'u1'),
+                        ('fct3', 'u1'), ('rd', 'u1'), ('rs1', 'u1'), ('rs2', 'u1'), ('imm', '<i4'),
+                        ('reg_write', '?'), ('alu_src', '?'), ('mem_rd', '?'), ('mem_wr', '?'), ('wb_sel', 'u1'),
+                        ('branch_ctrl', '?'), ('fwd_a', 'u1'), ('fwd_b', 'u1')])
+
+def trace_row(cycle, stage, reg):
+    """The raw (unformatted) trace row for one pipeline register in one cycle."""
+    return (cycle, reg.pc, reg.instr, stage, reg.op, reg.fct3, reg.rd, reg.rs1, reg.rs2, reg.imm,
+            reg.reg_write, reg.alu_src, reg.mem_rd, reg.mem_wr, reg.wb_sel, reg.branch_ctrl, reg.fwd_a, reg.fwd_b)
+
+def format_row(row):
+    """A raw trace row as it appears in the CSV, addresses and encodings in hex."""
+    return [row[0], f"0x{row[1]:04x}", f"0x{row[2]:08x}", row[3], f"0x{row[4]:02x}"] + list(row[5:])
+
+class TraceSink:
+    """
+    Destination for PipelineSimulator's per-cycle trace. run() calls open() before the first cycle,
+    record(cycle, stage, reg) for every logged register and close() at the end. Registers are reused
+    between cycles, so a sink must copy what it needs out of reg before returning.
+    """
+
+    def open(self):
+        pass
+
+    def record(self, cycle, stage, reg):
+        self.write_row(trace_row(cycle, stage, reg))
+
+    def write_row(self, row):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+class CsvTraceSink(TraceSink):
+    """The original CSV trace, header plus one formatted row per record."""
+
+    def __init__(self, path):
+        self.path = path
+        self._file = None
+        self._writer = None
+
+    def open(self):
+        self._file = open(self.path, 'w', newline='')
+        self._writer = csv.writer(self._file)
+        self._writer.writerow(TRACE_FIELDS)
+
+    def write_row(self, row):
+        self._writer.writerow(format_row(row))
+
+    def close(self):
+        if(self._file is not None):
+            self._file.close()
+            self._file = None
+
+class BinaryTraceSink(TraceSink):
+    """
+    Fixed-size packed records (RECORD below, 32 bytes) behind a small header, buffered and written
+    flush_records at a time. Stages and forwarding sources are stored as indexes into STAGES and
+    FORWARD_SOURCES, the four control booleans as a bit field. read_binary_trace reads them back.
+    """
+    MAGIC = b'PTRC'
+    VERSION = 1
+    HEADER = struct.Struct('<4sI')
+    ## cycle, pc, instr, stage, op, fct3, rd, rs1, rs2, imm, flags, wb_sel, fwd_a, fwd_b, branch
+    RECORD = struct.Struct('<QIIBBBBBBiBBBBB3x')
+
+    def __init__(self, path, flush_records=1 << 14):
+        self.path = path
+        self.flush_records = flush_records
+        self._file = None
+        self._buffer = bytearray()
+        self._pending = 0
+
+    def open(self):
+        self._file = open(self.path, 'wb')
+        self._file.write(self.HEADER.pack(self.MAGIC, self.VERSION))
+
+    def write_row(self, row):
+        (cycle, pc, instr, stage, op, fct3, rd, rs1, rs2, imm,
+         reg_write, alu_src, mem_rd, mem_wr, wb_sel, branch_ctrl, fwd_a, fwd_b) = row
+        flags = reg_write | alu_src << 1 | mem_rd << 2 | mem_wr << 3
+        self._buffer += self.RECORD.pack(cycle, pc, instr, STAGES.index(stage), op, fct3, rd, rs1, rs2, imm, flags,
+                                         wb_sel, FORWARD_SOURCES.index(fwd_a), FORWARD_SOURCES.index(fwd_b), branch_ctrl)
+        self._pending += 1
+        if(self._pending >= self.flush_records):
+            self._flush()
+
+    def _flush(self):
+        self._file.write(self._buffer)
+        self._buffer.clear()
+        self._pending = 0
+
+    def close(self):
+        if(self._file is not None):
+            self._flush()
+            self._file.close()
+            self._file = None
+
+def read_binary_trace(path):
+    """Yields the raw trace rows of a BinaryTraceSink file, format_row turns them into CSV rows."""
+    record = BinaryTraceSink.RECORD
+    with open(path, 'rb') as f:
+        magic, version = BinaryTraceSink.HEADER.unpack(f.read(BinaryTraceSink.HEADER.size))
+        if(magic != BinaryTraceSink.MAGIC or version != BinaryTraceSink.VERSION):
+            raise ValueError(f"{path} is not a version {BinaryTraceSink.VERSION} binary pipeline trace.")
+        data = f.read()
+    if(len(data) % record.size != 0):
+        raise ValueError(f"Binary trace {path} ends with a partial record.")
+    for (cycle, pc, instr, stage, op, fct3, rd, rs1, rs2, imm, flags,
+         wb_sel, fwd_a, fwd_b, branch_ctrl) in record.iter_unpack(data):
+        yield (cycle, pc, instr, STAGES[stage], op, fct3, rd, rs1, rs2, imm,
+               bool(flags & 1), bool(flags & 2), bool(flags & 4), bool(flags & 8), wb_sel, bool(branch_ctrl),
+               FORWARD_SOURCES[fwd_a], FORWARD_SOURCES[fwd_b])
+
+class RingBufferTraceSink(TraceSink):
+    """Keeps only the last `capacity` raw rows in memory, e.g. to look at what led up to a problem in a long run."""
+
+    def __init__(self, capacity=4096):
+        if(capacity <= 0):
+            raise ValueError("Ring buffer capacity must be positive.")
+        self.rows = deque(maxlen=capacity)
+
+    def open(self):
+        self.rows.clear()
+
+    def write_row(self, row):
+        self.rows.append(row)
+
+class ColumnarTraceSink(TraceSink):
+    """
+    TRACE_DTYPE records behind a small header. Rows are collected as plain tuples and converted to a
+    NumPy record block block_rows at a time, so writing costs one bulk conversion and one write per
+    block instead of a formatted CSV line per row. load_columnar_trace maps the file back for vectorized
+    queries, trace_columns / write_trace_csv turn it into the CSV columns.
+    """
+    MAGIC = b'PTRN'
+    VERSION = 1
+    HEADER = struct.Struct('<4sII')
+
+    def __init__(self, path, block_rows=1 << 16):
+        if(block_rows <= 0):
+            raise ValueError("Block size must be positive.")
+        self.path = path
+        self.block_rows = block_rows
+        self.rows_written = 0
+        self._file = None
+        ## row values back to back, one flat list converts to an array much faster than a list of tuples
+        self._values = []
+        self._block_values = block_rows * len(TRACE_DTYPE.names)
+
+    def open(self):
+        self._file = open(self.path, 'wb')
+        self._file.write(self.HEADER.pack(self.MAGIC, self.VERSION, TRACE_DTYPE.itemsize))
+        self.rows_written = 0
+
+    def record(self, cycle, stage, reg):
+        ## skips trace_row/write_row, this is the per-row cost of the whole sink
+        self._values.extend((cycle, reg.pc, reg.instr, _STAGE_CODES[stage], reg.op, reg.fct3, reg.rd, reg.rs1, reg.rs2,
+                             reg.imm, reg.reg_write, reg.alu_src, reg.mem_rd, reg.mem_wr, reg.wb_sel, reg.branch_ctrl,
+                             _FORWARD_CODES[reg.fwd_a], _FORWARD_CODES[reg.fwd_b]))
+        if(len(self._values) >= self._block_values):
+            self._flush()
+
+    def write_row(self, row):
+        row = list(row)
+        row[3] = _STAGE_CODES[row[3]]
+        row[16] = _FORWARD_CODES[row[16]]
+        row[17] = _FORWARD_CODES[row[17]]
+        self._values.extend(row)
+        if(len(self._values) >= self._block_values):
+            self._flush()
+
+    def _flush(self):
+        if(not self._values):
+            return
+        names = TRACE_DTYPE.names
+        values = np.fromiter(self._values, dtype=np.int64, count=len(self._values)).reshape(-1, len(names))
+        block = np.empty(len(values), dtype=TRACE_DTYPE)
+        for column, name in enumerate(names):
+            block[name] = values[:, column]
+        block.tofile(self._file)
+        self.rows_written += len(block)
+        self._values.clear()
+
+    def close(self):
+        if(self._file is not None):
+            self._flush()
+            self._file.close()
+            self._file = None
+
+def load_columnar_trace(path, mmap=True):
+    """
+    The records of a ColumnarTraceSink file as a TRACE_DTYPE array, memory-mapped read-only by default
+    so multi-million-row traces can be queried without loading them.
+    e.g. stalls per stage: np.bincount(trace['stage'][trace['instr'] != 0], minlength=len(STAGES))
+    """
+    header = ColumnarTraceSink.HEADER
+    with open(path, 'rb') as f:
+        data = f.read(header.size)
+    if(len(data) < header.size):
+        raise ValueError(f"{path} is too short to be a columnar pipeline trace.")
+    magic, version, itemsize = header.unpack(data)
+    if(magic != ColumnarTraceSink.MAGIC or version != ColumnarTraceSink.VERSION or itemsize != TRACE_DTYPE.itemsize):
+        raise ValueError(f"{path} is not a version {ColumnarTraceSink.VERSION} columnar pipeline trace.")
+    size = os.path.getsize(path) - header.size
+    if(size % TRACE_DTYPE.itemsize != 0):
+        raise ValueError(f"Columnar trace {path} ends with a partial record.")
+    if(size == 0):
+        return np.zeros(0, dtype=TRACE_DTYPE)
+    if(mmap):
+        return np.memmap(path, dtype=TRACE_DTYPE, mode='r', offset=header.size)
+    return np.fromfile(path, dtype=TRACE_DTYPE, offset=header.size)
+
+def trace_columns(records):
+    """Columnar records as {TRACE_FIELDS name: array}, Stage/FwdA/FwdB decoded back to their strings."""
+    columns = {}
+    for field, name in zip(TRACE_FIELDS, TRACE_DTYPE.names):
+        column = records[name]
+        if(name == 'stage'):
+            column = np.array(STAGES)[column]
+        elif(name in ('fwd_a', 'fwd_b')):
+            column = np.array(FORWARD_SOURCES)[column]
+        columns[field] = column
+    return columns
+
+def write_trace_csv(records, csv_path, block_rows=1 << 16):
+    """Writes columnar records out as the original CSV trace, block_rows at a time."""
+    with open(csv_path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(TRACE_FIELDS)
+        for start in range(0, len(records), block_rows):
+            columns = trace_columns(records[start:start + block_rows])
+            ## back to Python ints/bools/strs so every value prints the way CsvTraceSink prints it
+            for row in zip(*(column.tolist() for column in columns.values())):
+                writer.writerow(format_row(row))
+
+def main():
+    ## imported here, hazards_simulator itself imports this module
+    import tempfile
+    from hazards_simulator import PipelineSimulator, encode_instruction
+
+    ## the hazards homework sequence repeated, straight-line so the run length scales with the program
+    body = [
+        encode_instruction(op=0x03, rd=7, fct3=0x2, rs1=10, rs2=0, imm=0),
+        encode_instruction(op=0x03, rd=6, fct3=0x2, rs1=7, rs2=0, imm=4),
+        encode_instruction(op=0x13, rd=8, fct3=0x0, rs1=6, rs2=0, imm=1),
+        encode_instruction(op=0x33, rd=9, fct3=0x0, rs1=8, rs2=7),
+        encode_instruction(op=0x23, rd=0, fct3=0x2, rs1=7, rs2=9, imm=8),
+    ]
+    repeats = 40_000
+    with tempfile.TemporaryDirectory() as directory:
+        bin_file = os.path.join(directory, 'program.bin')
+        with open(bin_file, 'wb') as f:
+            f.write(struct.pack(f'<{len(body) * repeats}I', *(body * repeats)))
+
+        sinks = {
+            'none': lambda: None,
+            'csv': lambda: CsvTraceSink(os.path.join(directory, 'trace.csv')),
+            'binary': lambda: BinaryTraceSink(os.path.join(directory, 'trace.trc')),
+            'columnar': lambda: ColumnarTraceSink(os.path.join(directory, 'trace.ptrn')),
+            'ring': lambda: RingBufferTraceSink(),
+        }
+        print(f"{len(body) * repeats:,} instructions")
+        print("{:<9} | {:>8} | {:>12} | {:>8}".format("Sink", "Time s", "Bytes", "Cycles"))
+        print("-" * 46)
+        for name, make_sink in sinks.items():
+            sink = make_sink()
+            simulator = PipelineSimulator(bin_file, verbose=False)
+            start = time.perf_counter()
+            stats = simulator.run(sink=sink)
+            elapsed = time.perf_counter() - start
+            size = os.path.getsize(sink.path) if hasattr(sink, 'path') else 0
+            print("{:<9} | {:>8.2f} | {:>12,} | {:>8,}".format(name, elapsed, size, stats['cycles']))
+
+        trace = load_columnar_trace(os.path.join(directory, 'trace.ptrn'))
+        start = time.perf_counter()
+        occupancy = np.bincount(trace['stage'], minlength=len(STAGES))
+        forwarded = int(np.count_nonzero((trace['fwd_a'] != 0) | (trace['fwd_b'] != 0)))
+        print(f"{len(trace):,} rows, per stage {dict(zip(STAGES, occupancy.tolist()))}, "
+              f"{forwarded:,} with forwarding, queried in {time.perf_counter() - start:.3f}s")
+
+if(__name__ == "__main__"):
+    main()